@@ -0,0 +1,554 @@
+#! /usr/bin/env python
+# BatchScan.py
+#
+# Batch mode for Tools2Param: converts a whole NMSSMTools scan (thousands of
+# spectrum/decay pairs) in one pool of worker processes instead of launching
+# a fresh interpreter per point.
+#
+# Requires: Tools2Param.py, SLHAblock.py, ScanColumns.py, ScanDedup.py,
+#           CardTemplate.py, ScanQuery.py (--index).
+#
+# Example use: python BatchScan.py 'scan/spectr*.dat' cards/ -j 8
+#              python BatchScan.py -m manifest.txt cards/
+#
+# Input pairs: with a glob, every spectrN.dat is paired with decayN.dat in
+# the same directory and written to param_cardN.dat in the output directory.
+# A manifest has one point per line: "spectrum decay [card name]"; blank
+# lines and lines starting with '#' are ignored. Points are labelled by
+# their spectrum (a/spectr1.dat -> 1); when two spectra in different
+# directories give the same label, the later ones get 1_2, 1_3, ...
+#
+# Each point is converted independently: if one point fails (e.g. a missing
+# STOPMIX block) it is reported in the summary at the end and the rest of
+# the batch carries on. No partial card is left behind for a failed point.
+#
+# With --vectorized (needs numpy) each worker takes a chunk of points and
+# does the A-to-T, mixing and EXTPAR transforms for the whole chunk with
+# ScanArrays.convert_batch; the cards are the same.
+#
+# With --validate (needs numpy) the spectra are checked before conversion,
+# a chunk of points at a time (see ScanValidate.py): required blocks and
+# entries, complete and orthogonal mixing matrices, finite and positive
+# masses. Points that fail get no card and are reported with the reasons.
+#
+# With --columns DIR the converted values of all points are also written to
+# a columnar store (one column per block entry), see ScanColumns.py; with
+# --index the query indexes of the store are brought up to date afterwards
+# (only the new points are sorted in), see ScanQuery.py.
+#
+# With --cache DIR cards are looked up by a hash of the input files and the
+# converter (see ConvertCache.py) and only new or changed points are
+# converted, so re-running or extending a scan is cheap.
+#
+# Inputs may be compressed (gzip, bzip2, xz, zstd; spectr1.dat.gz is paired
+# with decay1.dat.gz), and with --compress FORMAT the cards are written
+# compressed, e.g. param_card1.dat.gz; see CompressedIO.py.
+#
+# With --strict the sfermions are ordered by mass (strict SLHA2, see
+# Tools2Param.order_sfermions); with --vectorized a chunk of points is
+# sorted at once (ScanArrays.order_batch).
+#
+# With --dedup the cards are fingerprinted as they are written (see
+# ScanDedup.py): of cards with the same content only the first is kept, and
+# dedup_map.txt in the output directory maps every card to the one kept.
+#
+# With --stats FILE every point is timed per stage (read, parse, transform,
+# write, decays) and counted (lines, blocks, entries, decay lines), one JSON
+# record per line, and the batch total is printed; see ConvertStats.py.
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import glob
+import json
+import argparse
+import multiprocessing
+from functools import partial
+from Tools2Param import read_spectrum, convert_blocks, required_blocks, \
+    order_sfermions
+from ScanColumns import ColumnWriter, card_columns
+from CardTemplate import CardWriter
+from ConvertCache import ConversionCache
+from ConvertStats import Stats, stage_names
+from CompressedIO import open_input, open_output, formats, format_of_name, \
+    strip_extension
+from ScanDedup import file_fingerprint, group, write_mapping
+
+def point_label(spectname): # spectr12.dat (or spectr12.dat.gz) -> '12'
+    base = os.path.basename(strip_extension(spectname))
+    label = os.path.splitext(base)[0]
+    if label.startswith('spectr'):
+        label = label[len('spectr'):]
+    return label
+
+def jobs_from_glob(pattern, outdir): # pair spectrN.dat with decayN.dat
+    jobs = []
+    for spectname in sorted(glob.glob(pattern)):
+        directory, base = os.path.split(spectname)
+        decayname = os.path.join(directory, base.replace('spectr','decay',1))
+        label = point_label(spectname)
+        writename = os.path.join(outdir, 'param_card' + label + '.dat')
+        jobs.append((label, spectname, decayname, writename))
+    return jobs
+
+def unique_label(label, labels): # label, or label_2, label_3, ... if taken
+    if label not in labels:
+        return label
+    k = 2
+    while label + '_' + str(k) in labels:
+        k = k + 1
+    return label + '_' + str(k)
+
+def jobs_from_manifest(manifest, outdir): # one "spectrum decay [card]" per line
+    jobs = []
+    labels = set() # a label names the card, column store row, dedup entry
+    for line in open(manifest,'r'):
+        if line.split() == [] or line.lstrip().startswith('#'):
+            continue # skip this line
+        items = line.split()
+        spectname, decayname = items[0], items[1]
+        label = unique_label(point_label(spectname), labels)
+        if label != point_label(spectname):
+            print "WARNING: another point is labelled " \
+                + point_label(spectname) + ", " + spectname \
+                + " is labelled " + label
+        labels.add(label)
+        if len(items) > 2:
+            cardname = items[2]
+        else:
+            cardname = 'param_card' + label + '.dat'
+        jobs.append((label, spectname, decayname,
+            os.path.join(outdir, cardname)))
+    return jobs
+
+# -------------------------------------------------------------------------- #
+
+# A point's result is (label, ok, message, columns, stats, fingerprint):
+# columns is the list of values for ScanColumns (or None), stats the
+# ConvertStats record of the point (or None), fingerprint the ScanDedup
+# fingerprint of its card (or None).
+
+def failure(label, error): # result of a failed point
+    return (label, False, error.__class__.__name__ + ': ' + str(error),
+        None, None, None)
+
+def load_point(job, stats=None): # block dictionary of one point
+    # checked for the blocks convert_blocks needs
+    spectfile = open_input(job[1])
+    try:
+        block_dictionary = read_spectrum(spectfile, stats)
+    finally:
+        spectfile.close()
+    for item in required_blocks + ['EXTPAR']:
+        if not (item in block_dictionary):
+            raise KeyError(item)
+    return block_dictionary
+
+card_writer = CardWriter() # write_card from compiled templates, per process
+
+def write_point(job, block_dictionary, options={}, columns=False,
+        stats=None, dedup=False, relabel=None):
+    # write one card, returns the result of the point; relabel: see
+    # Tools2Param.order_sfermions
+    label, spectname, decayname, writename = job
+    tmpname = writename + '.tmp' # only rename into place when complete
+    try:
+        decayfile = open_input(decayname)
+        writefile = open_output(tmpname, format_of_name(writename))
+        try:
+            card_writer.write(block_dictionary, decayfile, writefile,
+                stats=stats, relabel=relabel, **options)
+        finally:
+            decayfile.close()
+            writefile.close()
+        fingerprint = None
+        if dedup: # the card is still in the page cache
+            fingerprint = file_fingerprint(tmpname)
+        os.rename(tmpname, writename)
+    except Exception, error: # isolate the failure to this point
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        return failure(label, error)
+    column_values = None
+    if columns: # values for the columnar store, see ScanColumns.py
+        column_values = card_columns(block_dictionary)
+    record = None
+    if stats is not None:
+        record = stats.record(point=label)
+    return (label, True, '', column_values, record, fingerprint)
+
+def fetch_point(job, cache, options={}, columns=False, dedup=False,
+        strict=False):
+    # look up one point in a ConversionCache; returns (key, result or None)
+    key_options = options
+    compression = format_of_name(job[3])
+    if compression is not None: # a compressed card is a different card
+        key_options = dict(key_options, compression=compression)
+    if strict: # and so is a strictly ordered one
+        key_options = dict(key_options, strict=True)
+    key = cache.key(job[1], job[2], key_options)
+    if not cache.fetch(key, job[3]):
+        return key, None
+    column_values = None
+    if columns: # exact values, not the rounded ones in the card
+        block_dictionary = load_point(job)
+        convert_blocks(block_dictionary, verbose=False)
+        if strict:
+            order_sfermions(block_dictionary)
+        column_values = card_columns(block_dictionary)
+    fingerprint = None
+    if dedup:
+        fingerprint = file_fingerprint(job[3])
+    return key, (job[0], True, 'cached', column_values, None, fingerprint)
+
+def store_point(job, key, cache, result): # keep a new card in the cache
+    if result[1]:
+        try:
+            cache.store(key, job[3])
+        except (IOError, OSError), error: # the card itself is fine
+            print "WARNING: could not cache point " + job[0] + ": " \
+                + str(error)
+    return result
+
+def convert_point(job, options={}, columns=False, cache=None,
+        instrument=False, dedup=False, strict=False): # run in a worker
+    # options: keyword arguments for write_card; returns a write_point result
+    stats = None
+    if instrument:
+        stats = Stats()
+    try:
+        if cache is not None:
+            key, result = fetch_point(job, cache, options, columns, dedup,
+                strict)
+            if result is not None:
+                return result
+        block_dictionary = load_point(job, stats)
+        if stats is not None:
+            stats.start('transform')
+        convert_blocks(block_dictionary, verbose=False)
+        relabel = None
+        if strict:
+            relabel = order_sfermions(block_dictionary)
+        if stats is not None:
+            stats.stop()
+    except Exception, error: # isolate the failure to this point
+        return failure(job[0], error)
+    result = write_point(job, block_dictionary, options, columns, stats,
+        dedup, relabel)
+    if cache is not None:
+        store_point(job, key, cache, result)
+    return result
+
+def convert_chunk(chunk, options={}, columns=False, cache=None,
+        instrument=False, vectorized=True, validate=None, dedup=False,
+        strict=False):
+    # run in a worker: chunk is a list of jobs; returns list of results.
+    # vectorized: transform the whole chunk at once with numpy. With
+    # instrument, each point is charged an equal share of the chunk's
+    # transform time. validate: tolerance for ScanValidate, None for no
+    # validation. dedup: fingerprint the cards. strict: order the sfermions
+    # by mass
+    results = []
+    points = []
+    for job in chunk:
+        stats = None
+        if instrument:
+            stats = Stats()
+        try:
+            key = None
+            if cache is not None:
+                key, result = fetch_point(job, cache, options, columns,
+                    dedup, strict)
+                if result is not None:
+                    results.append(result)
+                    continue
+            points.append((job, load_point(job, stats), key, stats))
+        except Exception, error: # isolate the failure to this point
+            results.append(failure(job[0], error))
+    if validate is not None and points: # numpy only needed for this
+        from ScanValidate import validate as validate_points, verdict_message
+        valid_points = []
+        for point, verdict in zip(points,
+                validate_points([point[1] for point in points], validate)):
+            if verdict['ok']:
+                valid_points.append(point)
+            else:
+                results.append(failure(point[0][0],
+                    ValueError('invalid point: ' + verdict_message(verdict))))
+        points = valid_points
+    if not points:
+        return results
+    chunk_stats = Stats()
+    chunk_stats.start('transform')
+    relabels = [None]*len(points)
+    if vectorized:
+        from ScanArrays import convert_batch, order_batch # numpy only here
+        ok = convert_batch([point[1] for point in points]).tolist()
+        if strict:
+            converted = [n for n in range(len(points)) if ok[n]]
+            ordered = order_batch([points[n][1] for n in converted])
+            for n, relabel in zip(converted, ordered):
+                relabels[n] = relabel
+                if relabel is None: # a sfermion without a MASS entry
+                    ok[n] = False
+    else:
+        ok = []
+        for n in range(len(points)):
+            try:
+                convert_blocks(points[n][1], verbose=False)
+                if strict:
+                    relabels[n] = order_sfermions(points[n][1])
+                ok.append(True)
+            except KeyError:
+                ok.append(False)
+    chunk_stats.stop()
+    for n in range(len(points)):
+        job, block_dictionary, key, stats = points[n]
+        if stats is not None:
+            stats.wall['transform'] = chunk_stats.wall['transform']/len(points)
+            stats.cpu['transform'] = chunk_stats.cpu['transform']/len(points)
+        if ok[n]:
+            result = write_point(job, block_dictionary, options, columns,
+                stats, dedup, relabels[n])
+            if cache is not None:
+                store_point(job, key, cache, result)
+            results.append(result)
+        else:
+            results.append(failure(job[0], ValueError('incomplete STOPMIX, '
+                'SBOTMIX or STAUMIX' + (' or sfermion MASS' if strict
+                    else ''))))
+    return results
+
+def run_batch(jobs, processes=None, chunksize=None, verbose=True,
+        options={}, vectorized=False, columns=None, cache=None, stats=None,
+        stats_out=None, validate=None, fingerprints=None, strict=False):
+    # convert all jobs in a process pool, returns list of failed results
+    # columns: optional ScanColumns.ColumnWriter for the converted values
+    # cache: optional ConvertCache.ConversionCache; hits and misses are
+    #   counted in it here, the workers only report 'cached' results
+    # stats: optional ConvertStats.Stats, instruments the workers and adds
+    #   up their records; stats_out: file for one JSON record per point
+    # validate: check the points first with this tolerance, see ScanValidate
+    # fingerprints: optional dictionary, filled with label -> ScanDedup
+    #   fingerprint of the card of every converted point
+    # strict: order the sfermions by mass (strict SLHA2)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunksize is None: # a few chunks per worker keeps the pool busy
+        chunksize = max(1, len(jobs) // (4*processes))
+    chunked = vectorized or (validate is not None)
+    if chunked: # hand out whole chunks, one result list per chunk
+        tasks = [jobs[k:k+chunksize] for k in range(0, len(jobs), chunksize)]
+        worker = partial(convert_chunk, options=options,
+            columns=(columns is not None), cache=cache,
+            instrument=(stats is not None), vectorized=vectorized,
+            validate=validate, dedup=(fingerprints is not None),
+            strict=strict)
+        task_chunksize = 1
+    else:
+        tasks = jobs
+        worker = partial(convert_point, options=options,
+            columns=(columns is not None), cache=cache,
+            instrument=(stats is not None), dedup=(fingerprints is not None),
+            strict=strict)
+        task_chunksize = chunksize
+    failed = []
+    done = 0
+    pool = multiprocessing.Pool(processes)
+    try:
+        for results in pool.imap_unordered(worker, tasks, task_chunksize):
+            if not chunked:
+                results = [results]
+            for result in results:
+                done = done + 1
+                if not result[1]:
+                    failed.append(result)
+                else:
+                    if columns is not None:
+                        columns.add_columns(result[0], result[3])
+                    if fingerprints is not None:
+                        fingerprints[result[0]] = result[5]
+                if (stats is not None) and (result[4] is not None):
+                    stats.add(result[4])
+                    if stats_out is not None:
+                        stats_out.write(json.dumps(result[4]) + '\n')
+                if cache is not None: # a failed point was a miss too
+                    if result[1] and (result[2] == 'cached'):
+                        cache.hits = cache.hits + 1
+                    else:
+                        cache.misses = cache.misses + 1
+                    if done % 1000 == 0:
+                        cache.evict()
+                if verbose and (done % 1000 == 0):
+                    print str(done) + " / " + str(len(jobs)) \
+                        + " points converted"
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if cache is not None:
+        cache.evict()
+    return failed
+
+def print_summary(jobs, failed):
+    print str(len(jobs) - len(failed)) + " / " + str(len(jobs)) \
+        + " points converted"
+    if failed:
+        print str(len(failed)) + " points FAILED:"
+        for result in sorted(failed):
+            print "  point " + result[0] + ": " + result[2]
+
+def remove_duplicates(jobs, fingerprints, outdir):
+    # keep one card per class of equal fingerprints, write dedup_map.txt;
+    # returns the number of cards removed
+    cardnames = dict([(job[0], job[3]) for job in jobs])
+    classes = group([(os.path.basename(cardnames[label]), fingerprint)
+        for label, fingerprint in fingerprints.items()])
+    removed = 0
+    for fingerprint, names in classes:
+        for name in names[1:]:
+            os.remove(os.path.join(outdir, name))
+            removed = removed + 1
+    write_mapping(os.path.join(outdir, 'dedup_map.txt'), classes)
+    return removed
+
+def print_stats(stats): # time per stage and counters of the batch
+    print "stage        wall s      cpu s   ms/point"
+    for stage in stage_names:
+        if stage in stats.wall:
+            print "%-10s %8.3f %10.3f %10.3f" % (stage, stats.wall[stage],
+                stats.cpu[stage], 1e3*stats.wall[stage]/max(stats.points,1))
+    for name in sorted(stats.counters):
+        print "%-28s %12d" % (name, stats.counters[name])
+
+# -------------------------------------------------------------------------- #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert many NMSSMTools spectrum/decay pairs.')
+    parser.add_argument('spectra', nargs='?',
+        help="glob of spectrum files, e.g. 'scan/spectr*.dat'")
+    parser.add_argument('outdir', help='directory for the param cards')
+    parser.add_argument('-m', '--manifest',
+        help='file listing "spectrum decay [card]" per line')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--chunksize', type=int, default=None,
+        help='points handed to a worker at a time')
+    parser.add_argument('--br-min', type=float, default=None,
+        help='drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays', default=None,
+        help='comma separated PDG ids: only write these DECAY tables')
+    parser.add_argument('--compress', choices=sorted(formats),
+        default=None, help='write compressed cards in this format')
+    parser.add_argument('--strict', action='store_true',
+        help='strict SLHA2: order the sfermion mass eigenstates by mass')
+    parser.add_argument('--vectorized', action='store_true',
+        help='transform a chunk of points at once with numpy')
+    parser.add_argument('--validate', nargs='?', type=float, default=None,
+        const=1e-4, metavar='TOLERANCE',
+        help='check the spectra first and skip bad points; TOLERANCE for '
+            'the orthogonality of the mixing matrices (default 1e-4)')
+    parser.add_argument('--dedup', action='store_true',
+        help='keep only one card of each set of identical cards, see '
+            'dedup_map.txt')
+    parser.add_argument('--columns', default=None,
+        help='also write the converted values to this columnar store')
+    parser.add_argument('--index', action='store_true',
+        help='update the query indexes of the --columns store')
+    parser.add_argument('--cache', default=None,
+        help='directory of a conversion cache (reused between runs)')
+    parser.add_argument('--cache-size', type=float, default=None,
+        help='size cap of the cache in MB (least recently used go first)')
+    parser.add_argument('--stats', default=None,
+        help='write per point timing/counters as JSON lines to this file, '
+            'the batch total goes on the last line')
+    parser.add_argument('--failed',
+        help='write a manifest of the failed points to this file')
+    args = parser.parse_args(argv)
+
+    if (args.spectra is None) == (args.manifest is None):
+        parser.error("give either a spectrum glob or --manifest")
+    if args.index and not args.columns:
+        parser.error("--index needs --columns")
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    if args.manifest:
+        jobs = jobs_from_manifest(args.manifest, args.outdir)
+    else:
+        jobs = jobs_from_glob(args.spectra, args.outdir)
+    if not jobs:
+        print "ERROR: no input points found"
+        return 1
+    if args.compress is not None:
+        jobs = [(label, spectname, decayname,
+            writename + formats[args.compress][0])
+            for label, spectname, decayname, writename in jobs]
+
+    options = dict()
+    if args.br_min is not None:
+        options['br_min'] = args.br_min
+    if args.decays is not None:
+        options['decay_parents'] = set(
+            [int(item) for item in args.decays.split(',')])
+
+    columns = None
+    if args.columns:
+        columns = ColumnWriter(args.columns)
+    stats = None
+    stats_out = None
+    if args.stats:
+        stats = Stats()
+        stats_out = open(args.stats,'w')
+    cache = None
+    if args.cache:
+        max_bytes = None
+        if args.cache_size is not None:
+            max_bytes = int(args.cache_size * (1 << 20))
+        cache = ConversionCache(args.cache, max_bytes)
+    fingerprints = None
+    if args.dedup:
+        fingerprints = dict()
+    failed = run_batch(jobs, args.jobs, args.chunksize, options=options,
+        vectorized=args.vectorized, columns=columns, cache=cache,
+        stats=stats, stats_out=stats_out, validate=args.validate,
+        fingerprints=fingerprints, strict=args.strict)
+    if columns is not None:
+        columns.close()
+        if args.index:
+            from ScanQuery import ScanIndex
+            ScanIndex(args.columns).update()
+    if stats is not None:
+        stats_out.write(json.dumps(stats.record(point='total')) + '\n')
+        stats_out.close()
+    print_summary(jobs, failed)
+    if stats is not None:
+        print_stats(stats)
+    if fingerprints is not None:
+        removed = remove_duplicates(jobs, fingerprints, args.outdir)
+        print str(len(fingerprints) - removed) + " different cards, " \
+            + str(removed) + " duplicates removed (see dedup_map.txt)"
+    if cache is not None:
+        print "cache: " + str(cache.hits) + " hits, " + str(cache.misses) \
+            + " misses, " + str(cache.evicted) + " cards evicted"
+
+    if args.failed: # card names as they were before --compress
+        failed_labels = set([result[0] for result in failed])
+        failfile = open(args.failed,'w')
+        for label, spectname, decayname, writename in jobs:
+            if args.compress is not None:
+                writename = writename[:-len(formats[args.compress][0])]
+            if label in failed_labels:
+                failfile.write(spectname + ' ' + decayname + ' '
+                    + os.path.basename(writename) + '\n')
+        failfile.close()
+
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
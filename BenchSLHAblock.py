@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# BenchSLHAblock.py
+#
+# Microbenchmark for the storage inside SLHAblock: times add_data (upsert),
+# exists+get (the pattern used by the transforms in Tools2Param.py) and
+# write, and estimates the memory held per block. For comparison it runs
+# the same operations on ListBlock, a copy of the old storage where every
+# line was a python list [i, j, value, comment] found by a linear scan.
+# The index makes lookups fast but costs memory: the 'bytes' column shows
+# the indexed block about 1.5 times the size of the list storage.
+#
+# Requires: SLHAblock.py.
+#
+# Example use: python BenchSLHAblock.py
+#              python BenchSLHAblock.py --repeat 20 --sizes 6 5 40
+
+# -------------------------------------------------------------------------- #
+
+import sys
+import timeit
+import argparse
+from StringIO import StringIO
+from SLHAblock import SLHAblock
+
+class ListBlock: # the pre-index storage, kept here only as a reference
+    def __init__(self): # 2-index blocks only, like the mixing matrices
+        self.data = []
+    def add_data(self, i, j, value):
+        for datum in self.data:
+            if (datum[0] == i) & (datum[1] == j):
+                datum[2] = value
+                return
+        self.data.append([i, j, value, ''])
+    def exists(self, i, j):
+        found_value = False
+        for datum in self.data:
+            if (datum[0] == i) & (datum[1] == j):
+                found_value = True
+        return found_value
+    def get(self, i, j):
+        for datum in self.data:
+            if (datum[0] == i) & (datum[1] == j):
+                return datum[2]
+
+def fill(block, size): # size x size matrix block
+    for i in range(1, size+1):
+        for j in range(1, size+1):
+            block.add_data(i, j, 0.1*i - 0.01*j)
+    return block
+
+def lookup_all(block, size): # exists then get, as in Tools2Param.py
+    total = 0.
+    for i in range(1, size+1):
+        for j in range(1, size+1):
+            if block.exists(i, j):
+                total = total + block.get(i, j)
+    return total
+
+def sizeof_block(block): # bytes held by the block's data (approximate)
+    total = sys.getsizeof(block.data)
+    for datum in block.data:
+        total = total + sys.getsizeof(datum)
+        if isinstance(datum, list):
+            for item in datum:
+                total = total + sys.getsizeof(item)
+        else:
+            total = total + sys.getsizeof(datum.index) \
+                + sys.getsizeof(datum.value) + sys.getsizeof(datum.comment)
+    if hasattr(block, 'index'):
+        total = total + sys.getsizeof(block.index)
+    return total
+
+def best_time(function, repeat): # seconds per call, best of repeat
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+def bench(size, repeat):
+    new_block = lambda: SLHAblock("BLOCK BENCH\n")
+    results = []
+    for label, make in [('list scan', ListBlock), ('indexed', new_block)]:
+        block = fill(make(), size)
+        fill_time = best_time(lambda: fill(make(), size), repeat)
+        get_time = best_time(lambda: lookup_all(block, size), repeat)
+        results.append((label, fill_time, get_time, sizeof_block(block)))
+    block = fill(new_block(), size)
+    write_time = best_time(lambda: block.write(StringIO()), repeat)
+    return results, write_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SLHAblock microbenchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 6, 20, 40],
+        help='matrix dimensions to test (5 = NMNMIX, 6 = USQMIX)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print "%6s %-10s %12s %12s %10s" % ('size', 'storage',
+        'fill [us]', 'lookup [us]', 'bytes')
+    for size in args.sizes:
+        results, write_time = bench(size, args.repeat)
+        for label, fill_time, get_time, nbytes in results:
+            print "%6s %-10s %12.1f %12.1f %10d" % (str(size)+'x'+str(size),
+                label, 1e6*fill_time, 1e6*get_time, nbytes)
+        print "%6s %-10s write %.1f us" % ('', 'indexed', 1e6*write_time)
+
+if __name__ == '__main__':
+    main()
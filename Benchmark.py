@@ -0,0 +1,345 @@
+#! /usr/bin/env python
+# Benchmark.py
+#
+# Benchmark suite for Tools2Param on synthetic NMSSMTools output (written by
+# SynthSLHA.py into a temporary directory). Each stage of the conversion is
+# timed on its own:
+#   parse      read the spectrum files into SLHAblocks (load_blocks)
+#   transform  A to T, sfermion mixing, EXTPAR etc. (convert_blocks)
+#   write      format and write the param card blocks (SLHAblock.write)
+#   write_template   the same rendered from a compiled CardTemplate
+#   decays     copy the decay tables into the card (copy_decays)
+#   getdecays  extract the DECAY lines (GetDecays.get_decays)
+#   decays_lines, getdecays_lines   the same done line by line in python,
+#              as before the bulk copy and the mmap search, for comparison
+#              (use --channels 200 or so for big decay files)
+#   convert    the whole thing, file to file (tools2param)
+#   convert_gz, convert_bz2   the same with gzip/bzip2 compressed input
+#              files and cards (see CompressedIO.py)
+# and reported as points per second, wall and CPU time per point, and the
+# peak memory (max RSS) of the process that ran the stage; every stage runs
+# in a fresh process so the peaks don't mix.
+#
+# Results can be saved as a baseline and later compared against it; a
+# stage that got slower than the tolerance is flagged as a regression (and
+# the exit status is 1). With --disk the bytes on disk per point (spectrum,
+# decays and card) are listed for plain text and every compression format.
+#
+# Requires: SynthSLHA.py, Tools2Param.py, GetDecays.py, CompressedIO.py,
+#           CardTemplate.py.
+#
+# Example use: python Benchmark.py --points 200
+#              python Benchmark.py --save baseline.json
+#              python Benchmark.py --compare baseline.json --tolerance 0.1
+
+# -------------------------------------------------------------------------- #
+
+import os
+import gc
+import sys
+import time
+import json
+import shutil
+import resource
+import tempfile
+import argparse
+import multiprocessing
+from functools import partial
+import SynthSLHA
+import Tools2Param
+import GetDecays
+import CompressedIO
+import CardTemplate
+
+def null_output(): # stand-in for the param card, keeps the write calls
+    return open(os.devnull,'w')
+
+# Every stage is (name, prepare, run): prepare(names) builds the input of
+# the stage outside the timing, run(state) is timed and returns the number
+# of points it handled. names is a list of (spectrum, decay) file names.
+
+def prepare_names(names):
+    return names
+
+def prepare_lines(names): # spectrum files already in memory
+    return [open(spectname,'r').readlines() for spectname, decayname in names]
+
+def prepare_dictionaries(names): # parsed, not yet converted
+    dictionaries = []
+    for lines in prepare_lines(names):
+        dictionaries.append(Tools2Param.make_block_dictionary(
+            Tools2Param.load_blocks(lines, Tools2Param.wanted_blocks)))
+    return dictionaries
+
+def prepare_converted(names): # converted, ready to write
+    dictionaries = prepare_dictionaries(names)
+    for block_dictionary in dictionaries:
+        Tools2Param.convert_blocks(block_dictionary, verbose=False)
+    return dictionaries
+
+def compress_file(filename, compression): # copy, returns the new name
+    compressedname = filename + CompressedIO.formats[compression][0]
+    writefile = CompressedIO.open_output(compressedname)
+    shutil.copyfileobj(open(filename,'rb'), writefile)
+    writefile.close()
+    return compressedname
+
+def prepare_compressed(names, compression='gz'): # compressed input files
+    return [(compress_file(spectname, compression),
+        compress_file(decayname, compression))
+        for spectname, decayname in names], compression
+
+def run_parse(all_lines):
+    for lines in all_lines:
+        Tools2Param.make_block_dictionary(
+            Tools2Param.load_blocks(lines, Tools2Param.wanted_blocks))
+    return len(all_lines)
+
+def run_transform(dictionaries):
+    for block_dictionary in dictionaries:
+        Tools2Param.convert_blocks(block_dictionary, verbose=False)
+    return len(dictionaries)
+
+def run_write(dictionaries):
+    writefile = null_output()
+    for block_dictionary in dictionaries:
+        for item in Tools2Param.write_blocks:
+            block_dictionary[item].write(writefile)
+            writefile.write('\n')
+    writefile.close()
+    return len(dictionaries)
+
+def run_write_template(dictionaries):
+    writefile = null_output()
+    writer = CardTemplate.CardWriter()
+    for block_dictionary in dictionaries:
+        writefile.write(writer.render(block_dictionary))
+    writefile.close()
+    return len(dictionaries)
+
+def run_decays(names):
+    writefile = null_output()
+    for spectname, decayname in names:
+        decayfile = open(decayname,'r')
+        Tools2Param.copy_decays(decayfile, writefile)
+        decayfile.close()
+    writefile.close()
+    return len(names)
+
+def copy_decays_lines(decayfile, writefile): # reference: line by line
+    for line in decayfile:
+        writefile.write(line)
+
+def get_decays_lines(decayfile, writefile): # reference: line by line
+    for line in decayfile:
+        if line.upper().startswith('DECAY'):
+            writefile.write(line)
+
+def run_decays_lines(names):
+    writefile = null_output()
+    for spectname, decayname in names:
+        decayfile = open(decayname,'r')
+        copy_decays_lines(decayfile, writefile)
+        decayfile.close()
+    writefile.close()
+    return len(names)
+
+def run_getdecays_lines(names):
+    writefile = null_output()
+    for spectname, decayname in names:
+        decayfile = open(decayname,'r')
+        get_decays_lines(decayfile, writefile)
+        decayfile.close()
+    writefile.close()
+    return len(names)
+
+def run_getdecays(names):
+    writefile = null_output()
+    for spectname, decayname in names:
+        decayfile = open(decayname,'r')
+        GetDecays.get_decays(decayfile, writefile)
+        decayfile.close()
+    writefile.close()
+    return len(names)
+
+def run_convert(names):
+    cardname = os.path.join(os.path.dirname(names[0][0]), 'param_card.dat')
+    for spectname, decayname in names:
+        Tools2Param.tools2param(spectname, decayname, cardname, verbose=False)
+    return len(names)
+
+def run_convert_compressed(state): # compressed in, compressed card out
+    names, compression = state
+    cardname = os.path.join(os.path.dirname(names[0][0]),
+        'param_card.dat' + CompressedIO.formats[compression][0])
+    for spectname, decayname in names:
+        Tools2Param.tools2param(spectname, decayname, cardname, verbose=False)
+    return len(names)
+
+stages = [
+    ('parse', prepare_lines, run_parse),
+    ('transform', prepare_dictionaries, run_transform),
+    ('write', prepare_converted, run_write),
+    ('write_template', prepare_converted, run_write_template),
+    ('decays', prepare_names, run_decays),
+    ('getdecays', prepare_names, run_getdecays),
+    ('decays_lines', prepare_names, run_decays_lines),
+    ('getdecays_lines', prepare_names, run_getdecays_lines),
+    ('convert', prepare_names, run_convert),
+    ('convert_gz', partial(prepare_compressed, compression='gz'),
+        run_convert_compressed),
+    ('convert_bz2', partial(prepare_compressed, compression='bz2'),
+        run_convert_compressed),
+    ]
+
+# -------------------------------------------------------------------------- #
+
+def time_stage(stage, names, repeat, connection): # runs in a child process
+    name, prepare, run = stage
+    state = prepare(names)
+    best = None
+    for k in range(repeat): # best of repeat
+        gc.collect()
+        cpu_start = sum(os.times()[0:2])
+        wall_start = time.time()
+        points = run(state)
+        wall = time.time() - wall_start
+        cpu = sum(os.times()[0:2]) - cpu_start
+        if (best is None) or (wall < best[0]):
+            best = (wall, cpu)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # kB (Linux)
+    connection.send({'points' : points, 'wall' : best[0], 'cpu' : best[1],
+        'points_per_second' : points / max(best[0], 1e-9),
+        'maxrss_kb' : maxrss})
+    connection.close()
+
+def run_benchmark(names, stage_names=None, repeat=3):
+    # dict stage name -> result, each stage timed in its own process
+    results = dict()
+    for stage in stages:
+        if (stage_names is not None) and (stage[0] not in stage_names):
+            continue
+        receiver, sender = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(target=time_stage,
+            args=(stage, names, repeat, sender))
+        process.start()
+        results[stage[0]] = receiver.recv()
+        process.join()
+    return results
+
+def disk_usage(names, directory): # bytes per point on disk, per format
+    # dict format -> (spectrum, decays, card); 'plain' for no compression
+    cardname = os.path.join(directory, 'param_card.dat')
+    usage = dict()
+    for compression in ['plain'] + sorted(CompressedIO.formats):
+        sizes = [0, 0, 0]
+        try:
+            for spectname, decayname in names:
+                Tools2Param.tools2param(spectname, decayname, cardname,
+                    verbose=False)
+                files = [spectname, decayname, cardname]
+                if compression != 'plain':
+                    files = [compress_file(name, compression)
+                        for name in files]
+                for n in range(3):
+                    sizes[n] = sizes[n] + os.path.getsize(files[n])
+                    if compression != 'plain':
+                        os.remove(files[n])
+        except IOError, error: # optional module missing
+            print "(" + compression + ": " + str(error) + ")"
+            continue
+        usage[compression] = [size / float(len(names)) for size in sizes]
+    return usage
+
+def print_disk_usage(usage):
+    print "%-10s %12s %12s %12s %12s" % ('format', 'spectrum kB',
+        'decays kB', 'card kB', 'total kB')
+    for compression in ['plain'] + sorted(CompressedIO.formats):
+        if compression in usage:
+            sizes = usage[compression]
+            print "%-10s %12.2f %12.2f %12.2f %12.2f" % ((compression,)
+                + tuple([size/1024. for size in sizes]) + (sum(sizes)/1024.,))
+
+def print_results(results, baseline=None, tolerance=0.2):
+    # table of results; with a baseline also the speed ratio; returns the
+    # list of stages slower than the baseline by more than tolerance
+    regressions = []
+    header = "%-16s %12s %12s %12s %10s" % ('stage', 'points/s',
+        'wall ms/pt', 'cpu ms/pt', 'peak MB')
+    if baseline is not None:
+        header = header + " %10s" % 'vs base'
+    print header
+    for stage in stages:
+        if stage[0] not in results:
+            continue
+        result = results[stage[0]]
+        line = "%-16s %12.1f %12.3f %12.3f %10.1f" % (stage[0],
+            result['points_per_second'],
+            1e3*result['wall']/result['points'],
+            1e3*result['cpu']/result['points'],
+            result['maxrss_kb']/1024.)
+        if (baseline is not None) and (stage[0] in baseline['stages']):
+            ratio = result['points_per_second'] \
+                / baseline['stages'][stage[0]]['points_per_second']
+            line = line + " %9.2fx" % ratio
+            if ratio < 1. - tolerance:
+                line = line + "  REGRESSION"
+                regressions.append(stage[0])
+        print line
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Tools2Param.')
+    parser.add_argument('--points', type=int, default=200,
+        help='synthetic points per stage')
+    parser.add_argument('--channels', type=int, default=20,
+        help='decay channels per particle in the decay files')
+    parser.add_argument('--lowen', type=int, default=10,
+        help='entries in BLOCK LOWEN')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='runs per stage, the best one counts')
+    parser.add_argument('--stages', nargs='+', default=None,
+        help='only these stages: ' + ' '.join([s[0] for s in stages]))
+    parser.add_argument('--disk', action='store_true',
+        help='also list the bytes on disk per point for each compression')
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--compare', help='baseline results to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='allowed slowdown against the baseline (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    config = {'points' : args.points, 'channels' : args.channels,
+        'lowen' : args.lowen}
+    baseline = None
+    if args.compare:
+        baseline = json.load(open(args.compare,'r'))
+        if baseline['config'] != config:
+            print "WARNING: baseline was made with " + str(baseline['config'])
+
+    directory = tempfile.mkdtemp(prefix='tools2param_bench_')
+    try:
+        names = SynthSLHA.write_scan(directory, args.points, args.channels,
+            args.lowen)
+        results = run_benchmark(names, args.stages, args.repeat)
+        usage = None
+        if args.disk:
+            usage = disk_usage(names, directory)
+    finally:
+        shutil.rmtree(directory)
+
+    regressions = print_results(results, baseline, args.tolerance)
+    if usage is not None:
+        print
+        print_disk_usage(usage)
+    if args.save:
+        savefile = open(args.save,'w')
+        json.dump({'config' : config, 'stages' : results}, savefile,
+            indent=1, sort_keys=True)
+        savefile.close()
+    if regressions:
+        print "Slower than the baseline: " + ', '.join(regressions)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# CardTemplate: param card writer compiled from the block layout ---------- #
+#
+# Every point of a scan has the same blocks with the same entries and
+# comments; only the numbers change. SLHAblock.write builds every line anew
+# (rjust of the index, sign branch, '%.8E', concatenation) and writes it on
+# its own. CardTemplate compiles the layout of write_blocks once into a
+# single format string: the index columns and comments are static text,
+# every value is a '%19.8E' slot and every BLOCK line a '%s' slot (the Q
+# scale changes from point to point). A point is then rendered with one %
+# operation and written with one call.
+#
+# '%19.8E' is what SLHAblock.datastring writes for finite numbers with a
+# two digit exponent, except -0.0 (which it writes as a positive number).
+# A point with any other value (nan, inf, -0.0, |x| >= 1E+100 or 0 < |x| <
+# 1E-99) is written with SLHAblock.write instead, so the card is always
+# byte for byte the same as write_card's.
+#
+# Blocks made only of constants (VCKM, UPMNS, SNUMIX, see the transform
+# plan in Tools2Param.py) are formatted once, into the static text.
+#
+# CardWriter keeps the templates of the layouts it has seen (a strictly
+# ordered scan has a few: the mixing rows move) and writes whole cards;
+# BatchScan.py and MultiScan.py use one per worker process.
+#
+# Requires: Tools2Param.py, SLHAblock.py.
+#
+# Example use: writer = CardWriter()
+#              writer.write(block_dictionary, decayfile, writefile)
+
+import math
+from StringIO import StringIO
+from Tools2Param import write_blocks, card_header, transform_plan, \
+    write_decay_section
+
+value_slot = '%19.8E' # SLHAblock.datastring of an ordinary value
+largest = 9.9999999e99 # beyond this '%.8E' may have a 3 digit exponent
+smallest = 1e-99
+
+constant_blocks = set([target for target, entries in transform_plan.blocks
+    if all([entry[1] == 'constant' for entry in entries])])
+
+def index_columns(index): # as in SLHAblock.datastring
+    if len(index) == 1:
+        return str(index[0]).rjust(6)
+    return str(index[0]).rjust(3) + str(index[1]).rjust(3)
+
+def plain_values(values): # True if value_slot writes them like datastring
+    if len(values) == 0:
+        return True
+    total = sum(values)
+    if total - total != 0: # nan or inf (or an overflow, to be safe)
+        return False
+    if max(values) >= largest or min(values) <= -largest:
+        return False
+    if min(map(abs, values)) < smallest: # zero or tiny: look closer
+        for value in values:
+            if value == 0:
+                if math.copysign(1., value) < 0: # -0.0
+                    return False
+            elif abs(value) < smallest:
+                return False
+    return True
+
+class CardTemplate:
+    """Layout of the write_blocks of a point, compiled to a format string.
+
+    Attributes: blocks, layout, constants, format
+    Methods: matches, render
+    """
+
+    def __init__(self, block_dictionary, blocks=write_blocks):
+        self.blocks = blocks
+        self.layout = [] # per block: (indices, comments)
+        self.constants = dict() # block -> values, formatted into the text
+        pieces = [card_header.replace('%', '%%')]
+        for name in blocks:
+            block = block_dictionary[name]
+            indices = [datum.index for datum in block.data]
+            comments = [datum.comment for datum in block.data]
+            self.layout.append((indices, comments))
+            pieces.append('%s')
+            if name in constant_blocks:
+                self.constants[name] = [datum.value for datum in block.data]
+                for datum in block.data:
+                    pieces.append(block.datastring(datum).replace('%', '%%')
+                        + '\n')
+            else:
+                for index, comment in zip(indices, comments):
+                    pieces.append(index_columns(index) + value_slot + '   #'
+                        + str(comment).replace('%', '%%') + '\n')
+            pieces.append('\n')
+        self.format = ''.join(pieces)
+
+    def matches(self, block_dictionary): # same layout and constants?
+        for name, (indices, comments) in zip(self.blocks, self.layout):
+            data = block_dictionary[name].data
+            if [datum.index for datum in data] != indices or \
+                    [datum.comment for datum in data] != comments:
+                return False
+            if name in self.constants and \
+                    [datum.value for datum in data] != self.constants[name]:
+                return False
+        return True
+
+    def render(self, block_dictionary): # header and blocks, or None
+        # None if a value would not be written like datastring
+        slots = [] # BLOCK lines and values, in order
+        values = []
+        for name in self.blocks:
+            block = block_dictionary[name]
+            slots.append(block.input_data)
+            if name not in self.constants:
+                block_values = [datum.value for datum in block.data]
+                slots.extend(block_values)
+                values.extend(block_values)
+        if not plain_values(values):
+            return None
+        return self.format % tuple(slots)
+
+# -------------------------------------------------------------------------- #
+
+def render_blocks(block_dictionary, blocks=write_blocks):
+    # header and blocks the slow way, as write_card writes them
+    outstream = StringIO()
+    outstream.write(card_header)
+    for name in blocks:
+        block_dictionary[name].write(outstream)
+        outstream.write('\n')
+    return outstream.getvalue()
+
+class CardWriter:
+    """write_card with the blocks rendered from CardTemplates.
+
+    Attributes: templates, max_templates, rendered, fallbacks
+    Methods: render, write
+    """
+
+    def __init__(self, blocks=write_blocks, max_templates=16):
+        self.blocks = blocks
+        self.templates = [] # most recently used first
+        self.max_templates = max_templates
+        self.rendered = 0 # cards rendered from a template
+        self.fallbacks = 0 # cards written with SLHAblock.write
+
+    def template(self, block_dictionary): # the template of this layout
+        for k in range(len(self.templates)):
+            if self.templates[k].matches(block_dictionary):
+                if k > 0:
+                    self.templates.insert(0, self.templates.pop(k))
+                return self.templates[0]
+        self.templates.insert(0, CardTemplate(block_dictionary, self.blocks))
+        del self.templates[self.max_templates:]
+        return self.templates[0]
+
+    def render(self, block_dictionary): # header and blocks as one string
+        text = self.template(block_dictionary).render(block_dictionary)
+        if text is None:
+            self.fallbacks = self.fallbacks + 1
+            return render_blocks(block_dictionary, self.blocks)
+        self.rendered = self.rendered + 1
+        return text
+
+    def write(self, block_dictionary, decayfile, writefile, br_min=None,
+            decay_parents=None, stats=None, relabel=None):
+        # same arguments and card as Tools2Param.write_card
+        if stats is not None:
+            stats.start('write')
+        writefile.write(self.render(block_dictionary))
+        if stats is not None:
+            stats.stop()
+            for name in self.blocks:
+                stats.count('entries_written',
+                    len(block_dictionary[name].data))
+        write_decay_section(decayfile, writefile, br_min, decay_parents,
+            stats, relabel)
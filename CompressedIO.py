@@ -0,0 +1,181 @@
+# CompressedIO: transparent reading and writing of compressed files ------- #
+#
+# open_input() opens a spectrum or decay file whether it is plain text or
+# compressed with gzip, bzip2, xz or zstd; the format is recognized by the
+# first bytes of the file (magic number), not the name. open_output()
+# writes a param card compressed according to its extension (.gz, .bz2,
+# .xz, .zst) or an explicit format. Both are streaming: the data goes
+# through the (de)compressor in chunks of buffer_size, the file never has
+# to fit in memory.
+#
+# The compressor objects of zlib, bz2 etc. are used directly rather than
+# gzip.GzipFile, whose line reading is written in python and several times
+# slower than the conversion itself.
+#
+# gzip and bzip2 come with python. xz needs the lzma module (python 3) or
+# backports.lzma, zstd needs the zstandard package; without them those
+# formats raise an IOError when used, everything else still works.
+#
+# Example use: spectfile = open_input('spectr1.dat.gz')
+#              writefile = open_output('param_card1.dat.bz2')
+
+import io
+import bz2
+import zlib
+
+buffer_size = 1 << 16 # bytes read or written per call to the compressor
+
+# format -> (extension, magic number)
+formats = {
+    'gz' : ('.gz', '\x1f\x8b'),
+    'bz2' : ('.bz2', 'BZh'),
+    'xz' : ('.xz', '\xfd7zXZ\x00'),
+    'zst' : ('.zst', '\x28\xb5\x2f\xfd'),
+    }
+
+gzip_level = 6 # as the gzip command; 9 is much slower for little gain
+
+def lzma_module(): # optional: python 3 lzma or backports.lzma
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise IOError("xz files need the lzma module "
+                "(pip install backports.lzma)")
+    return lzma
+
+def zstd_module(): # optional: zstandard
+    try:
+        import zstandard
+    except ImportError:
+        raise IOError("zstd files need the zstandard module "
+            "(pip install zstandard)")
+    return zstandard
+
+def decompressor(compression): # new decompressor object for a format
+    if compression == 'gz':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS) # with gzip header
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    if compression == 'xz':
+        return lzma_module().LZMADecompressor()
+    return zstd_module().ZstdDecompressor().decompressobj()
+
+def compressor(compression): # new compressor object for a format
+    if compression == 'gz':
+        return zlib.compressobj(gzip_level, zlib.DEFLATED,
+            16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Compressor()
+    if compression == 'xz':
+        return lzma_module().LZMACompressor()
+    return zstd_module().ZstdCompressor().compressobj()
+
+def format_of_name(filename): # compression format from the extension
+    for name, (extension, magic) in formats.items():
+        if filename.endswith(extension):
+            return name
+    return None
+
+def strip_extension(filename): # 'spectr1.dat.gz' -> 'spectr1.dat'
+    name = format_of_name(filename)
+    if name is None:
+        return filename
+    return filename[:-len(formats[name][0])]
+
+def format_of_file(fileobj): # compression format from the magic number
+    head = fileobj.read(6)
+    fileobj.seek(0)
+    for name, (extension, magic) in formats.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+# -------------------------------------------------------------------------- #
+
+def open_input(filename): # file object to read lines from, any format
+    rawfile = open(filename,'rb')
+    try:
+        compression = format_of_file(rawfile)
+        if compression is None: # plain text
+            return rawfile
+        return io.BufferedReader(DecompressingStream(rawfile, compression),
+            buffer_size)
+    except:
+        rawfile.close()
+        raise
+
+def open_output(filename, compression=None): # file object to write to
+    # compression: 'gz', 'bz2', 'xz', 'zst' or None (from the extension;
+    # plain text for anything else)
+    if compression is None:
+        compression = format_of_name(filename)
+    if compression is None:
+        return open(filename,'w')
+    if compression not in formats:
+        raise IOError("unknown compression " + str(compression))
+    stream = CompressingStream(compressor(compression), filename)
+    return io.BufferedWriter(stream, buffer_size)
+
+class DecompressingStream(io.RawIOBase):
+    # raw stream of the decompressed data; files made of several compressed
+    # streams one after the other (cat a.gz b.gz) are read as one
+    def __init__(self, rawfile, compression):
+        self.rawfile = rawfile
+        self.compression = compression
+        self.decompressor = decompressor(compression)
+        self.pending = '' # decompressed, not yet read
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.pending == '':
+            chunk = self.rawfile.read(buffer_size)
+            if chunk == '': # end of file
+                if hasattr(self.decompressor, 'flush'):
+                    self.pending = self.decompressor.flush()
+                    self.decompressor = decompressor(self.compression)
+                if self.pending == '':
+                    return 0
+                break
+            self.pending = self.decompressor.decompress(chunk)
+            rest = getattr(self.decompressor, 'unused_data', '')
+            while rest != '': # the next stream starts in this chunk
+                self.decompressor = decompressor(self.compression)
+                self.pending = self.pending \
+                    + self.decompressor.decompress(rest)
+                rest = getattr(self.decompressor, 'unused_data', '')
+        size = min(len(buffer), len(self.pending))
+        buffer[0:size] = self.pending[0:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.rawfile.close()
+        io.RawIOBase.close(self)
+
+class CompressingStream(io.RawIOBase):
+    # raw stream that compresses everything written to it into filename
+    def __init__(self, compressor, filename):
+        self.compressor = compressor
+        self.rawfile = open(filename,'wb')
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.rawfile.write(self.compressor.compress(data.tobytes()
+            if isinstance(data, memoryview) else data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.rawfile.write(self.compressor.flush())
+            finally:
+                self.rawfile.close()
+        io.RawIOBase.close(self)
@@ -0,0 +1,126 @@
+# ConvertCache: content-addressed cache of converted param cards ----------- #
+#
+# When a scan is extended or re-run most spectrum/decay pairs are the same
+# as last time. The cache keeps every param card under the SHA-1 of
+#   converter version + converter source code + options
+#   + spectrum file bytes + decay file bytes
+# so an unchanged point is copied from the cache instead of converted
+# again, and any change to the inputs, the options or the converter itself
+# gives a new key. Layout: <directory>/ab/abcdef0123....dat
+#
+# The cache is size capped: evict() removes the least recently used cards
+# (oldest modification time; a hit touches the card) until the total size
+# is below max_bytes. Several processes may share a cache directory: cards
+# are written to a temporary file and renamed into place, both into the
+# cache and out of it. fetch doesn't count hits and misses, as it usually
+# runs in a worker process; the caller counts them (BatchScan.run_batch).
+#
+# Requires: Tools2Param.py (for the version string).
+
+import os
+import json
+import shutil
+import hashlib
+import Tools2Param
+
+# the modules whose code decides what a card looks like
+converter_modules = ['Tools2Param.py', 'SLHAblock.py', 'SLHAreader.py',
+    'SLHAdecay.py', 'CompressedIO.py', 'TransformPlan.py',
+    'CardTemplate.py']
+
+def converter_fingerprint(): # SHA-1 of the converter version and source
+    digest = hashlib.sha1(Tools2Param.version)
+    directory = os.path.dirname(os.path.abspath(Tools2Param.__file__))
+    for name in converter_modules:
+        digest.update(open(os.path.join(directory, name),'rb').read())
+    return digest.hexdigest()
+
+class ConversionCache:
+    """Param cards stored under a hash of their inputs, LRU size capped.
+
+    Attributes: directory, max_bytes, fingerprint, hits, misses, evicted
+    Methods: key, fetch, store, evict
+    """
+
+    def __init__(self, directory, max_bytes=None): # max_bytes None: no cap
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = converter_fingerprint()
+        self.hits = 0 # statistics, counted by the caller of fetch
+        self.misses = 0
+        self.evicted = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, spectname, decayname, options={}): # hash of the inputs
+        digest = hashlib.sha1(self.fingerprint)
+        digest.update(json.dumps(options, sort_keys=True, default=sorted))
+        for name in (spectname, decayname):
+            digest.update('\0' + str(os.path.getsize(name)) + '\0')
+            infile = open(name,'rb')
+            chunk = infile.read(1 << 20)
+            while chunk:
+                digest.update(chunk)
+                chunk = infile.read(1 << 20)
+            infile.close()
+        return digest.hexdigest()
+
+    def path(self, key): # where the card of key is kept
+        return os.path.join(self.directory, key[0:2], key + '.dat')
+
+    def fetch(self, key, writename): # copy cached card to writename if any
+        cardname = self.path(key)
+        tmpname = writename + '.tmp'
+        try:
+            shutil.copyfile(cardname, tmpname)
+            os.utime(cardname, None) # mark as recently used
+        except (IOError, OSError): # not cached (or evicted meanwhile)
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            return False
+        os.rename(tmpname, writename)
+        return True
+
+    def store(self, key, cardname): # put a converted card into the cache
+        target = self.path(key)
+        if not os.path.isdir(os.path.dirname(target)):
+            try:
+                os.makedirs(os.path.dirname(target))
+            except OSError: # made by another process meanwhile
+                pass
+        tmpname = target + '.' + str(os.getpid()) + '.tmp'
+        shutil.copyfile(cardname, tmpname)
+        os.rename(tmpname, target)
+
+    def evict(self): # drop least recently used cards above max_bytes
+        if self.max_bytes is None:
+            return 0
+        entries = []
+        total = 0
+        for subdir in os.listdir(self.directory):
+            subpath = os.path.join(self.directory, subdir)
+            if not os.path.isdir(subpath):
+                continue
+            for name in os.listdir(subpath):
+                if not name.endswith('.dat'):
+                    continue
+                try:
+                    info = os.stat(os.path.join(subpath, name))
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size,
+                    os.path.join(subpath, name)))
+                total = total + info.st_size
+        entries.sort()
+        removed = 0
+        for mtime, size, cardname in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(cardname)
+            except OSError:
+                continue
+            total = total - size
+            removed = removed + 1
+        self.evicted = self.evicted + removed
+        return removed
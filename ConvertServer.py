@@ -0,0 +1,288 @@
+#! /usr/bin/env python
+# ConvertServer.py
+#
+# Long-running converter: one warm Tools2Param process (plus a pool of
+# workers) takes conversion requests from many NMSSMTools jobs on a node, so
+# nobody pays the interpreter start-up per point.
+#
+# Requests and responses are JSON, one object per line, either over a Unix
+# domain socket (--socket) or on stdin/stdout (--stdin). A request has
+#   spectrum    file name or SLHA text of the spectrum (required)
+#   decays      file name or SLHA text of the decays (required)
+#   output      file name for the param card (compressed if it ends in
+#               .gz, .bz2, .xz or .zst); without it the card comes back in
+#               the response as 'card'
+#   br_min, decays_of   decay pruning, as Tools2Param.py --br-min/--decays-of
+#               (decays_of: a list of PDG ids, or a string "25,35")
+#   strict      true: order the sfermions by mass, as Tools2Param.py --strict
+#   id          anything, copied into the response
+# br_min, decays_of and strict default to the server's --br-min, --decays-of
+# and --strict; a request that has them overrides the defaults.
+# and the response is {"id": .., "ok": true, "output": name} (or "card": ..)
+# or {"id": .., "ok": false, "error": message}. Requests are converted
+# concurrently, so responses can come back in a different order: match
+# them by id. A failed point does not affect the others. At most
+# --max-pending requests of one connection are converted or waiting at a
+# time; beyond that the server stops reading from it until some are
+# answered, so a fast client can't fill the memory of the server.
+#
+# Requires: Tools2Param.py, SLHAblock.py, CompressedIO.py.
+#
+# Example use: python ConvertServer.py --socket /tmp/tools2param.sock -j 4
+#              echo '{"id": 1, "spectrum": "spectr1.dat",
+#                     "decays": "decay1.dat", "output": "card1.dat"}' \
+#                  | socat - UNIX-CONNECT:/tmp/tools2param.sock
+#              python ConvertServer.py --stdin < requests.jsonl
+#
+# From python, see request() at the bottom of this file.
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import json
+import signal
+import socket
+import argparse
+import threading
+import SocketServer
+import multiprocessing
+from Tools2Param import Converter, required_blocks
+from CompressedIO import open_output, format_of_name
+
+# the conversion options a request (or the command line) can set
+option_names = ['br_min', 'decays_of', 'strict']
+
+def as_source(item): # JSON gives unicode; file names and text as str
+    if isinstance(item, unicode):
+        return item.encode('utf-8')
+    return item
+
+def decay_parents_of(item): # [25, 35] or '25,35' -> set([25, 35])
+    # ValueError for anything else (a string is not a list of digits)
+    if isinstance(item, basestring):
+        item = item.split(',')
+    if not isinstance(item, list):
+        raise ValueError('decays_of is not a list of PDG ids')
+    parents = set()
+    for pdg in item:
+        if isinstance(pdg, basestring) and pdg.strip().lstrip('-').isdigit():
+            pdg = int(pdg)
+        if isinstance(pdg, bool) or not isinstance(pdg, (int, long)):
+            raise ValueError('decays_of: ' + repr(pdg) + ' is not a PDG id')
+        parents.add(pdg)
+    return parents
+
+def ignore_interrupt(): # pool initializer: Ctrl-C is for the server
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def convert_request(request, defaults={}): # run in a worker
+    # returns the response; defaults: options for what request doesn't set
+    response = {'id' : request.get('id')}
+    try:
+        options = dict(defaults)
+        for name in option_names:
+            if name in request:
+                options[name] = request[name]
+        decay_parents = None
+        if options.get('decays_of') is not None:
+            decay_parents = decay_parents_of(options['decays_of'])
+        converter = Converter(br_min=options.get('br_min'),
+            decay_parents=decay_parents, strict=bool(options.get('strict')))
+        card = converter.convert(as_source(request['spectrum']),
+            as_source(request['decays']))
+        for item in required_blocks + ['EXTPAR']:
+            if not (item in card.block_dictionary):
+                raise KeyError(item)
+        if request.get('output') is None:
+            response['card'] = card.tostring()
+        else:
+            writename = as_source(request['output'])
+            tmpname = writename + '.tmp' # renamed into place when complete
+            try:
+                writefile = open_output(tmpname, format_of_name(writename))
+                try:
+                    card.write(writefile)
+                finally:
+                    writefile.close()
+                os.rename(tmpname, writename)
+            finally:
+                if os.path.exists(tmpname):
+                    os.remove(tmpname)
+            response['output'] = writename
+        response['ok'] = True
+    except Exception, error: # isolate the failure to this request
+        response['ok'] = False
+        response['error'] = error.__class__.__name__ + ': ' + str(error)
+    return response
+
+# -------------------------------------------------------------------------- #
+
+class Session:
+    """Requests from one input stream, answered on one output stream.
+
+    Attributes: pool, outstream, options, max_pending, pending
+    Methods: submit, answer, wait
+    """
+
+    def __init__(self, pool, outstream, options={}, max_pending=64):
+        self.pool = pool
+        self.outstream = outstream # file object for the responses
+        self.options = options # defaults of the conversion options
+        self.max_pending = max_pending # submit blocks beyond this many
+        self.lock = threading.Lock() # one response line at a time
+        self.done = threading.Condition() # a pending request was answered
+        self.pending = 0 # requests submitted and not answered yet
+
+    def submit(self, line): # one line of input
+        if line.strip() == '':
+            return
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('request is not a JSON object')
+        except ValueError, error:
+            self.answer({'id' : None, 'ok' : False,
+                'error' : 'ValueError: ' + str(error)})
+            return
+        self.done.acquire()
+        try:
+            while self.pending >= self.max_pending: # backpressure
+                self.done.wait()
+            self.pending = self.pending + 1
+        finally:
+            self.done.release()
+        self.pool.apply_async(convert_request, (request, self.options),
+            callback=self.finish)
+
+    def answer(self, response): # one response line
+        self.lock.acquire()
+        try:
+            self.outstream.write(json.dumps(response) + '\n')
+            self.outstream.flush()
+        except (IOError, socket.error): # client went away, drop the answer
+            pass
+        finally:
+            self.lock.release()
+
+    def finish(self, response): # called from the pool's result thread
+        try:
+            self.answer(response)
+        finally:
+            self.done.acquire()
+            self.pending = self.pending - 1
+            self.done.notify_all()
+            self.done.release()
+
+    def wait(self): # until every submitted request is answered
+        self.done.acquire()
+        try:
+            while self.pending > 0:
+                self.done.wait()
+        finally:
+            self.done.release()
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+    # one thread per connection; the pool is shared by all of them
+    def handle(self):
+        session = Session(self.server.pool, self.wfile, self.server.options,
+            self.server.max_pending)
+        for line in iter(self.rfile.readline, ''):
+            session.submit(line)
+        session.wait()
+
+class ConvertServer(SocketServer.ThreadingMixIn,
+        SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, pool, options={}, max_pending=64):
+        self.pool = pool
+        self.options = options # for every Session, see there
+        self.max_pending = max_pending
+        SocketServer.UnixStreamServer.__init__(self, path, RequestHandler)
+
+def serve_socket(path, processes=None, options={}, max_pending=64):
+    # until interrupted
+    if os.path.exists(path): # left over from an earlier server
+        os.remove(path)
+    pool = multiprocessing.Pool(processes, ignore_interrupt)
+    server = ConvertServer(path, pool, options, max_pending)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+        pool.terminate()
+        pool.join()
+
+def serve_stdin(processes=None, options={}, max_pending=64):
+    # until the end of stdin
+    pool = multiprocessing.Pool(processes, ignore_interrupt)
+    try:
+        session = Session(pool, sys.stdout, options, max_pending)
+        for line in iter(sys.stdin.readline, ''):
+            session.submit(line)
+        session.wait()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+# -------------------------------------------------------------------------- #
+
+def request(path, requests): # client: send requests to a server at path
+    # requests: list of dicts as above; returns the responses in the order
+    # of the requests (their ids are replaced by the position)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(path)
+    try:
+        for position in range(len(requests)):
+            item = dict(requests[position])
+            item['id'] = position
+            connection.sendall(json.dumps(item) + '\n')
+        connection.shutdown(socket.SHUT_WR)
+        responses = [json.loads(line) for line in connection.makefile('r')]
+    finally:
+        connection.close()
+    responses.sort(key=lambda item: item['id'])
+    return responses
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve Tools2Param conversions to many clients.')
+    parser.add_argument('--socket', help='listen on this Unix socket')
+    parser.add_argument('--stdin', action='store_true',
+        help='read requests from stdin, answer on stdout')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--max-pending', type=int, default=64,
+        help='requests of one client converted or waiting at a time')
+    parser.add_argument('--br-min', type=float, default=None,
+        help='default: drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays-of', default=None,
+        help='default: comma separated PDG ids, only their DECAY tables')
+    parser.add_argument('--strict', action='store_true',
+        help='default: order the sfermion mass eigenstates by mass')
+    args = parser.parse_args(argv)
+
+    if (args.socket is None) == (not args.stdin):
+        parser.error("give either --socket PATH or --stdin")
+    if args.max_pending < 1:
+        parser.error("--max-pending must be at least 1")
+    options = {'br_min' : args.br_min, 'strict' : args.strict}
+    if args.decays_of is not None:
+        try:
+            options['decays_of'] = sorted(decay_parents_of(args.decays_of))
+        except ValueError:
+            parser.error("--decays-of takes comma separated PDG ids")
+    try:
+        if args.stdin:
+            serve_stdin(args.jobs, options, args.max_pending)
+        else:
+            serve_socket(args.socket, args.jobs, options, args.max_pending)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# ConvertStats: timing and counters of a conversion ------------------------ #
+#
+# A Stats object collects, for one point or added up over a batch,
+#   wall and CPU time per stage:  read, parse, transform, write, decays
+#   counters:  lines_read, blocks_parsed, blocks_dropped_gut,
+#              blocks_dropped_spinfo, blocks_dropped_unrecognized,
+#              entries_written, decay_lines_copied
+# record() gives a dictionary ready for json.dumps, one per point; add()
+# sums records into a batch total.
+#
+# Instrumentation is off unless a Stats object is passed (stats=None is the
+# default everywhere). The hot loops only keep local counts and hand them
+# over once at the end, so there is nothing to pay per line when it is off.
+
+import time
+
+stage_names = ['read', 'parse', 'transform', 'write', 'decays']
+
+cpu_clock = time.clock # CPU time of this process (python 2)
+
+class Stats:
+    """Wall/CPU time per stage and counters of a conversion.
+
+    Attributes: wall, cpu, counters, points
+    Methods: start, stop, count, record, add
+    """
+
+    def __init__(self):
+        self.wall = dict() # stage -> seconds
+        self.cpu = dict()
+        self.counters = dict() # name -> count
+        self.points = 0 # points added up in here
+        self.stage = None # stage being timed: (name, wall, cpu) at start
+
+    def start(self, stage): # start timing a stage
+        self.stage = (stage, time.time(), cpu_clock())
+
+    def stop(self): # stop timing the current stage
+        stage, wall_start, cpu_start = self.stage
+        self.wall[stage] = self.wall.get(stage, 0.) + time.time() - wall_start
+        self.cpu[stage] = self.cpu.get(stage, 0.) + cpu_clock() - cpu_start
+        self.stage = None
+
+    def count(self, name, number=1): # add to a counter
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def record(self, **extra): # dictionary for json, plus extra items
+        record = {'points' : max(self.points, 1),
+            'wall' : dict(self.wall), 'cpu' : dict(self.cpu),
+            'counters' : dict(self.counters)}
+        record.update(extra)
+        return record
+
+    def add(self, record): # add a record (of a point or a batch) to this
+        self.points = self.points + record.get('points', 1)
+        for stage, seconds in record['wall'].iteritems():
+            self.wall[stage] = self.wall.get(stage, 0.) + seconds
+        for stage, seconds in record['cpu'].iteritems():
+            self.cpu[stage] = self.cpu.get(stage, 0.) + seconds
+        for name, number in record['counters'].iteritems():
+            self.count(name, number)
@@ -1,26 +1,278 @@
 #! /usr/bin/env python
-# Tools3Param.py version 3.1
-# Flip Tanedo, 17 June 2012
+# GetDecays.py
 #
-# This script takes NMSSMTools (SLHA 1) output files and converts them
-# into strictly SLHA 2 compliant parameter cards for the NMSSM implementaiton
-# in FeynRules (UFO model) which can then be used in Madgraph 5. 
-# LIMITATIONS: does not pass GUT scale info, does not pass metadata
+# Reads the total widths of an NMSSMTools decay file (SLHA DECAY lines).
+# On one file it copies the DECAY lines (pdg, width and comment) to an
+# output file; with --batch it tabulates the widths, and branching ratios
+# if asked, of the decay files of a whole scan into a columnar store.
 #
-# Requires: SLHAblock.py.
+# Requires: CompressedIO.py, ScanColumns.py (--batch).
 #
-# Example use: python Tools2Param.py spectr1.dat decay1.dat param_card.dat
-#                     (this file)    (spectrum)  (decays)   (output file)
+# Example use: python GetDecays.py decay1.dat decay_lines.dat
+#              python GetDecays.py --batch scan/ widths/ -j 8 \
+#                  --br 1000023 --br 25:5,-5
+#
+# The decay file may be compressed, see CompressedIO.py.
+#
+# With --batch the first argument is a directory (its decayN.dat files, N
+# a number, or decayN.dat.gz etc.; nothing else) or a glob of decay files,
+# and the second a columnar store (ScanColumns.py) that gets one point per
+# decay file, labelled like BatchScan.py labels the cards
+# (decay12.dat -> 12): the total width of every particle as column
+# WIDTH[pdg], and with --br the branching ratios of the channels of a
+# particle (--br 1000023) or of one channel (--br 25:5,-5) as column
+# BR[parent,daughters], daughters sorted (so 25:-5,5 is the same). Channels
+# with the same daughters are added up; a chosen channel a point doesn't
+# have is 0 (NaN if the particle has no decay table). The files are read by
+# worker processes and the store is written in chunks as they come back,
+# so memory stays bounded. An existing store is extended with the points
+# it doesn't have yet: a label already in it (or a second file with the
+# same label, decay1.dat and decay1.dat.gz) is skipped. Query it with
+# ScanQuery.py (e.g. 'WIDTH[25] < 0.004') or read it with numpy.
+#
+# The DECAY lines are found with one regular expression search over the
+# whole file, memory-mapped, instead of looking at every line in python;
+# compressed files are searched the same way, chunk by chunk. The pattern
+# starts with the newline before DECAY: the search then only stops at
+# newlines (with ^ and re.MULTILINE it tries every character).
 
 # -------------------------------------------------------------------------- #
 
 import sys # module for accessing arguments
-decayfile = open(sys.argv[1],'r')	# Open decay file for reading
-writefile = open(sys.argv[2],'w')	# Create file for writing
-
-for line in decayfile:
-    if line.upper().startswith('DECAY'):
-        writefile.write(line)
-        
-decayfile.close()
-writefile.close()
\ No newline at end of file
+import os
+import re
+import glob
+import mmap
+import argparse
+import multiprocessing
+from functools import partial
+from CompressedIO import open_input, open_output, strip_extension, formats
+from ScanColumns import ColumnWriter, column_name, read_labels
+
+decay_line = re.compile(r'\n[Dd][Ee][Cc][Aa][Yy][^\n]*') # after a newline
+
+chunk_size = 1 << 20 # bytes searched at a time in a compressed file
+
+def get_decays(decayfile, writefile): # copy only the DECAY header lines
+    # from the current position of decayfile to the end
+    try:
+        data = mmap.mmap(decayfile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        # no file descriptor (compressed) or empty file
+        get_decays_chunked(decayfile, writefile)
+        return
+    try:
+        writefile.write(''.join(find_decay_lines(data, decayfile.tell(),
+            len(data))))
+    finally:
+        data.close()
+
+def find_decay_lines(data, start, end): # DECAY lines in data[start:end]
+    # start is the beginning of a line; the lines keep their newline
+    found = []
+    if data[start:start+5].upper() == 'DECAY': # first line, no newline before
+        stop = data.find('\n', start, end)
+        if stop < 0:
+            stop = end - 1
+        found.append(data[start:stop+1])
+    for match in decay_line.finditer(data, start, end):
+        line = match.group()[1:]
+        if match.end() < end: # stopped at the newline ending the line
+            line = line + '\n'
+        found.append(line)
+    return found
+
+def get_decays_chunked(decayfile, writefile): # same, for any file object
+    rest = '' # incomplete last line of the previous chunk
+    chunk = decayfile.read(chunk_size)
+    while chunk:
+        chunk = rest + chunk
+        end = chunk.rfind('\n') + 1
+        writefile.write(''.join(find_decay_lines(chunk, 0, end)))
+        rest = chunk[end:]
+        chunk = decayfile.read(chunk_size)
+    writefile.write(''.join(find_decay_lines(rest, 0, len(rest))))
+
+# -------------------------------------------------------------------------- #
+
+## Batch extraction (--batch): widths and branching ratios of a whole scan
+
+def decay_label(decayname): # decay12.dat (or decay12.dat.gz) -> '12'
+    label = os.path.splitext(os.path.basename(strip_extension(decayname)))[0]
+    if label.startswith('decay'):
+        label = label[len('decay'):]
+    return label
+
+def parse_channels(specs): # ['1000023', '25:5,-5'] -> {parent : channels}
+    # channels: None for all channels of the parent, else a set of sorted
+    # daughter tuples; ValueError if a spec doesn't parse
+    channels = dict()
+    for spec in specs:
+        parent, sep, daughters = spec.partition(':')
+        parent = int(parent)
+        if not sep:
+            channels[parent] = None
+        elif parent not in channels or channels[parent] is not None:
+            channels.setdefault(parent, set()).add(tuple(sorted(
+                [int(item) for item in daughters.split(',')])))
+    return channels
+
+def decay_columns(text, channels=None):
+    # [(column name, value)] of one decay file: WIDTH[pdg] of every DECAY
+    # block, BR[parent,daughters] of the channels wanted (see parse_channels)
+    columns = []
+    text = '\n' + text # decay_line starts at a newline
+    matches = list(decay_line.finditer(text))
+    for k in range(len(matches)):
+        tokens = matches[k].group().split()
+        parent = int(tokens[1])
+        columns.append((column_name('WIDTH', (parent,)), float(tokens[2])))
+        if (channels is None) or (parent not in channels):
+            continue
+        wanted = channels[parent]
+        brs = dict() # (parent,) + daughters -> summed BR
+        keys = [] # in order of appearance
+        if wanted is not None: # chosen channels are there, maybe with 0
+            keys = [(parent,) + daughters for daughters in sorted(wanted)]
+            brs = dict([(key, 0.) for key in keys])
+        end = len(text)
+        if k + 1 < len(matches):
+            end = matches[k+1].start()
+        for line in text[matches[k].end():end].split('\n'):
+            data = line.partition('#')[0].split()
+            if data == []:
+                continue
+            if data[0].upper() == 'BLOCK': # end of the decay section
+                break
+            nda = int(data[1])
+            daughters = tuple(sorted([int(item) for item in data[2:2+nda]]))
+            if (wanted is not None) and (daughters not in wanted):
+                continue
+            key = (parent,) + daughters
+            if key not in brs:
+                keys.append(key)
+                brs[key] = 0.
+            brs[key] = brs[key] + float(data[0])
+        for key in keys:
+            columns.append((column_name('BR', key), brs[key]))
+    return columns
+
+def extract_point(decayname, channels=None): # run in a worker
+    # (label, columns, '') or (label, None, error message)
+    label = decay_label(decayname)
+    try:
+        decayfile = open_input(decayname)
+        try:
+            text = decayfile.read()
+        finally:
+            decayfile.close()
+        return (label, decay_columns(text, channels), '')
+    except Exception, error: # isolate the failure to this file
+        return (label, None, error.__class__.__name__ + ': ' + str(error))
+
+# decay files in a directory, as BatchScan.py pairs them with the spectra
+decay_name = re.compile(r'^decay\d+\.dat(' + '|'.join([re.escape(extension)
+    for extension, magic in formats.values()]) + r')?$')
+
+def decay_files(pattern): # decay files of a directory or a glob, sorted
+    if os.path.isdir(pattern):
+        return sorted([os.path.join(pattern, name)
+            for name in os.listdir(pattern) if decay_name.match(name)])
+    return sorted(glob.glob(pattern))
+
+def extract_batch(decaynames, directory, processes=None, channels=None,
+        chunk_points=1000):
+    # widths (and BRs of channels) of all files into the columnar store
+    # directory; returns (list of (label, error message) that failed, list
+    # of the files skipped as their label is in the store already)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    labels = set()
+    if os.path.exists(os.path.join(directory, 'points.txt')):
+        labels = set(read_labels(directory))
+    new = []
+    skipped = []
+    for decayname in decaynames:
+        if decay_label(decayname) in labels:
+            skipped.append(decayname)
+        else:
+            labels.add(decay_label(decayname))
+            new.append(decayname)
+    decaynames = new
+    if not decaynames:
+        return [], skipped
+    chunksize = max(1, min(64, len(decaynames) // (4*processes)))
+    writer = ColumnWriter(directory, chunk_points)
+    failed = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for label, columns, message in pool.imap(partial(extract_point,
+                channels=channels), decaynames, chunksize):
+            if columns is None:
+                failed.append((label, message))
+            else:
+                writer.add_columns(label, columns)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        writer.close()
+    return failed, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Copy the DECAY lines of a decay file, or with --batch '
+            'tabulate the widths and branching ratios of a whole scan.')
+    parser.add_argument('decays', help='decay file (--batch: directory or '
+        "glob, e.g. 'scan/decay*.dat')")
+    parser.add_argument('output', help='output file (--batch: columnar '
+        'store directory)')
+    parser.add_argument('--batch', action='store_true',
+        help='extract a whole scan into a columnar store')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='--batch: worker processes (default: number of CPUs)')
+    parser.add_argument('--br', action='append', default=[],
+        help="--batch: BRs of a particle's channels, e.g. 1000023, or of "
+            'one channel, e.g. 25:5,-5 (repeat for more)')
+    parser.add_argument('--chunk', type=int, default=1000,
+        help='--batch: points buffered before writing (default 1000)')
+    args = parser.parse_args(argv)
+
+    if not args.batch:
+        decayfile = open_input(args.decays)	# Open decay file for reading
+        writefile = open_output(args.output)	# Create file for writing
+
+        get_decays(decayfile, writefile)
+
+        decayfile.close()
+        writefile.close()
+        return 0
+
+    try:
+        channels = parse_channels(args.br)
+    except ValueError:
+        print "ERROR: --br takes PDG ids, e.g. 1000023 or 25:5,-5"
+        return 1
+    decaynames = decay_files(args.decays)
+    if not decaynames:
+        print "ERROR: no decay files found"
+        return 1
+    failed, skipped = extract_batch(decaynames, args.output, args.jobs,
+        channels or None, args.chunk)
+    if skipped:
+        print str(len(skipped)) + " decay files skipped, their points are " \
+            "in " + args.output + " already"
+    print str(len(decaynames) - len(skipped) - len(failed)) + " / " \
+        + str(len(decaynames) - len(skipped)) \
+        + " decay files extracted to " + args.output
+    if failed:
+        print str(len(failed)) + " files FAILED:"
+        for label, message in sorted(failed):
+            print "  point " + label + ": " + message
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
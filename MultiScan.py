@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+# MultiScan.py
+#
+# Converts scans that keep many points in one spectrum file and one decay
+# file (points one after the other, each starting with BLOCK SPINFO resp.
+# BLOCK DCINFO). Point k of the spectrum file goes with point k of the decay
+# file and is written to param_cardk.dat (k counted from 0).
+#
+# Both files are indexed once (see SLHAindex.py; the index is kept next to
+# the file) and memory-mapped, so a single point or a range of points is
+# converted without reading what comes before it. With -j the points are
+# split into byte ranges of about equal size, one per worker process.
+#
+# Requires: SLHAindex.py, BatchScan.py, Tools2Param.py, SLHAblock.py.
+#
+# Example use: python MultiScan.py scan_spectra.dat scan_decays.dat cards/ -j 8
+#              python MultiScan.py scan_spectra.dat scan_decays.dat cards/ \
+#                  --points 1000:1010
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import argparse
+import multiprocessing
+from functools import partial
+from SLHAindex import SLHAindex, markers
+from Tools2Param import read_spectrum, convert_blocks, required_blocks
+from BatchScan import failure, print_summary, card_writer
+
+def convert_range(points, spectname, decayname, outdir, options={}):
+    # run in a worker: convert points[0] <= k < points[1], returns the
+    # list of results as in BatchScan.py
+    spectra = SLHAindex(spectname, markers['spectrum'])
+    decays = SLHAindex(decayname, markers['decays'])
+    results = []
+    for k in range(points[0], points[1]):
+        label = str(k)
+        writename = os.path.join(outdir, 'param_card' + label + '.dat')
+        tmpname = writename + '.tmp' # renamed into place when complete
+        try:
+            block_dictionary = read_spectrum(spectra.point_lines(k))
+            for item in required_blocks + ['EXTPAR']:
+                if not (item in block_dictionary):
+                    raise KeyError(item)
+            convert_blocks(block_dictionary, verbose=False)
+            writefile = open(tmpname,'w')
+            try:
+                card_writer.write(block_dictionary, decays.point_lines(k),
+                    writefile, **options)
+            finally:
+                writefile.close()
+            os.rename(tmpname, writename)
+            results.append((label, True, '', None, None, None))
+        except Exception, error: # isolate the failure to this point
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            results.append(failure(label, error))
+    spectra.close()
+    decays.close()
+    return results
+
+def run_multi(spectname, decayname, outdir, processes=None, points=None,
+        options={}): # returns (number of points, list of failed results)
+    spectra = SLHAindex(spectname, markers['spectrum'])
+    decays = SLHAindex(decayname, markers['decays'])
+    if len(spectra) != len(decays):
+        print "ERROR: " + str(len(spectra)) + " spectra but " \
+            + str(len(decays)) + " decay tables"
+        return 0, []
+    if points is None:
+        points = (0, len(spectra))
+    points = (max(points[0], 0), min(points[1], len(spectra)))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    # byte ranges of the whole file, cut down to the requested points
+    ranges = []
+    for first, last in spectra.ranges(4*processes):
+        first, last = max(first, points[0]), min(last, points[1])
+        if last > first:
+            ranges.append((first, last))
+    spectra.close()
+    decays.close()
+    worker = partial(convert_range, spectname=spectname,
+        decayname=decayname, outdir=outdir, options=options)
+    failed = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for results in pool.imap_unordered(worker, ranges):
+            failed.extend([result for result in results if not result[1]])
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return max(points[1] - points[0], 0), failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert multi-point spectrum and decay files.')
+    parser.add_argument('spectra', help='file with many spectra')
+    parser.add_argument('decays', help='file with the decays of each point')
+    parser.add_argument('outdir', help='directory for the param cards')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--points', default=None,
+        help='only points FIRST:LAST (LAST not included), or a single K')
+    parser.add_argument('--br-min', type=float, default=None,
+        help='drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays-of', default=None,
+        help='comma separated PDG ids: only write these DECAY tables')
+    args = parser.parse_args(argv)
+
+    points = None
+    if args.points is not None:
+        if ':' in args.points:
+            first, last = args.points.split(':')
+            points = (int(first or 0), int(last or sys.maxint))
+        else:
+            points = (int(args.points), int(args.points) + 1)
+    options = dict()
+    if args.br_min is not None:
+        options['br_min'] = args.br_min
+    if args.decays_of is not None:
+        options['decay_parents'] = set(
+            [int(item) for item in args.decays_of.split(',')])
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+
+    npoints, failed = run_multi(args.spectra, args.decays, args.outdir,
+        args.jobs, points, options)
+    if npoints == 0:
+        print "ERROR: no points to convert"
+        return 1
+    print_summary(range(npoints), failed)
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
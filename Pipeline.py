@@ -0,0 +1,432 @@
+#! /usr/bin/env python
+# Pipeline.py
+#
+# Pipelined conversion of one big batch on one node: reading the inputs,
+# converting and writing the cards overlap instead of taking turns, so the
+# CPU doesn't wait for the (shared) filesystem and the disk doesn't wait
+# for the parser. Three stages connected by bounded queues:
+#
+#   readers     threads (--readers) read spectrum/decay pairs into memory
+#                  -> read queue (at most --queue pairs)
+#   transform   worker processes (-j) parse, convert and render the cards,
+#                  up to --chunksize points per task (what the read queue
+#                  holds when a task is sent, so no waiting to fill it)
+#                  -> at most --queue points in the workers at a time
+#                  -> write queue (at most --queue cards)
+#   writers     threads (--writers) write the cards (tmp file + rename)
+#
+# With --delta the output directory is a delta store (ScanDelta.py) instead
+# of a directory of cards: the first point becomes the base card, the
+# workers encode every other card against it and the writers append the
+# records.
+#
+# A full queue blocks the stage before it (backpressure), so at most about
+# 3 x --queue points are in memory whatever the size of the batch.
+#
+# With --report the queue depths (sampled every --sample seconds, mean and
+# max) and the utilization of every stage (busy time / (wall time x number
+# of threads or workers)) are printed at the end, and how long the readers
+# and the transform stage were blocked by a full queue downstream: a busy
+# stage with blocked stages before it is the bottleneck. --report-json FILE
+# writes the same as JSON.
+#
+# The cards are the same as BatchScan.py writes (same options, failures
+# isolated per point, no partial cards).
+#
+# Requires: BatchScan.py, Tools2Param.py, CardTemplate.py, CompressedIO.py,
+#           ConvertServer.py, ScanDelta.py.
+#
+# Example use: python Pipeline.py 'scan/spectr*.dat' cards/ -j 8 \
+#                  --readers 4 --writers 2 --queue 64 --report
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import json
+import time
+import Queue
+import argparse
+import threading
+import multiprocessing
+from cStringIO import StringIO # C: the decay lines go through it
+from Tools2Param import read_spectrum, convert_blocks, required_blocks, \
+    order_sfermions
+from CompressedIO import open_input, open_output, formats, format_of_name
+from BatchScan import jobs_from_glob, jobs_from_manifest, failure, \
+    print_summary, card_writer
+from ConvertServer import ignore_interrupt
+from ScanDelta import DeltaStore, base_card
+
+forever = 1e9 # timeout of blocking gets, see transform_loop
+
+def read_pair(job): # spectrum and decay file of a job, as strings
+    # (one string per file: a list of lines takes ten times longer to send
+    # to a worker than to read)
+    texts = []
+    for name in job[1:3]:
+        infile = open_input(name)
+        try:
+            texts.append(infile.read())
+        finally:
+            infile.close()
+    return texts
+
+def transform_point(item, options={}, strict=False, delta=None):
+    # run in a worker. item: (job, spectrum text, decay text); returns
+    # (result, card text, busy seconds) with result as in BatchScan.py, text
+    # None on failure; delta: store directory, the text is then the records
+    # of the card (see ScanDelta.py). Never raises: every point in flight
+    # holds a slot of transform_loop until its result comes back
+    start = time.time()
+    job = item[0]
+    try:
+        spectrum_text, decay_text = item[1:]
+        block_dictionary = read_spectrum(spectrum_text.splitlines(True))
+        for name in required_blocks + ['EXTPAR']:
+            if not (name in block_dictionary):
+                raise KeyError(name)
+        convert_blocks(block_dictionary, verbose=False)
+        relabel = None
+        if strict:
+            relabel = order_sfermions(block_dictionary)
+        card = StringIO()
+        card_writer.write(block_dictionary, decay_text.splitlines(True), card,
+            relabel=relabel, **options)
+        text = card.getvalue()
+        if delta is not None:
+            text = base_card(delta).encode(text)
+    except Exception, error: # isolate the failure to this point
+        return failure(job[0], error), None, time.time() - start
+    return (job[0], True, '', None, None, None), text, time.time() - start
+
+def transform_chunk(items, options={}, strict=False, delta=None):
+    # run in a worker
+    return [transform_point(item, options, strict, delta) for item in items]
+
+def write_text(job, text): # the card of a job, renamed into place
+    writename = job[3]
+    tmpname = writename + '.tmp'
+    try:
+        writefile = open_output(tmpname, format_of_name(writename))
+        try:
+            writefile.write(text)
+        finally:
+            writefile.close()
+        os.rename(tmpname, writename)
+    except Exception, error: # isolate the failure to this point
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        return failure(job[0], error)
+    return (job[0], True, '', None, None, None)
+
+# -------------------------------------------------------------------------- #
+
+class Pipeline:
+    """Reader threads, transform processes and writer threads connected by
+    bounded queues.
+
+    Attributes: readers, writers, processes, queue_size, chunksize, options,
+        strict, delta, results, busy, blocked, depths, wall
+    Methods: run, report
+    """
+
+    def __init__(self, readers=4, writers=2, processes=None, queue_size=64,
+            options={}, strict=False, sample=0.1, chunksize=8, delta=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.readers = readers
+        self.writers = writers
+        self.processes = processes
+        self.queue_size = queue_size
+        self.chunksize = max(1, min(chunksize, queue_size)) # points per task
+        self.options = options # keyword arguments for write_card
+        self.strict = strict
+        self.delta = delta # DeltaStore to add the cards to, or None
+        self.delta_directory = None # its directory, for the workers
+        self.sample = sample # seconds between queue depth samples
+        self.results = [] # one per point, as in BatchScan.py
+        self.busy = {'read' : 0., 'transform' : 0., 'write' : 0.}
+        self.blocked = {'read' : 0., 'transform' : 0.} # waiting to put
+        self.depths = {'read' : [], 'transform' : [], 'write' : []}
+        self.wall = 0.
+        self.in_flight = 0
+        self.lock = threading.Lock() # for busy, blocked and in_flight
+
+    def add_time(self, table, stage, seconds):
+        self.lock.acquire()
+        try:
+            table[stage] = table[stage] + seconds
+        finally:
+            self.lock.release()
+
+    def count_in_flight(self, change): # points in the workers
+        self.lock.acquire()
+        try:
+            self.in_flight = self.in_flight + change
+        finally:
+            self.lock.release()
+
+    def put(self, queue, item, stage): # blocking put, time spent blocked
+        start = time.time()
+        queue.put(item)
+        self.add_time(self.blocked, stage, time.time() - start)
+
+    def read_loop(self, jobs, read_queue): # reader thread
+        while True:
+            try:
+                job = jobs.get_nowait()
+            except Queue.Empty:
+                break
+            start = time.time()
+            try:
+                item = (job,) + tuple(read_pair(job))
+            except Exception, error: # unreadable: goes straight to writers
+                item = (job, failure(job[0], error))
+            self.add_time(self.busy, 'read', time.time() - start)
+            self.put(read_queue, item, 'read')
+
+    def write_loop(self, write_queue): # writer thread
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            job, result, text = item
+            if text is not None:
+                start = time.time()
+                if self.delta is None:
+                    result = write_text(job, text)
+                else: # text: records of the card
+                    self.lock.acquire()
+                    try:
+                        self.delta.add_records(job[0], text)
+                    finally:
+                        self.lock.release()
+                self.add_time(self.busy, 'write', time.time() - start)
+            self.results.append(result)
+
+    def transform_loop(self, read_queue, write_queue, pool):
+        # feeds the workers, at most queue_size points in flight
+        slots = threading.Semaphore(self.queue_size)
+        def done(answers, jobs): # in the pool's result thread
+            try:
+                for job, (result, text, busy) in zip(jobs, answers):
+                    self.add_time(self.busy, 'transform', busy)
+                    self.put(write_queue, (job, result, text), 'transform')
+            finally: # whatever happened, the slots are free again
+                for job in jobs:
+                    self.count_in_flight(-1)
+                    slots.release()
+        readers_done = 0
+        while readers_done < self.readers:
+            chunk = []
+            item = read_queue.get(True, forever) # with a timeout: Ctrl-C works
+            while True:
+                if item is None:
+                    readers_done = readers_done + 1
+                elif len(item) == 2: # read failure
+                    self.put(write_queue, (item[0], item[1], None),
+                        'transform')
+                else:
+                    slots.acquire()
+                    self.count_in_flight(1)
+                    chunk.append(item)
+                if len(chunk) == self.chunksize or \
+                        readers_done == self.readers:
+                    break
+                try: # only what is there already
+                    item = read_queue.get_nowait()
+                except Queue.Empty:
+                    break
+            if chunk:
+                pool.apply_async(transform_chunk, (chunk, self.options,
+                    self.strict, self.delta_directory),
+                    callback=lambda answers, jobs=[item[0] for item in chunk]:
+                        done(answers, jobs))
+        for k in range(self.queue_size): # wait for the last points
+            slots.acquire()
+
+    def monitor_loop(self, read_queue, write_queue, finished):
+        while not finished.wait(self.sample):
+            self.depths['read'].append(read_queue.qsize())
+            self.depths['transform'].append(self.in_flight)
+            self.depths['write'].append(write_queue.qsize())
+
+    def make_base(self, jobs): # convert jobs until one gives a base card
+        # for the delta store; returns the jobs left
+        for k in range(len(jobs)):
+            try:
+                item = (jobs[k],) + tuple(read_pair(jobs[k]))
+            except Exception, error:
+                self.results.append(failure(jobs[k][0], error))
+                continue
+            result, text, busy = transform_point(item, self.options,
+                self.strict)
+            self.results.append(result)
+            if text is not None:
+                self.delta.add(jobs[k][0], text)
+                return jobs[k+1:]
+        return []
+
+    def run(self, jobs): # convert all jobs, returns the list of failures
+        start = time.time()
+        if self.delta is not None:
+            if self.delta.base is None:
+                jobs = self.make_base(jobs)
+            self.delta_directory = self.delta.directory
+        job_queue = Queue.Queue()
+        for job in jobs:
+            job_queue.put(job)
+        read_queue = Queue.Queue(self.queue_size)
+        write_queue = Queue.Queue(self.queue_size)
+        self.in_flight = 0
+        finished = threading.Event()
+        pool = multiprocessing.Pool(self.processes, ignore_interrupt)
+        monitor = threading.Thread(target=self.monitor_loop,
+            args=(read_queue, write_queue, finished))
+        monitor.daemon = True
+        monitor.start()
+        writers = [threading.Thread(target=self.write_loop,
+            args=(write_queue,)) for k in range(self.writers)]
+        readers = [threading.Thread(target=self.read_loop,
+            args=(job_queue, read_queue)) for k in range(self.readers)]
+        for thread in writers + readers:
+            thread.daemon = True
+            thread.start()
+        def end_reader(thread): # each reader ends with a None
+            thread.join()
+            read_queue.put(None)
+        enders = [threading.Thread(target=end_reader, args=(thread,))
+            for thread in readers]
+        for thread in enders:
+            thread.daemon = True
+            thread.start()
+        try:
+            self.transform_loop(read_queue, write_queue, pool)
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        for thread in writers:
+            write_queue.put(None)
+        for thread in writers:
+            thread.join()
+        finished.set()
+        monitor.join()
+        if self.delta is not None:
+            self.delta.close()
+        self.wall = time.time() - start
+        return [result for result in self.results if not result[1]]
+
+    def report(self): # queue depths and stage utilization, a dictionary
+        threads = {'read' : self.readers, 'transform' : self.processes,
+            'write' : self.writers}
+        report = {'wall' : self.wall, 'points' : len(self.results),
+            'queue_size' : self.queue_size, 'stages' : dict()}
+        for stage in ['read', 'transform', 'write']:
+            depths = self.depths[stage]
+            report['stages'][stage] = {'threads' : threads[stage],
+                'utilization' : self.busy[stage]
+                    / max(self.wall*threads[stage], 1e-9),
+                'blocked' : self.blocked.get(stage, 0.),
+                'depth_mean' : sum(depths) / float(max(len(depths), 1)),
+                'depth_max' : max(depths + [0])}
+        return report
+
+def print_report(report):
+    print "%.2f s, %d points, %.1f points/s, queues of %d" % (report['wall'],
+        report['points'], report['points'] / max(report['wall'], 1e-9),
+        report['queue_size'])
+    print "stage      threads  utilization  blocked s  depth mean  depth max"
+    for stage in ['read', 'transform', 'write']:
+        item = report['stages'][stage]
+        print "%-10s %7d %12.2f %10.2f %11.1f %10d" % (stage,
+            item['threads'], item['utilization'], item['blocked'],
+            item['depth_mean'], item['depth_max'])
+
+# -------------------------------------------------------------------------- #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert a batch with overlapped read/convert/write.')
+    parser.add_argument('spectra', nargs='?',
+        help="glob of spectrum files, e.g. 'scan/spectr*.dat'")
+    parser.add_argument('outdir', help='directory for the param cards')
+    parser.add_argument('-m', '--manifest',
+        help='file listing "spectrum decay [card]" per line')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='transform worker processes (default: number of CPUs)')
+    parser.add_argument('--readers', type=int, default=4,
+        help='reader threads (default 4)')
+    parser.add_argument('--writers', type=int, default=2,
+        help='writer threads (default 2)')
+    parser.add_argument('--queue', type=int, default=64,
+        help='size of each queue (default 64 points)')
+    parser.add_argument('--chunksize', type=int, default=8,
+        help='at most this many points per worker task (default 8)')
+    parser.add_argument('--br-min', type=float, default=None,
+        help='drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays', default=None,
+        help='comma separated PDG ids: only write these DECAY tables')
+    parser.add_argument('--strict', action='store_true',
+        help='strict SLHA2: order the sfermion mass eigenstates by mass')
+    parser.add_argument('--compress', choices=sorted(formats),
+        default=None, help='write compressed cards in this format')
+    parser.add_argument('--delta', action='store_true',
+        help='outdir is a delta store (ScanDelta.py), not a card directory')
+    parser.add_argument('--report', action='store_true',
+        help='print queue depths and stage utilization')
+    parser.add_argument('--report-json', default=None,
+        help='write queue depths and stage utilization to this file')
+    parser.add_argument('--sample', type=float, default=0.1,
+        help='seconds between queue depth samples (default 0.1)')
+    args = parser.parse_args(argv)
+
+    if (args.spectra is None) == (args.manifest is None):
+        parser.error("give either a spectrum glob or --manifest")
+    if min(args.readers, args.writers, args.queue, args.chunksize) < 1:
+        parser.error("--readers, --writers, --queue and --chunksize must be "
+            "at least 1")
+    if args.delta and (args.compress is not None):
+        parser.error("--delta stores no card files to compress")
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    if args.manifest:
+        jobs = jobs_from_manifest(args.manifest, args.outdir)
+    else:
+        jobs = jobs_from_glob(args.spectra, args.outdir)
+    if not jobs:
+        print "ERROR: no input points found"
+        return 1
+    if args.compress is not None:
+        jobs = [(label, spectname, decayname,
+            writename + formats[args.compress][0])
+            for label, spectname, decayname, writename in jobs]
+    options = dict()
+    if args.br_min is not None:
+        options['br_min'] = args.br_min
+    if args.decays is not None:
+        options['decay_parents'] = set(
+            [int(item) for item in args.decays.split(',')])
+
+    delta = None
+    if args.delta:
+        delta = DeltaStore(args.outdir)
+    pipeline = Pipeline(args.readers, args.writers, args.jobs, args.queue,
+        options, args.strict, args.sample, args.chunksize, delta)
+    failed = pipeline.run(jobs)
+    print_summary(jobs, failed)
+    if args.report:
+        print_report(pipeline.report())
+    if args.report_json:
+        reportfile = open(args.report_json,'w')
+        json.dump(pipeline.report(), reportfile, indent=1, sort_keys=True)
+        reportfile.close()
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,12 +2,32 @@
 # Last updated 10 June 2012 ------------------------------------------------- #
 # Flip Tanedo (pt267@cornell.edu) ------------------------------------------ #
 # REMARKS: I haven't done any formal error handling, just printed messages
+#
+# Storage: each data line is an SLHAdatum (index tuple, value, comment) kept
+# in self.data in the order it was added, which is the order write() uses.
+# self.index maps the integer index tuple, e.g. (25,) or (3,6), to its
+# SLHAdatum so that get, exists and add_data don't scan the whole block.
+# An index that appears on several lines maps to the first of them (get
+# returns its value); the others are kept in self.repeats, and add_data
+# modifies all of them, as the old linear scan did. The index trades memory
+# for speed: a block takes about 1.5 times the memory of the old lists (see
+# BenchSLHAblock.py).
+
+class SLHAdatum(object):
+    """One line of SLHA block data: index tuple, value and comment."""
+    __slots__ = ('index', 'value', 'comment')
+
+    def __init__(self, index, value, comment):
+        self.index = index # tuple of 1 or 2 integers
+        self.value = value
+        self.comment = comment # text after the '#', no newline
 
 class SLHAblock:
     """Carries all data from a SLHA block and some tools to access them.
     
-    Attributes: input_data, name, data
-    Methods: add_line, add_data datastring, get, exists,
+    Attributes: input_data, name, data, index, repeats
+    Methods: add_line, add_tokens, add_data, add_entries, modify, datastring,
+        get, exists,
         printblock, writeblock
     """
         
@@ -15,32 +35,52 @@ class SLHAblock:
         self.input_data = input_line # save for printing purposes
         self.name = input_line.split()[1] # name of block, for ID purposes
         self.data = [] # initialize to empty list, to fill with block data
+        self.index = dict() # index tuple -> SLHAdatum, for fast lookup
+        self.repeats = None # index tuple -> later SLHAdatums, if any
         self.data_dimension = 0 # specify vector or matrix, for reading
         
     def add_line(self, input_line): # add a line of data
         # input: string containing an SLHA data line
-        if len(input_line.split('#',1)) == 2:
-            comment = input_line.split('#',1)[1].rstrip('\n')
-        else:
-            comment = ''
-        separated_data_str = input_line.split('#',1)[0].split()
-        separated_data = []
+        data_str, hash_sign, comment = input_line.partition('#')
+        self.add_tokens(data_str.split(), comment.rstrip('\n'))
+
+    def add_tokens(self, separated_data_str, comment): # add a split line
+        # input: list of index/value strings and the comment (no newline)
         if self.data_dimension == 0: # specify vector of matrix
             self.data_dimension = len(separated_data_str) - 1
         elif (len(separated_data_str)-1) != self.data_dimension:
             print "ERROR in SLHAblock.add_line(): dim doesn't match"
         if self.data_dimension == 1:
-            separated_data.append(int(separated_data_str[0]))
-            separated_data.append(float(separated_data_str[1]))
+            index = (int(separated_data_str[0]),)
+            value = float(separated_data_str[1])
         elif self.data_dimension == 2:
-            separated_data.append(int(separated_data_str[0]))
-            separated_data.append(int(separated_data_str[1]))
-            separated_data.append(float(separated_data_str[2]))
+            index = (int(separated_data_str[0]), int(separated_data_str[1]))
+            value = float(separated_data_str[2])
         else:
             print "ERROR in SLHAblock.add_line(): dimension "
             print "Dimension is " + str(self.data_dimension)
-        separated_data.append(comment) # this is now a complete line of data
-        self.data.append(separated_data)
+            return
+        datum = SLHAdatum(index, value, comment) # complete line of data
+        self.data.append(datum)
+        if index not in self.index:
+            self.index[index] = datum
+        else: # repeated line: the first one is looked up
+            if self.repeats is None:
+                self.repeats = dict()
+            self.repeats.setdefault(index, []).append(datum)
+
+    def modify(self, index, value, comment): # set every line of index
+        # returns False if the block has no such line
+        datum = self.index.get(index)
+        if datum is None:
+            return False
+        datum.value = value
+        datum.comment = comment
+        if (self.repeats is not None) and (index in self.repeats):
+            for datum in self.repeats[index]:
+                datum.value = value
+                datum.comment = comment
+        return True
         
     def add_data(self, *args): # add or modify an element
         # input: index (1 or 2) and value, optional comment (w/ leading space)
@@ -55,53 +95,44 @@ class SLHAblock:
                 print "ERROR in SLHAblock.add_data(): dims don't match"
         if self.data_dimension == 0: # this is the first data point
             self.data_dimension = num_args - 1
-        already_exists = False 
-        if (num_args - 1) == 1:
-            for datum in self.data:
-                if datum[0] == args[0]:
-                    already_exists = True
-                    datum[1] = args[1]
-                    datum[2] = comment
-        elif (num_args - 1) == 2:
-            for datum in self.data:
-                if datum[0] == args[0]:
-                    if datum[1] == args[1]:
-                        already_exists = True
-                        datum[2] = args[2]
-                        datum[3] = comment
-        else:
+        if (num_args - 1) not in (1, 2):
             print "ERROR in SLHAblock.add_data(): dim not 1 or 2"
-        if already_exists == False:
-            new_datum = []
-            for x in range(0,num_args):
-                new_datum.append(args[x])
-            new_datum.append(comment)
-            self.data.append(new_datum)
-            # self.data.append(args)
+        index = args[0:num_args-1]
+        if not self.modify(index, args[num_args-1], comment):
+            datum = SLHAdatum(index, args[num_args-1], comment)
+            self.data.append(datum)
+            self.index[index] = datum
             # Note: will not insert a leading space into the comment!
 
+    def add_entries(self, indices, values): # add or modify many elements
+        # input: list of index tuples (all 1 or all 2 long) and their values
+        if len(indices) == 0:
+            return
+        if self.data_dimension == 0:
+            self.data_dimension = len(indices[0])
+        for k in range(len(indices)):
+            if not self.modify(indices[k], values[k], ''):
+                datum = SLHAdatum(indices[k], values[k], '')
+                self.data.append(datum)
+                self.index[indices[k]] = datum
+
     def datastring(self, datum): # output string with line of data
         mydatum = 'error in SLHAblock.datastring()'
-        if len(datum) == 3:
-            mydatum = str(datum[0]).rjust(6) 
-            if datum[1] >= 0:
-                mydatum = mydatum + '     %.8E' % datum[1] 
-            else:
-                mydatum = mydatum + '    %.8E' % datum[1] 
-            mydatum  = mydatum + '   #' + str(datum[2])
-        elif len(datum) == 4:
-            mydatum = str(datum[0]).rjust(3) + str(datum[1]).rjust(3) 
-            if datum[2] >= 0:
-                mydatum = mydatum + '     %.8E' % datum[2] 
-            else:
-                mydatum = mydatum + '    %.8E' % datum[2]
-            mydatum = mydatum + '   #' + str(datum[3])
+        if len(datum.index) == 1:
+            mydatum = str(datum.index[0]).rjust(6) 
+        elif len(datum.index) == 2:
+            mydatum = str(datum.index[0]).rjust(3) + str(datum.index[1]).rjust(3) 
         else:
             print "ERROR: length of data line not 3 or 4"
+            return mydatum
+        if datum.value >= 0:
+            mydatum = mydatum + '     %.8E' % datum.value 
+        else:
+            mydatum = mydatum + '    %.8E' % datum.value 
+        mydatum  = mydatum + '   #' + str(datum.comment)
         return mydatum
             
     def get(self, *args): # retrieve data (either 1 or 2 args)
-        found_value = False
         if len(args) > 2:
             print "ERROR: only 1 or 2 arguments allowed in SLHAblock.exists"
         if len(args) == 0:
@@ -109,41 +140,21 @@ class SLHAblock:
         if len(args) != self.data_dimension:
             print "ERROR: data dim doesn't match # of args in SLHAblock.get"
         if len(args) == self.data_dimension:
-            if len(args) == 1:
-                for datum in self.data:
-                    if datum[0] == args[0]:
-                        found_value = True
-                        return datum[1]
-            if len(args) == 2:
-                for datum in self.data:
-                    if ( (datum[0] == args[0]) 
-                        & (datum[1] == args[1]) ):
-                        found_value = True
-                        return datum[2]
-            if found_value == False:
-                print self.name + " does not have an element " + str(args)
+            datum = self.index.get(args)
+            if datum is not None:
+                return datum.value
+            print self.name + " does not have an element " + str(args)
         else:
             print "ERROR in SLHAblock.get"
             
     def exists(self, *args): # check if data exists (either 1 or 2 args)
-        found_value = False
         if len(args) > 2:
             print "ERROR: only 1 or 2 arguments allowed in SLHAblock.get"
         if len(args) == 0:
             print "ERROR: at least one argument required for SLHAblock.exists"
         if len(args) != self.data_dimension:
             print "ERROR: dim doesn't match # of args in SLHAblock.exists"
-        if len(args) == self.data_dimension:
-            if len(args) == 1:
-                for datum in self.data:
-                    if datum[0] == args[0]:
-                        found_value = True
-            if len(args) == 2:
-                for datum in self.data:
-                    if ( (datum[0] == args[0]) 
-                        & (datum[1] == args[1]) ):
-                        found_value = True
-        return found_value
+        return (len(args) == self.data_dimension) and (args in self.index)
         
     def printblock(self): # print block contents
         print self.input_data.rstrip('\n')
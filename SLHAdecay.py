@@ -0,0 +1,185 @@
+# SLHAdecay: DECAY tables of an SLHA decay file ----------------------------- #
+#
+# DecayTable reads every DECAY block of a decay file (e.g. NMSSMTools
+# decayN.dat) into columnar arrays:
+#   per parent:  pdg, width, first (row of its first channel), count
+#   per channel: br, nda, start (offset of its first daughter in daughters)
+#   daughters:   all daughter PDG ids, channel after channel
+# row[pdg] gives the parent row, so a particle is found without scanning.
+# The file itself is kept as records in the order of its lines: DECAY lines
+# and channels (their text as read), and every other line (BLOCK DCINFO
+# and its entries, blank lines, comments inside and between the tables)
+# verbatim, with the table it belongs to. write() gives back the file as it
+# was read, less what it drops; relabel() changes the ids in the lines in
+# place, keeping their columns and comments.
+#
+# write() can drop channels with BR below br_min and/or keep only the
+# parents listed in `parents` (with the comments of their tables). Widths
+# are written unchanged, so after pruning the BRs of a particle no longer
+# add up to exactly one.
+
+import re
+from array import array
+
+LINE, DECAY, CHANNEL = 0, 1, 2 # kinds of records
+
+def replace_fields(line, fields): # fields: {token number : new text}
+    # new text ends where the old token ended (if the spaces before it
+    # allow), so the columns of the line stay where they were
+    data_str, hash_sign, comment = line.partition('#')
+    pieces = []
+    end = 0
+    for k, token in enumerate(re.finditer(r'\S+', data_str)):
+        if k not in fields:
+            continue
+        new = fields[k]
+        start = token.end() - len(new)
+        if start <= end or data_str[start-1:token.start()].strip() != '':
+            start = token.start() # no room: push the rest of the line
+        pieces.append(data_str[end:start])
+        pieces.append(new)
+        end = token.end()
+    pieces.append(data_str[end:])
+    return ''.join(pieces) + hash_sign + comment
+
+class DecayTable:
+    """Widths and decay channels of all particles in an SLHA decay file.
+
+    Attributes: records, lines, pdg, width, first, count, comment, header,
+        row, br, nda, start, daughters, channel_comment, channel_line
+    Methods: read, outside, get_width, channels, exists, relabel, write
+    """
+
+    def __init__(self, stream=None): # input: iterable of lines (optional)
+        self.records = [] # (kind, number, parent row or -1), in file order
+        self.lines = [] # the LINE records: other lines, verbatim
+        self.pdg = array('i') # parents ...
+        self.width = array('d')
+        self.first = array('i')
+        self.count = array('i')
+        self.comment = []
+        self.header = [] # DECAY line as read
+        self.row = dict() # parent pdg -> parent row
+        self.br = array('d') # channels ...
+        self.nda = array('i')
+        self.start = array('i')
+        self.daughters = array('i')
+        self.channel_comment = []
+        self.channel_line = [] # channel line as read
+        if stream is not None:
+            self.read(stream)
+
+    def read(self, stream): # add the decays from an iterable of lines
+        parent = -1 # row of the table being read, -1 outside the tables
+        records = self.records
+        for line in stream:
+            data_str, hash_sign, comment = line.partition('#')
+            tokens = data_str.split()
+            if tokens == []: # whitespace or comment line
+                records.append((LINE, len(self.lines), parent))
+                self.lines.append(line)
+                continue
+            key = tokens[0].upper()
+            if key == 'DECAY': # new parent
+                pdg = int(tokens[1])
+                if pdg in self.row:
+                    print "ERROR in DecayTable.read(): repeated DECAY " \
+                        + str(pdg)
+                parent = len(self.pdg)
+                records.append((DECAY, parent, parent))
+                self.row[pdg] = parent
+                self.pdg.append(pdg)
+                self.width.append(float(tokens[2]))
+                self.first.append(len(self.br))
+                self.count.append(0)
+                self.comment.append(comment.rstrip('\n'))
+                self.header.append(line)
+            elif key == 'BLOCK' or parent < 0: # not in a decay table
+                parent = -1
+                records.append((LINE, len(self.lines), parent))
+                self.lines.append(line)
+            else: # then this must be a channel: BR NDA ID1 ... IDn
+                nda = int(tokens[1])
+                if len(tokens) != nda + 2:
+                    print "ERROR in DecayTable.read(): NDA doesn't match"
+                records.append((CHANNEL, len(self.br), parent))
+                self.channel_line.append(line)
+                self.br.append(float(tokens[0]))
+                self.nda.append(nda)
+                self.start.append(len(self.daughters))
+                for item in tokens[2:2+nda]:
+                    self.daughters.append(int(item))
+                self.channel_comment.append(comment.rstrip('\n'))
+                self.count[len(self.count)-1] += 1
+
+    def outside(self): # lines outside the DECAY tables, in order
+        return [self.lines[number] for kind, number, parent in self.records
+            if kind == LINE and parent < 0]
+
+    def exists(self, pdg): # check if there is a DECAY block for pdg
+        return pdg in self.row
+
+    def get_width(self, pdg): # total width of pdg
+        if pdg not in self.row:
+            print "DecayTable does not have a DECAY " + str(pdg)
+            return None
+        return self.width[self.row[pdg]]
+
+    def channels(self, pdg): # list of (BR, daughter ids) of pdg
+        if pdg not in self.row:
+            print "DecayTable does not have a DECAY " + str(pdg)
+            return []
+        result = []
+        i = self.row[pdg]
+        for c in range(self.first[i], self.first[i] + self.count[i]):
+            start = self.start[c]
+            result.append((self.br[c],
+                tuple(self.daughters[start:start+self.nda[c]])))
+        return result
+
+    def relabel(self, mapping): # rename particles, {old pdg : new pdg}
+        # parents and daughters (antiparticles too: -old -> -new); used for
+        # the strict SLHA2 ordering of the sfermions, see Tools2Param
+        for i in range(len(self.pdg)):
+            if self.pdg[i] in mapping:
+                self.pdg[i] = mapping[self.pdg[i]]
+                self.header[i] = replace_fields(self.header[i],
+                    {1 : str(self.pdg[i])})
+        for c in range(len(self.br)):
+            fields = dict()
+            for k in range(self.nda[c]):
+                daughter = self.daughters[self.start[c] + k]
+                if abs(daughter) in mapping:
+                    new = mapping[abs(daughter)]
+                    self.daughters[self.start[c] + k] = \
+                        (new if daughter > 0 else -new)
+                    fields[2 + k] = str(self.daughters[self.start[c] + k])
+            if fields:
+                self.channel_line[c] = replace_fields(self.channel_line[c],
+                    fields)
+        self.row = dict([(self.pdg[i], i) for i in range(len(self.pdg))])
+
+    def decaystring(self, i): # DECAY line of parent row i
+        return 'DECAY ' + str(self.pdg[i]).rjust(9) \
+            + '   %.8E' % self.width[i] + '   #' + self.comment[i]
+
+    def channelstring(self, c): # data line of channel c
+        start = self.start[c]
+        mychannel = '   %.8E' % self.br[c] + str(self.nda[c]).rjust(5)
+        for daughter in self.daughters[start:start+self.nda[c]]:
+            mychannel = mychannel + str(daughter).rjust(10)
+        return mychannel + '   #' + self.channel_comment[c]
+
+    def write(self, outstream, br_min=None, parents=None):
+        # output the file as read; drop channels with BR < br_min and the
+        # tables of parents not in `parents` (a collection of pdg ids)
+        for kind, number, parent in self.records:
+            if (parents is not None) and (parent >= 0) and \
+                    (self.pdg[parent] not in parents):
+                continue
+            if kind == LINE:
+                outstream.write(self.lines[number])
+            elif kind == DECAY:
+                outstream.write(self.header[number])
+            elif (br_min is None) or (self.br[number] >= br_min):
+                outstream.write(self.channel_line[number])
@@ -0,0 +1,171 @@
+# SLHAindex: byte offset index of multi-point SLHA files ------------------- #
+#
+# Some scan tools write many SLHA points into one file, one after the other.
+# An SLHAindex memory-maps such a file and records where every point and
+# every BLOCK/DECAY in it starts, so point k (or a single block of it) can
+# be read without going through the points before it.
+#
+# A new point starts at every BLOCK SPINFO (spectrum files) or BLOCK DCINFO
+# (decay files), together with the comment lines right before it, so the
+# text of a point is exactly what NMSSMTools wrote for it. A file without
+# any marker is a single point.
+#
+# The index is kept next to the file (name + '.idx', JSON) and rebuilt when
+# the file's size or modification time changes. ranges() splits the points
+# into contiguous pieces of about the same size in bytes, for handing a big
+# file to several worker processes (see MultiScan.py).
+#
+# Example use: index = SLHAindex('scan_spectra.dat')
+#              lines = index.point_lines(12)      # e.g. for read_spectrum
+#              text = index.block_text(12, 'MASS')
+
+import os
+import re
+import json
+import mmap
+
+block_start = re.compile(r'^[ \t]*(?:BLOCK|DECAY)[ \t]+(\S+)',
+    re.MULTILINE | re.IGNORECASE)
+
+markers = {'spectrum' : 'SPINFO', 'decays' : 'DCINFO'}
+
+def point_start(data, offset): # back over the comment lines before offset
+    while offset > 0:
+        line_start = data.rfind('\n', 0, offset - 1) + 1
+        if not data[line_start:offset].lstrip().startswith('#'):
+            break
+        offset = line_start
+    return offset
+
+class SLHAindex:
+    """Offsets of the points and blocks of a multi-point SLHA file.
+
+    Attributes: filename, marker, size, points, blocks
+    Methods: build, load, save, point_text, point_lines, block_text,
+        ranges, close
+    """
+
+    def __init__(self, filename, marker='SPINFO', persist=True):
+        # marker: block name that starts a point, e.g. markers['decays']
+        self.filename = filename
+        self.marker = marker.upper()
+        self.size = 0
+        self.points = [] # start offset of every point
+        self.blocks = [] # per point: list of [block name, start offset]
+        self.data = None # the mmap, opened when needed
+        self.mtime = None
+        if not (persist and self.load()):
+            self.build()
+            if persist:
+                self.save()
+
+    def __len__(self):
+        return len(self.points)
+
+    def mapped(self): # the file as a (read only) string-like mmap
+        if self.data is None:
+            if self.size == 0:
+                return ''
+            datafile = open(self.filename,'rb')
+            try:
+                self.data = mmap.mmap(datafile.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            finally:
+                datafile.close()
+        return self.data
+
+    def build(self): # one pass over the file
+        info = os.stat(self.filename)
+        self.size = info.st_size
+        self.mtime = info.st_mtime
+        self.points = []
+        self.blocks = []
+        data = self.mapped()
+        for match in block_start.finditer(data):
+            name = match.group(1).upper()
+            if name == self.marker or not self.points:
+                if name == self.marker and self.points:
+                    self.points.append(point_start(data, match.start()))
+                else: # first point: from the top of the file
+                    self.points.append(0)
+                self.blocks.append([])
+            self.blocks[-1].append([name, match.start()])
+        if not self.points and self.size > 0:
+            self.points = [0]
+            self.blocks = [[]]
+
+    def index_name(self):
+        return self.filename + '.idx'
+
+    def load(self): # persisted index, if it is still up to date
+        if not os.path.exists(self.index_name()):
+            return False
+        info = os.stat(self.filename)
+        try:
+            index = json.load(open(self.index_name(),'r'))
+        except ValueError: # damaged, build a new one
+            return False
+        if [index['size'], index['mtime'], index['marker']] != \
+                [info.st_size, info.st_mtime, self.marker]:
+            return False
+        self.size = index['size']
+        self.mtime = index['mtime']
+        self.points = index['points']
+        self.blocks = [[[str(name), offset] for name, offset in blocks]
+            for blocks in index['blocks']]
+        return True
+
+    def save(self): # next to the file, written in one go
+        tmpname = self.index_name() + '.tmp'
+        indexfile = open(tmpname,'w')
+        json.dump({'size' : self.size, 'mtime' : self.mtime,
+            'marker' : self.marker, 'points' : self.points,
+            'blocks' : self.blocks}, indexfile)
+        indexfile.close()
+        os.rename(tmpname, self.index_name())
+
+    def point_range(self, k): # (start, end) offsets of point k
+        if k + 1 < len(self.points):
+            return self.points[k], self.points[k+1]
+        return self.points[k], self.size
+
+    def point_text(self, k): # point k as a string
+        start, end = self.point_range(k)
+        return self.mapped()[start:end]
+
+    def point_lines(self, k): # point k as a list of lines
+        return self.point_text(k).splitlines(True)
+
+    def block_text(self, k, name): # one block of point k, None if missing
+        name = name.upper()
+        blocks = self.blocks[k]
+        for n in range(len(blocks)):
+            if blocks[n][0] == name:
+                if n + 1 < len(blocks):
+                    end = blocks[n+1][1]
+                else:
+                    end = self.point_range(k)[1]
+                return self.mapped()[blocks[n][1]:end]
+        return None
+
+    def ranges(self, pieces): # split the points into contiguous pieces
+        # list of (first, last + 1) point numbers, about equal in bytes
+        ranges = []
+        first = 0
+        for n in range(1, pieces + 1):
+            target = self.size * n // pieces
+            last = first
+            while (last < len(self.points)) and \
+                    (self.point_range(last)[0] < target):
+                last = last + 1
+            if n == pieces:
+                last = len(self.points)
+            if last > first:
+                ranges.append((first, last))
+            first = last
+        return ranges
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
@@ -0,0 +1,70 @@
+# SLHAreader: streaming reader for SLHA spectrum files ---------------------- #
+#
+# read_blocks() is a generator: it goes through the file once, splits each
+# line once, and yields every SLHAblock as soon as the next BLOCK/DECAY line
+# closes it, so the whole file never has to be held as text.
+#
+# Blocks that are not wanted are skipped without being tokenized or
+# converted to floats: while skipping, a line is only checked for the start
+# of a new BLOCK/DECAY. Skipped are
+#   - blocks whose name is not in `wanted` (if a set of names is given),
+#   - blocks named in `skip` (SPINFO metadata by default),
+#   - GUT scale blocks, i.e. 'GUT' in the BLOCK line (if skip_gut),
+#   - DECAY tables (they belong in the decay file; see Tools2Param.py).
+#
+# With a ConvertStats.Stats object as `stats` the lines read, the blocks
+# parsed and the blocks dropped (GUT, SPINFO, unrecognized) are counted.
+#
+# Requires: SLHAblock.py.
+
+from SLHAblock import SLHAblock
+
+def read_blocks(stream, wanted=None, skip_gut=True, skip=('SPINFO',),
+        stats=None):
+    # input: iterable of lines, optional set of (upper case) block names
+    block = None # block being filled
+    skipping = True # nothing to keep before the first BLOCK
+    lines_read = 0 # counts for stats, kept local while reading
+    dropped = {'gut' : 0, 'spinfo' : 0, 'unrecognized' : 0}
+    blocks_parsed = 0
+    for line in stream:
+        lines_read += 1
+        if skipping:
+            head = line.lstrip()[0:5].upper()
+            if (head != 'BLOCK') and (head != 'DECAY'):
+                continue # skip this line without looking at it
+        data_str, hash_sign, comment = line.partition('#')
+        tokens = data_str.split()
+        if tokens == []: # whitespace or comment line
+            continue
+        key = tokens[0].upper()
+        if (key == 'BLOCK') or (key == 'DECAY'): # end of the current block
+            if block is not None:
+                yield block
+                block = None
+            if len(tokens) > 1:
+                name = tokens[1].upper()
+            else:
+                name = ''
+            if name in skip:
+                skipping = 'spinfo'
+            elif skip_gut and ('GUT' in line.upper()):
+                skipping = 'gut'
+            elif ( (key == 'DECAY') or (name == '') or
+                    ((wanted is not None) and (name not in wanted)) ):
+                skipping = 'unrecognized'
+            else:
+                skipping = False
+                block = SLHAblock(line)
+                blocks_parsed += 1
+            if skipping:
+                dropped[skipping] += 1
+        else: # then this must be data
+            block.add_tokens(tokens, comment.rstrip('\n'))
+    if block is not None:
+        yield block
+    if stats is not None:
+        stats.count('lines_read', lines_read)
+        stats.count('blocks_parsed', blocks_parsed)
+        for reason, number in dropped.iteritems():
+            stats.count('blocks_dropped_' + reason, number)
@@ -0,0 +1,174 @@
+# ScanArrays: numpy arrays over a batch of points --------------------------- #
+#
+# Array-backed view of the matrix (2-index) and vector blocks, and the
+# Tools2Param transforms (the TransformPlan of Tools2Param.py, see
+# TransformPlan.py) done for N points at once on stacked (N, k) arrays
+# instead of a python loop per point: 'product' and 'square' entries are
+# computed for all points with one numpy operation each. convert_batch()
+# puts the results back into the block dictionaries in the same order as
+# TransformPlan.apply, so the cards are identical. order_batch() is the
+# strict SLHA2 mass ordering (Tools2Param.order_sfermions) for N points: one
+# stable argsort per mixing block sorts the masses of all points, and only
+# the points out of order are permuted.
+#
+# Requires: numpy, SLHAblock.py, Tools2Param.py, TransformPlan.py.
+
+import numpy
+from Tools2Param import transform_plan, sfermion_states, reorder_states
+
+# -------------------------------------------------------------------------- #
+
+def block_matrix(block, rows, columns): # matrix block -> (values, present)
+    values, present = stack_matrices([{'M' : block}], 'M', rows, columns)
+    return values[0], present[0]
+
+def stack_matrices(dictionaries, name, rows, columns):
+    # block `name` of N points -> (N, rows, columns) values and present mask
+    indices = [(i, j) for i in range(1, rows+1) for j in range(1, columns+1)]
+    values, present = stack_entries(dictionaries, name, indices)
+    return (values.reshape((len(dictionaries), rows, columns)),
+        present.reshape((len(dictionaries), rows, columns)))
+
+def stack_entries(dictionaries, name, indices):
+    # selected entries (list of index tuples) of block `name` of N points
+    # -> (N, len(indices)) values and present mask. Filled from python
+    # lists: indexing numpy arrays element by element is slow
+    values = []
+    present = []
+    for block_dictionary in dictionaries:
+        if name in block_dictionary:
+            block_index = block_dictionary[name].index
+        else:
+            block_index = {}
+        for index in indices:
+            datum = block_index.get(index)
+            if datum is not None:
+                values.append(datum.value)
+                present.append(True)
+            else:
+                values.append(0.)
+                present.append(False)
+    shape = (len(dictionaries), len(indices))
+    return (numpy.array(values, dtype=float).reshape(shape),
+        numpy.array(present, dtype=bool).reshape(shape))
+
+# -------------------------------------------------------------------------- #
+
+def squares(values): # soft masses squared for all points
+    # numpy.power(x, 2.0) rounds like pow(x,2) in convert_blocks, x*x doesn't
+    return numpy.power(values, 2.0)
+
+# -------------------------------------------------------------------------- #
+
+def plan_columns(dictionaries, entries):
+    # the entries of one target block (see TransformPlan) for N points:
+    # list over entries of (values, present, required); values is an (N,)
+    # array or, for constants, the constant itself
+    sources = dict() # source block -> list of source indices
+    for target_index, operation, names, source in entries:
+        if operation != 'constant':
+            for name in names:
+                sources.setdefault(name, [])
+                if source not in sources[name]:
+                    sources[name].append(source)
+    stacked = dict() # source block -> (values, present, column of index)
+    for name, indices in sources.items():
+        values, present = stack_entries(dictionaries, name, indices)
+        stacked[name] = (values, present,
+            dict([(indices[k], k) for k in range(len(indices))]))
+    all_present = numpy.ones(len(dictionaries), dtype=bool)
+    columns = []
+    for target_index, operation, names, source in entries:
+        if operation == 'constant':
+            columns.append((source, all_present, False))
+            continue
+        values = None
+        present = all_present
+        for name in names:
+            name_values, name_present, column = stacked[name]
+            k = column[source]
+            if values is None:
+                values = name_values[:, k]
+            else:
+                values = values * name_values[:, k]
+            present = present & name_present[:, k]
+        if operation == 'square':
+            values = squares(values)
+        columns.append((values, present, operation == 'copy'))
+    return columns
+
+def convert_batch(dictionaries, verbose=False, plan=transform_plan):
+    # convert_blocks for a list of block dictionaries at once. Points missing
+    # an entry the plan needs ('copy', e.g. an incomplete 2x2 sfermion mixing
+    # block) are left untouched and flagged; returns (N,) bool array, True
+    # where the point was converted
+    ok = numpy.ones(len(dictionaries), dtype=bool)
+    targets = []
+    for target, entries in plan.blocks:
+        columns = plan_columns(dictionaries, entries)
+        # back into python lists: numpy element access is slow
+        constant = []
+        values = []
+        present = []
+        for column_values, column_present, required in columns:
+            if required:
+                ok = ok & column_present
+            if isinstance(column_values, numpy.ndarray):
+                constant.append(False)
+                values.append(column_values.tolist())
+            else:
+                constant.append(True)
+                values.append(column_values)
+            present.append(column_present.tolist())
+        targets.append((target, [entry[0] for entry in entries], constant,
+            values, present))
+
+    ok_list = ok.tolist()
+    for n in range(len(dictionaries)):
+        if not ok_list[n]:
+            continue
+        block_dictionary = dictionaries[n]
+        for target, indices, constant, values, present in targets:
+            block = plan.new_block(block_dictionary, target, verbose)
+            block_indices = []
+            block_values = []
+            for k in range(len(indices)):
+                if present[k][n]:
+                    block_indices.append(indices[k])
+                    if constant[k]:
+                        block_values.append(values[k])
+                    else:
+                        block_values.append(values[k][n])
+            block.add_entries(block_indices, block_values)
+    return ok
+
+# -------------------------------------------------------------------------- #
+
+def order_batch(dictionaries, states_table=sfermion_states):
+    # order_sfermions for a list of converted block dictionaries at once.
+    # Returns a list of {old pdg : new pdg} (empty if the point was already
+    # in order), None for a point missing a MASS entry (left untouched).
+    # The masses of all points are sorted with one argsort per mixing block;
+    # only the points whose order changes are rewritten, entry by entry
+    # (the mixing blocks are sparse, a dense (N, 6, 6) permutation is
+    # slower to get back into the blocks)
+    npoints = len(dictionaries)
+    stacked = []
+    complete = numpy.ones(npoints, dtype=bool)
+    for name, states in states_table:
+        masses, present = stack_entries(dictionaries, 'MASS',
+            [(pdg,) for pdg in states])
+        complete = complete & present.all(axis=1)
+        stacked.append(masses)
+    relabels = [dict() for n in range(npoints)]
+    for (name, states), masses in zip(states_table, stacked):
+        order = numpy.argsort(masses, axis=1, kind='mergesort') # stable
+        moved = numpy.flatnonzero(complete &
+            (order != numpy.arange(len(states))).any(axis=1))
+        if len(moved) == 0:
+            continue
+        for n, point_order in zip(moved.tolist(), order[moved].tolist()):
+            relabels[n].update(reorder_states(dictionaries[n], name, states,
+                point_order))
+    complete = complete.tolist()
+    return [(relabels[n] if complete[n] else None) for n in range(npoints)]
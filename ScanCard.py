@@ -0,0 +1,331 @@
+#! /usr/bin/env python
+# ScanCard.py
+#
+# Writes a whole batch of points as ONE MadGraph param card in scan syntax,
+# so that MadGraph is launched once for the batch instead of once per card:
+#      1    scan1:[1.23400000E+02, 1.25600000E+02, ...]   # comment
+# Every entry (block, index) whose value differs between the points is
+# written this way; everything the points share is written once, in the
+# usual write_blocks order. All entries use the same scan id, so MadGraph
+# steps through them together: the k-th run is the k-th point. The labels
+# of the points are listed, in that order, in a comment at the top.
+#
+# Decays: a width that differs between the points is scanned the same way
+# (DECAY 1000022 scan1:[...]). With --auto-width the chosen particles get
+# 'DECAY pdg Auto' instead and MadGraph computes their widths. Branching
+# ratios cannot be scanned: they are written when they are the same for
+# all points, else left out (MadGraph only needs the widths to generate
+# events; keep the per-point cards for anything that reads the BRs).
+#
+# A scan card needs the points to have the same blocks with the same
+# entries, and the same decay tables (particles and channels, after
+# --br-min/--decays-of). If they don't, one card per point is written
+# instead, as BatchScan.py does (into --fallback, by default the directory
+# of the scan card), from the converted points: they are kept in memory
+# until the scan card is written. BLOCK lines, with their Q scale, and
+# comments are those of the first point; MadGraph does not use the scale.
+#
+# Requires: Tools2Param.py, SLHAblock.py, SLHAdecay.py, BatchScan.py.
+#
+# Example use: python ScanCard.py 'scan/spectr*.dat' param_card_scan.dat
+#              python ScanCard.py -m manifest.txt scan_card.dat \
+#                  --auto-width 1000022,1000023
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import argparse
+import multiprocessing
+from SLHAblock import SLHAblock
+from SLHAdecay import DecayTable
+from Tools2Param import convert_blocks, write_blocks, card_header
+from CompressedIO import open_input, open_output
+from BatchScan import jobs_from_glob, jobs_from_manifest, load_point, \
+    failure, write_point, print_summary
+
+def scan_values(scan_id, values): # 'scan1:[1.00000000E+00, ...]'
+    return 'scan' + str(scan_id) + ':[' \
+        + ', '.join(['%.8E' % value for value in values]) + ']'
+
+class ScanBlock(SLHAblock):
+    """SLHAblock of a scan card: the scanned entries are written in
+    MadGraph scan syntax, the others as usual.
+
+    Attributes: scans, scan_id (and those of SLHAblock)
+    Methods: datastring (and those of SLHAblock)
+    """
+
+    def __init__(self, block, scans, scan_id=1):
+        # block: the SLHAblock of the first point, shared, not copied
+        # scans: index tuple -> list of the values of all points
+        SLHAblock.__init__(self, block.input_data)
+        self.data = block.data
+        self.index = block.index
+        self.repeats = block.repeats
+        self.data_dimension = block.data_dimension
+        self.scans = scans
+        self.scan_id = scan_id
+
+    def datastring(self, datum): # output string with line of data
+        if datum.index not in self.scans:
+            return SLHAblock.datastring(self, datum)
+        if len(datum.index) == 1: # index columns as in SLHAblock
+            mydatum = str(datum.index[0]).rjust(6)
+        else:
+            mydatum = str(datum.index[0]).rjust(3) \
+                + str(datum.index[1]).rjust(3)
+        return mydatum + '    ' \
+            + scan_values(self.scan_id, self.scans[datum.index]) \
+            + '   #' + str(datum.comment)
+
+# -------------------------------------------------------------------------- #
+
+class ScanCard:
+    """Points of a batch collected into one scan card.
+
+    Attributes: labels, blocks, decays, scans, widths, varying_brs,
+        mismatch, scan_id
+    Methods: add, write
+    """
+
+    def __init__(self, br_min=None, decay_parents=None, scan_id=1):
+        self.br_min = br_min
+        self.decay_parents = decay_parents
+        self.scan_id = scan_id
+        self.labels = [] # points in the order of the scan
+        self.blocks = None # write_blocks of the first point
+        self.decays = None # DecayTable of the first point
+        self.structure = None # what all points must share, see below
+        self.reference = dict() # (block, index) or pdg -> '%.8E' of point 0
+        self.scans = dict() # (block, index) -> values, varying entries only
+        self.widths = dict() # pdg -> widths, varying widths only
+        self.varying_brs = set() # parents whose BRs differ between points
+        self.mismatch = None # why the points don't fit one card
+
+    def decay_channels(self, decays): # [(row, [channel rows kept])]
+        kept = []
+        for i in range(len(decays.pdg)):
+            if (self.decay_parents is not None) and \
+                    (decays.pdg[i] not in self.decay_parents):
+                continue
+            kept.append((i, [c for c in range(decays.first[i],
+                decays.first[i] + decays.count[i])
+                if (self.br_min is None) or (decays.br[c] >= self.br_min)]))
+        return kept
+
+    def add(self, label, block_dictionary, decays):
+        # add a converted point and its DecayTable; returns False (and sets
+        # mismatch) if it doesn't fit the points added before
+        if self.mismatch is not None:
+            return False
+        kept = self.decay_channels(decays)
+        structure = ([(name, [datum.index for datum in
+                block_dictionary[name].data]) for name in write_blocks],
+            [(decays.pdg[i], [decays.daughters[decays.start[c]:
+                decays.start[c] + decays.nda[c]] for c in channels])
+                for i, channels in kept])
+        npoints = len(self.labels)
+        if npoints == 0:
+            self.structure = structure
+            self.blocks = dict([(name, block_dictionary[name])
+                for name in write_blocks])
+            self.decays = decays
+        elif structure != self.structure:
+            if structure[0] != self.structure[0]:
+                self.mismatch = 'point ' + label + ' has other block entries'
+            else:
+                self.mismatch = 'point ' + label + ' has other decay tables'
+            return False
+        self.labels.append(label)
+
+        for name in write_blocks:
+            for datum in block_dictionary[name].data:
+                self.compare((name, datum.index), datum.value, npoints,
+                    self.scans)
+        for i, channels in kept:
+            pdg = decays.pdg[i]
+            self.compare(pdg, decays.width[i], npoints, self.widths)
+            if pdg in self.varying_brs:
+                continue
+            for k in range(len(channels)):
+                value = '%.8E' % decays.br[channels[k]]
+                if self.reference.setdefault((pdg, k), value) != value:
+                    self.varying_brs.add(pdg)
+        return True
+
+    def compare(self, key, value, npoints, scans):
+        # record value of point npoints; a value that differs from the first
+        # point's (as written, '%.8E') turns the entry into a scan
+        if key in scans:
+            scans[key].append(value)
+            return
+        text = '%.8E' % value
+        first = self.reference.setdefault(key, text)
+        if text != first: # all points so far had the first value
+            scans[key] = [float(first)]*npoints + [value]
+
+    def write(self, writefile, auto_width=None):
+        # auto_width: collection of pdg ids (or 'all') written as Auto
+        writefile.write(card_header.rstrip('\n') + '\n') # then the scan
+        writefile.write("# MadGraph scan over " + str(len(self.labels))
+            + " points, run k is point k of\n")
+        writefile.write("# scan" + str(self.scan_id) + " points: "
+            + ' '.join(self.labels) + "\n")
+        writefile.write("\n")
+
+        for name in write_blocks:
+            scans = dict([(index, values) for (block, index), values
+                in self.scans.items() if block == name])
+            ScanBlock(self.blocks[name], scans, self.scan_id).write(writefile)
+            writefile.write('\n')
+
+        writefile.write('\n')
+        writefile.write("########################################################\n")
+        writefile.write("## DECAY TABLE, widths scanned by Tools2Param         ##\n")
+        writefile.write("########################################################\n")
+        writefile.write('\n')
+        decays = self.decays
+        for line in decays.outside():
+            writefile.write(line)
+        for i, channels in self.decay_channels(decays):
+            pdg = decays.pdg[i]
+            if (auto_width == 'all') or \
+                    ((auto_width is not None) and (pdg in auto_width)):
+                writefile.write('DECAY ' + str(pdg).rjust(9) + '   Auto'
+                    + '   #' + decays.comment[i] + '\n')
+                continue
+            if pdg in self.widths:
+                writefile.write('DECAY ' + str(pdg).rjust(9) + '   '
+                    + scan_values(self.scan_id, self.widths[pdg])
+                    + '   #' + decays.comment[i] + '\n')
+            else:
+                writefile.write(decays.decaystring(i) + '\n')
+            if pdg in self.varying_brs:
+                writefile.write('# branching ratios differ between the '
+                    'points, not written\n')
+                continue
+            writefile.write('#          BR         NDA      ID1       ID2\n')
+            for c in channels:
+                writefile.write(decays.channelstring(c) + '\n')
+
+# -------------------------------------------------------------------------- #
+
+def load_scan_point(job): # run in a worker: (label, blocks, decays) or failure
+    try:
+        block_dictionary = load_point(job)
+        convert_blocks(block_dictionary, verbose=False)
+        decayfile = open_input(job[2])
+        try:
+            decays = DecayTable(decayfile)
+        finally:
+            decayfile.close()
+    except Exception, error: # isolate the failure to this point
+        return failure(job[0], error)
+    return (job[0], dict([(name, block_dictionary[name])
+        for name in write_blocks]), decays)
+
+def collect(jobs, processes=None, br_min=None, decay_parents=None):
+    # returns (ScanCard, list of points, list of failed results); points:
+    # (label, blocks, decays) of every point that was converted, also those
+    # after a mismatch (see ScanCard.mismatch), for write_fallback
+    card = ScanCard(br_min, decay_parents)
+    points = []
+    failed = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(load_scan_point, jobs, 16):
+            if len(result) != 3:
+                failed.append(result)
+                continue
+            points.append(result)
+            card.add(*result) # nothing more after a mismatch
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return card, points, failed
+
+def write_fallback(jobs, points, options={}):
+    # one card per point, as BatchScan.py writes them, from the converted
+    # points; returns the list of failed results
+    jobs = dict([(job[0], job) for job in jobs])
+    failed = []
+    for label, blocks, decays in points:
+        result = write_point(jobs[label], blocks, options)
+        if not result[1]:
+            failed.append(result)
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write a batch of points as one MadGraph scan card.')
+    parser.add_argument('spectra', nargs='?',
+        help="glob of spectrum files, e.g. 'scan/spectr*.dat'")
+    parser.add_argument('card', help='the scan param card to write')
+    parser.add_argument('-m', '--manifest',
+        help='file listing "spectrum decay [card]" per line')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--auto-width', default=None,
+        help="comma separated PDG ids, or 'all': write DECAY pdg Auto")
+    parser.add_argument('--br-min', type=float, default=None,
+        help='drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays-of', default=None,
+        help='comma separated PDG ids: only write these DECAY tables')
+    parser.add_argument('--fallback', default=None,
+        help='directory for per-point cards if the points do not fit one '
+            'scan card (default: the directory of the card)')
+    args = parser.parse_args(argv)
+
+    if (args.spectra is None) == (args.manifest is None):
+        parser.error("give either a spectrum glob or --manifest")
+    fallback = args.fallback
+    if fallback is None:
+        fallback = os.path.dirname(os.path.abspath(args.card))
+    if args.manifest:
+        jobs = jobs_from_manifest(args.manifest, fallback)
+    else:
+        jobs = jobs_from_glob(args.spectra, fallback)
+    if not jobs:
+        print "ERROR: no input points found"
+        return 1
+    options = dict()
+    if args.br_min is not None:
+        options['br_min'] = args.br_min
+    if args.decays_of is not None:
+        options['decay_parents'] = set(
+            [int(item) for item in args.decays_of.split(',')])
+    auto_width = args.auto_width
+    if (auto_width is not None) and (auto_width != 'all'):
+        auto_width = set([int(item) for item in auto_width.split(',')])
+
+    card, points, failed = collect(jobs, args.jobs, **options)
+    if not card.labels:
+        print_summary(jobs, failed)
+        return 1
+    if card.mismatch is None:
+        writefile = open_output(args.card)
+        try:
+            card.write(writefile, auto_width)
+        finally:
+            writefile.close()
+        print_summary(jobs, failed)
+        print str(len(card.labels)) + " points in " + args.card + ", " \
+            + str(len(card.scans)) + " entries and " + str(len(card.widths)) \
+            + " widths scanned"
+    else:
+        print "WARNING: " + str(card.mismatch) + ", writing one card per " \
+            "point to " + fallback
+        if not os.path.isdir(fallback):
+            os.makedirs(fallback)
+        failed = failed + write_fallback(jobs, points, options)
+        print_summary(jobs, failed)
+    if failed:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# ScanColumns: columnar store of the converted parameters of a scan -------- #
+#
+# Every (block, index) entry written to the param cards, e.g. MASS[25],
+# NMHMIX[1,3] or TU[3,3], becomes one column with a value for every point
+# of the scan, so a scan can be plotted or filtered without re-reading the
+# cards. The columns come from the same block dictionary and the same
+# write_blocks list that Tools2Param.write_card uses.
+#
+# Layout of a store directory:
+#   columns.json     manifest: number of points, byte order, column names
+#   points.txt       point labels, one per line, in column order
+#   MASS_25.f8 ...   one file of raw float64 values per column
+# Missing entries are NaN. Points are buffered and appended to the files
+# in chunks, so memory stays bounded for any number of points; a store can
+# be reopened and extended, also on a machine of the other byte order (the
+# values are swapped to the order of the store). With numpy a column reads as
+#   numpy.fromfile('store/MASS_25.f8', dtype='<f8')   (see byteorder)
+#
+# Requires: Tools2Param.py, SLHAblock.py.
+
+import os
+import sys
+import json
+from array import array
+from Tools2Param import write_blocks
+
+nan = float('nan')
+
+def column_name(block_name, index): # ('NMHMIX', (1,3)) -> 'NMHMIX[1,3]'
+    return block_name + '[' + ','.join([str(i) for i in index]) + ']'
+
+def column_file(name): # 'NMHMIX[1,3]' -> 'NMHMIX_1_3.f8'
+    return name.replace('[','_').replace(',','_').rstrip(']') + '.f8'
+
+def card_columns(block_dictionary, blocks=write_blocks):
+    # list of (column name, value) of everything write_card writes
+    columns = []
+    for block_name in blocks:
+        if block_name not in block_dictionary:
+            continue
+        block = block_dictionary[block_name]
+        for datum in block.data:
+            if block.index.get(datum.index) is datum: # skip repeated lines
+                columns.append((column_name(block_name, datum.index),
+                    float(datum.value)))
+    return columns
+
+# -------------------------------------------------------------------------- #
+
+class ColumnWriter:
+    """Appends points to a columnar store directory, chunk by chunk.
+
+    Attributes: directory, chunk_points, columns, npoints, byteorder
+    Methods: add_point, add_columns, flush, close
+    """
+
+    def __init__(self, directory, chunk_points=1000):
+        self.directory = directory
+        self.chunk_points = chunk_points # points buffered before writing
+        self.columns = [] # column names, in order of appearance
+        self.npoints = 0 # points written to the files
+        self.byteorder = sys.byteorder # of the values in the files
+        self.labels = [] # buffered ...
+        self.buffer = dict() # column name -> array('d')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        manifest = os.path.join(directory, 'columns.json')
+        if os.path.exists(manifest): # reopen to extend
+            info = json.load(open(manifest,'r'))
+            self.byteorder = str(info['byteorder'])
+            self.columns = [str(name) for name in info['columns']]
+            self.npoints = info['npoints']
+        for name in self.columns:
+            self.buffer[name] = array('d')
+
+    def add_columns(self, label, columns): # columns: list of (name, value)
+        position = len(self.labels)
+        for name, value in columns:
+            if name not in self.buffer: # new column: NaN for earlier points
+                self.columns.append(name)
+                self.buffer[name] = array('d', [nan]*position)
+                columnfile = open(os.path.join(self.directory,
+                    column_file(name)),'wb')
+                self.write_values(columnfile, array('d', [nan]*self.npoints))
+                columnfile.close()
+            column = self.buffer[name]
+            if len(column) == position:
+                column.append(value)
+        self.labels.append(str(label))
+        for name in self.columns: # NaN for entries this point doesn't have
+            column = self.buffer[name]
+            if len(column) == position:
+                column.append(nan)
+        if len(self.labels) >= self.chunk_points:
+            self.flush()
+
+    def add_point(self, label, block_dictionary): # one converted point
+        self.add_columns(label, card_columns(block_dictionary))
+
+    def flush(self): # append the buffered chunk to the files
+        if self.labels == []:
+            return
+        for name in self.columns:
+            columnfile = open(os.path.join(self.directory,
+                column_file(name)),'ab')
+            self.write_values(columnfile, self.buffer[name])
+            columnfile.close()
+            self.buffer[name] = array('d')
+        pointfile = open(os.path.join(self.directory, 'points.txt'),'a')
+        for label in self.labels:
+            pointfile.write(label + '\n')
+        pointfile.close()
+        self.npoints = self.npoints + len(self.labels)
+        self.labels = []
+        self.write_manifest()
+
+    def write_values(self, columnfile, values): # in the store's byte order
+        if self.byteorder != sys.byteorder:
+            values = array('d', values)
+            values.byteswap()
+        values.tofile(columnfile)
+
+    def write_manifest(self):
+        info = {'npoints' : self.npoints, 'byteorder' : self.byteorder,
+            'dtype' : 'float64', 'columns' : self.columns}
+        tmpname = os.path.join(self.directory, 'columns.json.tmp')
+        manifest = open(tmpname,'w')
+        json.dump(info, manifest, indent=1)
+        manifest.close()
+        os.rename(tmpname, os.path.join(self.directory, 'columns.json'))
+
+    def close(self):
+        self.flush()
+        self.write_manifest()
+
+# -------------------------------------------------------------------------- #
+
+def read_labels(directory): # point labels of a store, in column order
+    return [line.rstrip('\n') for line in
+        open(os.path.join(directory, 'points.txt'),'r')]
+
+def read_columns(directory, names=None):
+    # dict column name -> array('d') with one value per point
+    info = json.load(open(os.path.join(directory, 'columns.json'),'r'))
+    if names is None:
+        names = [str(name) for name in info['columns']]
+    columns = dict()
+    for name in names:
+        column = array('d')
+        columnfile = open(os.path.join(directory, column_file(name)),'rb')
+        column.fromfile(columnfile, info['npoints'])
+        columnfile.close()
+        if info['byteorder'] != sys.byteorder:
+            column.byteswap()
+        columns[name] = column
+    return columns
@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+# ScanDedup.py
+#
+# Finds param cards that say the same thing: coarse grids and repeated
+# seeds give many points whose cards differ only in comments or in the
+# order of the lines, and there is no point in running MadGraph on each.
+#
+# The fingerprint of a card is a SHA-1 over its canonical content:
+#   - every BLOCK (but SPINFO/DCINFO metadata): name, scale Q and the
+#     (index, value) entries, sorted, values as '%.8E' like
+#     SLHAblock.datastring
+#   - every DECAY: PDG id, width and the channels (BR, sorted daughters),
+#     sorted, numbers as '%.8E'
+# Comments, blank lines and the order of blocks, entries and channels don't
+# matter. Cards with the same fingerprint form a class; the first card of a
+# class (in natural order: param_card2 before param_card10) represents it.
+#
+# The mapping file (dedup_map.txt) has one line per card:
+#   card  representative  fingerprint
+#
+# On an existing output directory:
+#   python ScanDedup.py cards/                  writes cards/dedup_map.txt
+#   python ScanDedup.py cards/ --into unique/   one card per class in unique/
+#   python ScanDedup.py cards/ --remove         deletes the duplicates
+# During conversion: BatchScan.py --dedup, see there.
+#
+# Requires: SLHAreader.py, SLHAblock.py, CompressedIO.py.
+
+# -------------------------------------------------------------------------- #
+
+import os
+import re
+import sys
+import glob
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from SLHAreader import read_blocks
+from CompressedIO import open_input, strip_extension
+
+def block_scale(block): # ' Q=%.8E' for a BLOCK ... Q= scale line, or ''
+    header = ''.join(block.input_data.partition('#')[0].split()[2:])
+    if header.upper().startswith('Q='):
+        try:
+            return ' Q=' + '%.8E' % float(header[2:])
+        except ValueError:
+            pass
+    return ''
+
+def decay_tables(lines): # list of ('DECAY pdg width', [(daughters, BR)])
+    # like SLHAdecay.DecayTable.read, but keeps only what the fingerprint
+    # needs (DecayTable takes longer than the conversion of the point)
+    tables = []
+    channels = None
+    for line in lines:
+        if channels is None and line.lstrip()[0:5].upper() != 'DECAY':
+            continue # not in a DECAY table yet
+        tokens = line.partition('#')[0].split()
+        if tokens == []: # whitespace or comment line
+            continue
+        key = tokens[0].upper()
+        if key == 'DECAY':
+            channels = []
+            tables.append(('DECAY %d %.8E' % (int(tokens[1]),
+                float(tokens[2])), channels))
+        elif key == 'BLOCK': # a table ends at the next BLOCK
+            channels = None
+        else:
+            channels.append((sorted([int(i) for i in tokens[2:]]),
+                '%.8E' % float(tokens[0])))
+    return tables
+
+def canonical_card(lines): # canonical text of a card (list of lines)
+    text = []
+    blocks = read_blocks(lines, skip_gut=False, skip=('SPINFO', 'DCINFO'))
+    for block in sorted(blocks, key=lambda block: block.name.upper()):
+        entries = sorted([(datum.index, '%.8E' % datum.value)
+            for datum in block.data])
+        text.append('BLOCK ' + block.name.upper() + block_scale(block)
+            + '\n' + ''.join(
+            [' '.join([str(i) for i in index]) + ' ' + value + '\n'
+                for index, value in entries]))
+    for decay, channels in sorted(decay_tables(lines)):
+        channels.sort()
+        text.append(decay + '\n' + ''.join([value + ' '
+            + ' '.join([str(i) for i in daughters]) + '\n'
+                for daughters, value in channels]))
+    return ''.join(text)
+
+def card_fingerprint(lines): # SHA-1 of the canonical text
+    return hashlib.sha1(canonical_card(lines)).hexdigest()
+
+def file_fingerprint(cardname): # fingerprint of a card file (may be .gz)
+    cardfile = open_input(cardname)
+    try:
+        return card_fingerprint(cardfile.readlines())
+    finally:
+        cardfile.close()
+
+def natural_key(name): # 'param_card10.dat' after 'param_card2.dat'
+    return [(int(part) if part.isdigit() else part)
+        for part in re.split(r'(\d+)', name)]
+
+def group(fingerprints): # list of (name, fingerprint) -> list of classes
+    # each class a list of names, the representative first
+    classes = dict()
+    order = []
+    for name, fingerprint in sorted(fingerprints,
+            key=lambda item: natural_key(item[0])):
+        if fingerprint not in classes:
+            classes[fingerprint] = []
+            order.append(fingerprint)
+        classes[fingerprint].append(name)
+    return [(fingerprint, classes[fingerprint]) for fingerprint in order]
+
+def write_mapping(filename, classes): # dedup_map.txt, see above
+    mapfile = open(filename,'w')
+    mapfile.write('# card  representative  fingerprint\n')
+    for fingerprint, names in classes:
+        for name in names:
+            mapfile.write(name + ' ' + names[0] + ' ' + fingerprint + '\n')
+    mapfile.close()
+
+def read_mapping(filename): # dedup_map.txt -> dict card -> representative
+    # cards are keyed without a compression extension: 'param_card3.dat'
+    mapping = dict()
+    for line in open(filename,'r'):
+        fields = line.split()
+        if len(fields) < 2 or fields[0].startswith('#'):
+            continue
+        mapping[strip_extension(fields[0])] = fields[1]
+    return mapping
+
+# -------------------------------------------------------------------------- #
+
+def dedup_directory(directory, pattern='param_card*', into=None,
+        remove=False, processes=None): # returns the list of classes
+    names = [os.path.basename(name) for name in
+        glob.glob(os.path.join(directory, pattern))
+        if not (name.endswith('.tmp') or name.endswith('.txt'))]
+    pool = multiprocessing.Pool(processes)
+    try:
+        fingerprints = pool.map(file_fingerprint,
+            [os.path.join(directory, name) for name in names])
+        pool.close()
+    finally:
+        pool.join()
+    classes = group(zip(names, fingerprints))
+    mapdir = directory
+    if into is not None:
+        if not os.path.isdir(into):
+            os.makedirs(into)
+        for fingerprint, members in classes:
+            shutil.copyfile(os.path.join(directory, members[0]),
+                os.path.join(into, members[0]))
+        mapdir = into
+    elif remove:
+        for fingerprint, members in classes:
+            for name in members[1:]:
+                os.remove(os.path.join(directory, name))
+    write_mapping(os.path.join(mapdir, 'dedup_map.txt'), classes)
+    return classes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Group param cards with the same content.')
+    parser.add_argument('directory', help='directory of param cards')
+    parser.add_argument('--pattern', default='param_card*',
+        help="which files are cards (default 'param_card*')")
+    parser.add_argument('--into', default=None,
+        help='copy one card per class into this directory')
+    parser.add_argument('--remove', action='store_true',
+        help='delete the duplicate cards in place')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    classes = dedup_directory(args.directory, args.pattern, args.into,
+        args.remove, args.jobs)
+    ncards = sum([len(members) for fingerprint, members in classes])
+    print str(ncards) + " cards, " + str(len(classes)) + " different"
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
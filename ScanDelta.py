@@ -0,0 +1,420 @@
+#! /usr/bin/env python
+# ScanDelta.py
+#
+# Base-plus-delta storage of the param cards of a scan. The cards of a scan
+# are mostly the same text: the same blocks, entries, comments and decay
+# channels, many of them with the same values (SMINPUTS, VCKM, UPMNS,
+# SNUMIX, ...). A delta store keeps the first card in full (the base) and,
+# for every other card, only what differs from it:
+#
+#   = 12 40          lines 12 to 51 of the base, unchanged
+#   ~ 17|1.25E+02|...   lines 17, 18, ... of the base with new values
+#   +   25  1.2 ...  a line that is not in the base (or not only its value)
+#
+# Lines are matched to the base by what they are, not where they are:
+# (block, index) for block entries, the particle for DECAY lines, (parent,
+# the rest of the line after the BR) for decay channels, the text itself
+# for comments. So a card with other decay channels still shares all the
+# rest with the base. The value of a line is the number that changes from
+# point to point: the entry of a block line, the width of a DECAY line,
+# the BR of a channel, the Q scale of a BLOCK line; a value is stored with
+# the spaces before it when those differ from the base's (a minus sign
+# takes the place of a space). Values are kept as text, so a card comes
+# back byte for byte the same as the one given.
+#
+# Layout of a store directory:
+#   base.dat     the base card
+#   deltas.dat   per card "@ label lines" and its records, in order added
+#   index.json   label -> byte offset and length in deltas.dat
+# A store can be reopened and extended. Cards are added by
+# Pipeline.py --delta (instead of writing card files), or packed from a
+# directory of cards:
+#
+#   python ScanDelta.py pack 'cards/param_card*.dat' store/
+#   python ScanDelta.py unpack store/ cards/ [labels]   (all if none given)
+#   python ScanDelta.py show store/ 12                  (to stdout)
+#
+# Example use: store = DeltaStore('store/')
+#              text = store.card('12')
+
+# -------------------------------------------------------------------------- #
+
+import os
+import re
+import sys
+import glob
+import json
+import bisect
+import argparse
+from CompressedIO import open_input, open_output, strip_extension
+
+token = re.compile(r'\S+')
+scale = re.compile(r'Q=\s*(\S+)', re.IGNORECASE)
+
+def line_key(line, section):
+    # (key, start, end, section) of a card line: start:end is its value in
+    # line, from the end of the token before it, so with the spaces before
+    # it (None if it has none); section is ('block', name), ('decay',
+    # pdg) or None, the one the line is in (for the next line)
+    body = line.split('#', 1)[0]
+    tokens = [(match.group(), match.start(), match.end())
+        for match in token.finditer(body)]
+    if tokens == []:
+        return ('T', line), None, None, section
+    first = tokens[0][0].upper()
+    if first == 'BLOCK' and len(tokens) > 1:
+        name = tokens[1][0].upper()
+        match = scale.search(body, tokens[1][2])
+        if match is None:
+            return ('B', name), None, None, ('block', name)
+        return ('B', name), match.start(1) - (len(match.group()) - 2
+            - len(match.group(1))), match.end(1), ('block', name)
+    if first == 'DECAY' and len(tokens) > 2:
+        return ('D', tokens[1][0]), tokens[1][2], tokens[2][2], \
+            ('decay', tokens[1][0])
+    if (section is None) or (first in ('BLOCK', 'DECAY')):
+        # before any block, a bare BLOCK, a DECAY without a width: such
+        # lines are matched by their text and stored as they are
+        return ('T', line), None, None, section
+    if section[0] == 'block': # index columns, then the value
+        n = 0
+        while n < len(tokens) - 1 and tokens[n][0].lstrip('-+').isdigit():
+            n = n + 1
+        start = 0
+        if n > 0:
+            start = tokens[n-1][2]
+        return ('E', section[1]) + tuple([item[0] for item in tokens[:n]]), \
+            start, tokens[n][2], section
+    return ('C', section[1]) + tuple([item[0] for item in tokens[1:]]), \
+        0, tokens[0][2], section
+
+def split_lines(text): # lines with their '\n' (splitlines also splits at
+    # '\r', '\f', ... which a card may have inside a line)
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if lines[-1] == '':
+        del lines[-1]
+    return lines
+
+class BaseCard:
+    """The base card of a store, encodes cards into records and back.
+
+    Attributes: lines, spans, sections, lookup
+    Methods: value, match, encode, decode
+    """
+
+    def __init__(self, text):
+        self.lines = split_lines(text)
+        self.spans = [] # per line with a value: (text before the value,
+            # spaces before its number, text after it), else None
+        self.sections = [] # per line: section after it, see line_key
+        self.lookup = dict() # key -> the lines with that key, in order
+        section = None
+        for k in range(len(self.lines)):
+            line = self.lines[k]
+            key, start, end, section = line_key(line, section)
+            self.lookup.setdefault(key, []).append(k)
+            self.sections.append(section)
+            if start is None:
+                self.spans.append(None)
+            else:
+                number = line[start:end].lstrip()
+                self.spans.append((line[:start], line[start:end - len(number)],
+                    line[end:]))
+
+    def value(self, k, line):
+        # the value of line as a record stores it if line is line k of the
+        # base with another value, else None: just the number if the spaces
+        # before it are the same as in the base
+        span = self.spans[k]
+        if span is None:
+            return None
+        prefix, spaces, suffix = span
+        if len(line) <= len(prefix) + len(suffix) or \
+                not line.startswith(prefix) or not line.endswith(suffix):
+            return None
+        value = line[len(prefix):len(line) - len(suffix)]
+        number = value.lstrip()
+        if '|' in value or number == '': # '|' separates the values
+            return None
+        if len(value) - len(number) == len(spaces):
+            return number
+        if value == number: # no spaces where the base has some
+            return None
+        return value
+
+    def match(self, line, section, expected):
+        # (base line, section after line) of a line that is not where the
+        # base has it: the line with the same key nearest after expected
+        key, start, end, section = line_key(line, section)
+        lines = self.lookup.get(key)
+        if lines is None:
+            return None, section
+        k = bisect.bisect_left(lines, expected)
+        if k == len(lines):
+            k = 0
+        return lines[k], section
+
+    def encode(self, text): # records of a card, one string
+        # lines in the same place as in the base (with the same or another
+        # value) are taken as they are; only the others are looked up by key
+        records = []
+        copied = [0, 0] # run of unchanged base lines: start, count
+        values = [0] # run of base lines with new values: start, values...
+        def flush():
+            if copied[1]:
+                records.append('= %d %d\n' % tuple(copied))
+                copied[1] = 0
+            if len(values) > 1:
+                records.append('~ ' + '|'.join([str(values[0])]
+                    + values[1:]) + '\n')
+                del values[1:]
+        nbase = len(self.lines)
+        expected = 0 # the base line after the last one matched
+        section = None
+        for line in split_lines(text):
+            k, value = expected, None
+            if k < nbase and self.lines[k] != line:
+                value = self.value(k, line)
+            if k >= nbase or (value is None and self.lines[k] != line):
+                # not in the same place
+                k, section = self.match(line, section, expected)
+                if (k is not None) and (self.lines[k] != line):
+                    value = self.value(k, line)
+            else:
+                section = self.sections[k]
+            if k is not None:
+                expected = k + 1
+                if value is None and self.lines[k] == line:
+                    if not (copied[1] and k == copied[0] + copied[1]):
+                        flush()
+                        copied[0] = k
+                    copied[1] = copied[1] + 1
+                    continue
+                if value is not None:
+                    if not (len(values) > 1 and
+                            k == values[0] + len(values) - 1):
+                        flush()
+                        values[0] = k
+                    values.append(value)
+                    continue
+            flush()
+            if line.endswith('\n'):
+                records.append('+' + line)
+            else: # last line without a newline
+                records.append('-' + line + '\n')
+        flush()
+        return ''.join(records)
+
+    def decode(self, records): # card text of the records of a card
+        pieces = []
+        for record in split_lines(records):
+            kind = record[0]
+            if kind == '=':
+                start, count = record[2:].split()
+                start = int(start)
+                pieces.extend(self.lines[start:start + int(count)])
+            elif kind == '~':
+                values = record[2:-1].split('|')
+                k = int(values[0])
+                for value in values[1:]:
+                    prefix, spaces, suffix = self.spans[k]
+                    if value[0].isspace(): # with its own spaces
+                        pieces.append(prefix + value + suffix)
+                    else:
+                        pieces.append(prefix + spaces + value + suffix)
+                    k = k + 1
+            elif kind == '+':
+                pieces.append(record[1:])
+            elif kind == '-':
+                pieces.append(record[1:-1])
+            else:
+                raise ValueError('bad delta record ' + repr(record))
+        return ''.join(pieces)
+
+# -------------------------------------------------------------------------- #
+
+class DeltaStore:
+    """A base card and the deltas of the cards of a scan, in a directory.
+
+    Attributes: directory, base, labels, index
+    Methods: add, add_records, records, card, write, unpack, close
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.base = None # BaseCard, once there is one
+        self.labels = [] # in the order added
+        self.index = dict() # label -> (offset, length) in deltas.dat
+        self.deltafile = None # open for appending while adding
+        self.readfile = None # open for reading cards
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        basename = os.path.join(directory, 'base.dat')
+        if os.path.exists(basename):
+            basefile = open(basename, 'rb')
+            self.base = BaseCard(basefile.read())
+            basefile.close()
+        indexname = os.path.join(directory, 'index.json')
+        if os.path.exists(indexname):
+            info = json.load(open(indexname, 'r'))
+            self.labels = [str(label) for label in info['labels']]
+            self.index = dict(zip(self.labels,
+                [tuple(item) for item in info['offsets']]))
+
+    def add(self, label, text): # add (or replace) the card of a point
+        if self.base is None: # the first card is the base
+            basefile = open(os.path.join(self.directory, 'base.dat'), 'wb')
+            basefile.write(text)
+            basefile.close()
+            self.base = BaseCard(text)
+        self.add_records(label, self.base.encode(text))
+
+    def add_records(self, label, records): # same, already encoded
+        # (by the BaseCard of base_card(directory), e.g. in a worker)
+        label = str(label)
+        if self.deltafile is None:
+            if self.readfile is not None:
+                self.readfile.close()
+                self.readfile = None
+            self.deltafile = open(os.path.join(self.directory, 'deltas.dat'),
+                'ab')
+            self.deltafile.seek(0, os.SEEK_END)
+        entry = '@ ' + label + ' ' + str(records.count('\n')) + '\n' + records
+        offset = self.deltafile.tell() + len(entry) - len(records)
+        self.deltafile.write(entry)
+        if label not in self.index:
+            self.labels.append(label)
+        self.index[label] = (offset, len(records))
+
+    def records(self, label): # the records of a card, one string
+        if self.deltafile is not None: # finish adding first
+            self.close()
+        offset, length = self.index[str(label)]
+        if self.readfile is None:
+            self.readfile = open(os.path.join(self.directory, 'deltas.dat'),
+                'rb')
+        self.readfile.seek(offset)
+        return self.readfile.read(length)
+
+    def card(self, label): # the card of a point, as text
+        return self.base.decode(self.records(label))
+
+    def write(self, label, writename): # write the card of a point to a file
+        writefile = open_output(writename)
+        try:
+            writefile.write(self.card(label))
+        finally:
+            writefile.close()
+
+    def unpack(self, outdir, labels=None): # param_cardLABEL.dat of labels
+        # (all if None) into outdir, in the order of deltas.dat
+        if labels is None:
+            labels = self.labels
+        labels = sorted(labels, key=lambda label: self.index[str(label)][0])
+        for label in labels:
+            self.write(label, os.path.join(outdir,
+                'param_card' + str(label) + '.dat'))
+
+    def close(self): # finish adding: deltas on disk, index saved
+        if self.deltafile is None:
+            return
+        self.deltafile.close()
+        self.deltafile = None
+        info = {'labels' : self.labels,
+            'offsets' : [self.index[label] for label in self.labels]}
+        tmpname = os.path.join(self.directory, 'index.json.tmp')
+        indexfile = open(tmpname, 'w')
+        json.dump(info, indexfile)
+        indexfile.close()
+        os.rename(tmpname, os.path.join(self.directory, 'index.json'))
+
+bases = dict() # store directory -> BaseCard, see base_card
+
+def base_card(directory): # the BaseCard of a store, read once per process
+    if directory not in bases:
+        basefile = open(os.path.join(directory, 'base.dat'), 'rb')
+        bases[directory] = BaseCard(basefile.read())
+        basefile.close()
+    return bases[directory]
+
+# -------------------------------------------------------------------------- #
+
+def card_label(cardname): # param_card12.dat (or .dat.gz) -> '12'
+    label = os.path.splitext(os.path.basename(strip_extension(cardname)))[0]
+    if label.startswith('param_card'):
+        label = label[len('param_card'):]
+    return label
+
+def directory_size(directory, names=None): # bytes of the files in directory
+    if names is None:
+        names = os.listdir(directory)
+    return sum([os.path.getsize(os.path.join(directory, name))
+        for name in names])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Store the param cards of a scan as a base card plus '
+            'per-card deltas, and get the cards back.')
+    parser.add_argument('command', choices=['pack', 'unpack', 'show'])
+    parser.add_argument('source', help="pack: glob of cards, e.g. "
+        "'cards/param_card*.dat'; unpack, show: the store")
+    parser.add_argument('target', help='pack: the store; unpack: directory '
+        'for the cards; show: a label')
+    parser.add_argument('labels', nargs='*',
+        help='unpack: only these points (default: all)')
+    parser.add_argument('--verify', action='store_true',
+        help='pack: check that every card comes back byte for byte')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        cardnames = sorted(glob.glob(args.source))
+        if not cardnames:
+            print "ERROR: no cards found"
+            return 1
+        store = DeltaStore(args.target)
+        failed = []
+        for cardname in cardnames:
+            cardfile = open_input(cardname)
+            try:
+                text = cardfile.read()
+            finally:
+                cardfile.close()
+            store.add(card_label(cardname), text)
+            if args.verify and store.base.decode(
+                    store.base.encode(text)) != text:
+                failed.append(cardname)
+        store.close()
+        print str(len(cardnames)) + " cards packed into " + args.target \
+            + ": " + str(directory_size(args.target)) + " bytes, cards " \
+            + str(sum([os.path.getsize(name) for name in cardnames])) \
+            + " bytes"
+        if failed:
+            print "ERROR: " + str(len(failed)) + " cards do not come back " \
+                "the same: " + ' '.join(failed)
+            return 1
+        return 0
+
+    if not os.path.exists(os.path.join(args.source, 'index.json')):
+        print "ERROR: no delta store in " + args.source
+        return 1
+    store = DeltaStore(args.source)
+    labels = args.labels or None
+    if args.command == 'show':
+        labels = [args.target]
+    for label in (labels or []):
+        if label not in store.index:
+            print "ERROR: no point " + label + " in " + args.source
+            return 1
+    if args.command == 'show':
+        sys.stdout.write(store.card(args.target))
+        return 0
+    if not os.path.isdir(args.target):
+        os.makedirs(args.target)
+    store.unpack(args.target, labels)
+    print str(len(labels or store.labels)) + " cards written to " \
+        + args.target
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
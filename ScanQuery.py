@@ -0,0 +1,446 @@
+#! /usr/bin/env python
+# ScanQuery.py
+#
+# Queries over the columnar store of a converted scan (see ScanColumns.py,
+# BatchScan.py --columns), e.g. "which points have 124 <= MASS[25] <= 126
+# and NMNMIX[1,5]^2 > 0.9", answered from sorted indexes instead of
+# re-reading the param cards:
+#
+#   python ScanQuery.py store/ '124 <= MASS[25] <= 126' 'NMNMIX[1,5]^2 > 0.9'
+#
+# A condition is "column op number", "number op column op number" or the
+# same with column^2 (the square of the entry, for mixing matrix elements);
+# op is <, <=, >, >= or ==. All conditions must hold (several can also be
+# joined with 'and'). Entries a point doesn't have (NaN) never match.
+#
+# Index: for every column that is queried, the values of all points sorted
+# (NaN left out) and the point each one belongs to, kept in store/index/:
+#   index.json           per column: points indexed, entries, byte order
+#   MASS_25.sorted.f8    the sorted values (float64)
+#   MASS_25.points.i4    their point numbers (int32, order of points.txt)
+# A query finds each condition's range with bisect, walks the points of
+# the narrowest one and checks the other conditions against the raw column
+# values. Indexes are built the first time a column is queried; when the
+# store has grown since (BatchScan.py --columns appends), only the new
+# points are sorted and merged in. BatchScan.py --index updates the indexes
+# of all columns right after the conversion.
+#
+# Output: point labels (points.txt), or with --cards DIR the card names
+# BatchScan.py gives them (DIR/param_cardLABEL.dat, or .dat.gz etc. if
+# that is the card there, see BatchScan.py --compress). --count only counts.
+# If DIR has a dedup_map.txt (BatchScan.py --dedup, ScanDedup.py) the cards
+# of duplicate points are gone: such a point gives the card kept for it,
+# and each card is printed once.
+#
+# Requires: ScanColumns.py, ScanDedup.py, CompressedIO.py.
+#
+# Example use: index = ScanIndex('store/')
+#              points = index.query(parse_conditions('MASS[25] > 124'))
+#              labels = index.labels(points)
+
+# -------------------------------------------------------------------------- #
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import bisect
+import argparse
+from array import array
+from itertools import compress
+from ScanColumns import column_file, read_labels
+from ScanDedup import read_mapping
+from CompressedIO import formats
+
+def point_array(values=()): # point numbers, 4 bytes each
+    return array('i', values)
+
+## Conditions
+# A Condition is a range of one column (or its square): low/high of None
+# means no bound. intervals() turns it into ranges of the stored values;
+# for a square these are widened a little (sqrt rounds), test() is exact.
+# expression() is test() as Python source: a query compiles the checks of
+# all its conditions into one list comprehension (a function call per
+# point and condition would take most of the time of a query).
+
+number = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+column = r'[A-Za-z0-9_]+\s*\[\s*-?\d+(?:\s*,\s*-?\d+)*\s*\]'
+operator = r'<=|>=|==|=|<|>'
+condition_pattern = re.compile(r'^\s*(?:(' + number + r')\s*(' + operator
+    + r')\s*)?(' + column + r')\s*(\^\s*2)?\s*(' + operator + r')\s*('
+    + number + r')\s*$')
+
+flipped = {'<' : '>', '<=' : '>=', '>' : '<', '>=' : '<=', '==' : '=='}
+
+class Condition:
+    """Range condition on one column of the store.
+
+    Attributes: column, square, low, high, low_closed, high_closed
+    Methods: bound, test, expression, intervals
+    """
+
+    def __init__(self, column, square=False):
+        self.column = column # e.g. 'NMNMIX[1,5]'
+        self.square = square # condition on the square of the value
+        self.low = None
+        self.high = None
+        self.low_closed = True
+        self.high_closed = True
+
+    def bound(self, op, value): # add "column op value"
+        if op == '=':
+            op = '=='
+        if op in ('>', '>=', '=='):
+            if (self.low is None) or (value > self.low) or \
+                    (value == self.low and op == '>'):
+                self.low, self.low_closed = value, (op != '>')
+        if op in ('<', '<=', '=='):
+            if (self.high is None) or (value < self.high) or \
+                    (value == self.high and op == '<'):
+                self.high, self.high_closed = value, (op != '<')
+
+    def test(self, value): # does a stored value satisfy the condition?
+        if value != value: # NaN
+            return False
+        if self.square:
+            value = value**2
+        if self.low is not None:
+            if value < self.low or (value == self.low and not self.low_closed):
+                return False
+        if self.high is not None:
+            if value > self.high or \
+                    (value == self.high and not self.high_closed):
+                return False
+        return True
+
+    def expression(self, value, low, high):
+        # source of test() for the variable names value, low and high; NaN
+        # fails every comparison
+        if self.square:
+            value = value + '**2'
+        text = value
+        if self.low is not None:
+            text = low + ('<=' if self.low_closed else '<') + text
+        if self.high is not None:
+            text = text + ('<=' if self.high_closed else '<') + high
+        if text == value: # no bounds: anything but NaN
+            text = value + '==' + value
+        return '(' + text + ')'
+
+    def intervals(self): # [(low, high, low_closed, high_closed)] of values
+        if not self.square:
+            return [(self.low, self.high, self.low_closed, self.high_closed)]
+        if (self.high is not None) and (self.high < 0):
+            return []
+        outer = None # |value| <= outer
+        if self.high is not None:
+            outer = math.sqrt(self.high)*(1 + 1e-12)
+        if (self.low is None) or (self.low <= 0):
+            if outer is None:
+                return [(None, None, True, True)]
+            return [(-outer, outer, True, True)]
+        inner = math.sqrt(self.low)*(1 - 1e-12) # |value| >= inner
+        if outer is None:
+            return [(None, -inner, True, True), (inner, None, True, True)]
+        return [(-outer, -inner, True, True), (inner, outer, True, True)]
+
+def parse_condition(text): # a Condition, ValueError if it doesn't parse
+    match = condition_pattern.match(text)
+    if match is None:
+        raise ValueError('cannot parse condition ' + repr(text))
+    left, left_op, name, square, op, right = match.groups()
+    condition = Condition(re.sub(r'\s+', '', name), square is not None)
+    if left is not None: # "a op column" is "column flipped-op a"
+        condition.bound(flipped.get(left_op, '=='), float(left))
+    condition.bound(op, float(right))
+    return condition
+
+def parse_conditions(*texts): # Conditions of texts that may contain 'and'
+    conditions = []
+    for text in texts:
+        for part in re.split(r'\s+and\s+', text.strip(), flags=re.IGNORECASE):
+            conditions.append(parse_condition(part))
+    return conditions
+
+# -------------------------------------------------------------------------- #
+
+class ColumnIndex:
+    """Sorted values of one column (no NaN) and the points they belong to.
+
+    Attributes: name, values, points, indexed
+    Methods: span, merge
+    """
+
+    def __init__(self, name, values=None, points=None, indexed=0):
+        self.name = name
+        self.values = values or array('d') # ascending
+        self.points = points or point_array() # ascending within equal values
+        self.indexed = indexed # points of the store covered so far
+
+    def span(self, low, high, low_closed=True, high_closed=True):
+        # (start, stop) of the sorted values in the interval
+        start, stop = 0, len(self.values)
+        if low is not None:
+            if low_closed:
+                start = bisect.bisect_left(self.values, low)
+            else:
+                start = bisect.bisect_right(self.values, low)
+        if high is not None:
+            if high_closed:
+                stop = bisect.bisect_right(self.values, high)
+            else:
+                stop = bisect.bisect_left(self.values, high)
+        return start, max(start, stop)
+
+    def merge(self, new_values, first_point):
+        # add the values of points first_point, first_point + 1, ...
+        # (the next points of the store, all after the indexed ones)
+        order = [k for k in range(len(new_values))
+            if new_values[k] == new_values[k]]
+        order.sort(key=new_values.__getitem__) # stable: points ascending
+        sorted_values = array('d', [new_values[k] for k in order])
+        sorted_points = point_array([first_point + k for k in order])
+        if len(self.values) == 0:
+            self.values, self.points = sorted_values, sorted_points
+        elif len(sorted_values) > 0:
+            values, points = array('d'), point_array()
+            previous = 0
+            for k in range(len(sorted_values)): # new points go after equal
+                place = bisect.bisect_right(self.values, sorted_values[k],
+                    previous) # old values: they have smaller point numbers
+                values.extend(self.values[previous:place])
+                points.extend(self.points[previous:place])
+                values.append(sorted_values[k])
+                points.append(sorted_points[k])
+                previous = place
+            values.extend(self.values[previous:])
+            points.extend(self.points[previous:])
+            self.values, self.points = values, points
+        self.indexed = first_point + len(new_values)
+
+# -------------------------------------------------------------------------- #
+
+class ScanIndex:
+    """Sorted indexes of the columns of a ScanColumns store, and queries.
+
+    Attributes: directory, npoints, columns, indexes
+    Methods: column_index, update, query, ordered, labels, cards
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_directory = os.path.join(directory, 'index')
+        info = json.load(open(os.path.join(directory, 'columns.json'),'r'))
+        self.npoints = info['npoints']
+        self.byteorder = info['byteorder']
+        self.columns = [str(name) for name in info['columns']]
+        self.indexes = dict() # column name -> ColumnIndex, loaded ones
+        self.raw = dict() # column name -> array('d') of all points
+        self.manifest = dict() # column name -> {'indexed', 'entries'}
+        manifest = os.path.join(self.index_directory, 'index.json')
+        if os.path.exists(manifest):
+            saved = json.load(open(manifest,'r'))
+            if saved['byteorder'] == sys.byteorder: # else rebuild
+                self.manifest = dict([(str(name), item)
+                    for name, item in saved['columns'].items()])
+
+    def index_file(self, name, kind): # kind: 'sorted' or 'points'
+        return os.path.join(self.index_directory,
+            column_file(name)[:-len('.f8')] + '.' + kind
+                + {'sorted' : '.f8', 'points' : '.i4'}[kind])
+
+    def read_column(self, name, first=0): # array('d') of points first...
+        column = array('d')
+        columnfile = open(os.path.join(self.directory, column_file(name)),'rb')
+        try:
+            columnfile.seek(first*column.itemsize)
+            column.fromfile(columnfile, self.npoints - first)
+        finally:
+            columnfile.close()
+        if self.byteorder != sys.byteorder:
+            column.byteswap()
+        return column
+
+    def raw_column(self, name): # values of all points, in order
+        if name not in self.raw:
+            self.raw[name] = self.read_column(name)
+        return self.raw[name]
+
+    def load(self, name): # saved ColumnIndex of a column, or an empty one
+        item = self.manifest.get(name)
+        if item is None:
+            return ColumnIndex(name)
+        values, points = array('d'), point_array()
+        try:
+            for data, kind in [(values, 'sorted'), (points, 'points')]:
+                indexfile = open(self.index_file(name, kind),'rb')
+                try:
+                    data.fromfile(indexfile, item['entries'])
+                finally:
+                    indexfile.close()
+        except (IOError, EOFError): # missing or cut short: rebuild
+            return ColumnIndex(name)
+        return ColumnIndex(name, values, points, item['indexed'])
+
+    def save(self, column_index):
+        if not os.path.isdir(self.index_directory):
+            os.makedirs(self.index_directory)
+        for data, kind in [(column_index.values, 'sorted'),
+                (column_index.points, 'points')]:
+            filename = self.index_file(column_index.name, kind)
+            indexfile = open(filename + '.tmp','wb')
+            data.tofile(indexfile)
+            indexfile.close()
+            os.rename(filename + '.tmp', filename)
+        self.manifest[column_index.name] = {'indexed' : column_index.indexed,
+            'entries' : len(column_index.values)}
+        info = {'byteorder' : sys.byteorder, 'columns' : self.manifest}
+        tmpname = os.path.join(self.index_directory, 'index.json.tmp')
+        manifest = open(tmpname,'w')
+        json.dump(info, manifest, indent=1, sort_keys=True)
+        manifest.close()
+        os.rename(tmpname, os.path.join(self.index_directory, 'index.json'))
+
+    def column_index(self, name): # up to date ColumnIndex of a column
+        if name not in self.columns:
+            raise KeyError('no column ' + name + ' in ' + self.directory)
+        column_index = self.indexes.get(name)
+        if column_index is None:
+            column_index = self.load(name)
+            self.indexes[name] = column_index
+        if column_index.indexed < self.npoints: # new points: merge them in
+            first = column_index.indexed
+            column_index.merge(self.read_column(name, first), first)
+            self.save(column_index)
+        return column_index
+
+    def update(self, names=None): # bring the indexes of columns up to date
+        for name in (names or self.columns):
+            self.column_index(name)
+
+    def query(self, conditions): # sorted point numbers matching all
+        if conditions == []:
+            return range(self.npoints)
+        spans = [] # (number of points, condition, [(start, stop)])
+        for condition in conditions:
+            column_index = self.column_index(condition.column)
+            ranges = [column_index.span(*interval)
+                for interval in condition.intervals()]
+            spans.append((sum([stop - start for start, stop in ranges]),
+                condition, ranges))
+        spans.sort(key=lambda item: item[0])
+        size, driver, ranges = spans[0] # the narrowest condition
+        column_index = self.indexes[driver.column]
+        candidates = point_array()
+        for start, stop in ranges:
+            candidates.extend(column_index.points[start:stop])
+        checks = [condition for size, condition, ranges in spans[1:]]
+        if driver.square: # the ranges were widened
+            checks.insert(0, driver)
+        if checks: # narrowest first, 'and' stops at the first that fails
+            namespace = {'candidates' : candidates}
+            tests = []
+            for k in range(len(checks)):
+                names = ('c%d' % k, 'l%d' % k, 'h%d' % k)
+                namespace[names[0]] = self.raw_column(checks[k].column)
+                namespace[names[1]] = checks[k].low
+                namespace[names[2]] = checks[k].high
+                tests.append(checks[k].expression(names[0] + '[p]',
+                    names[1], names[2]))
+            candidates = eval('[p for p in candidates if '
+                + ' and '.join(tests) + ']', namespace)
+        return self.ordered(candidates)
+
+    def ordered(self, points): # sorted list of distinct point numbers
+        if len(points) < self.npoints // 16:
+            return sorted(points)
+        mask = bytearray(self.npoints) # faster than sorting many points
+        for point in points:
+            mask[point] = 1
+        return list(compress(xrange(self.npoints), mask))
+
+    def labels(self, points): # labels of point numbers
+        labels = read_labels(self.directory)
+        return [labels[point] for point in points]
+
+    def cards(self, points, carddir): # card names as BatchScan.py gives them
+        # the kept card for a duplicate removed by BatchScan.py --dedup
+        mapping = dict()
+        mapname = os.path.join(carddir, 'dedup_map.txt')
+        if os.path.exists(mapname):
+            mapping = read_mapping(mapname)
+        extensions = [''] + sorted([extension for extension, magic
+            in formats.values()]) # BatchScan.py --compress
+        cards = []
+        for label in self.labels(points):
+            name = 'param_card' + label + '.dat'
+            if name in mapping:
+                cards.append(os.path.join(carddir, mapping[name]))
+                continue
+            cardname = os.path.join(carddir, name)
+            for extension in extensions:
+                if os.path.exists(cardname + extension):
+                    cardname = cardname + extension
+                    break
+            cards.append(cardname)
+        return cards
+
+# -------------------------------------------------------------------------- #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Find the points of a converted scan that satisfy '
+            'range conditions, from a columnar store (BatchScan --columns).')
+    parser.add_argument('store', help='ScanColumns store directory')
+    parser.add_argument('conditions', nargs='*',
+        help="e.g. '124 <= MASS[25] <= 126' 'NMNMIX[1,5]^2 > 0.9'")
+    parser.add_argument('--cards', default=None,
+        help='print card names in this directory instead of labels')
+    parser.add_argument('--count', action='store_true',
+        help='only print the number of matching points')
+    parser.add_argument('--update', action='store_true',
+        help='bring the indexes of all columns up to date')
+    parser.add_argument('--time', action='store_true',
+        help='print the time the query took')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.store, 'columns.json')):
+        print "ERROR: no columnar store in " + args.store
+        return 1
+    try:
+        conditions = parse_conditions(*args.conditions)
+    except ValueError, error:
+        print "ERROR: " + str(error)
+        return 1
+    index = ScanIndex(args.store)
+    if args.update:
+        index.update()
+    if not conditions and args.update:
+        return 0
+    start = time.time()
+    try:
+        points = index.query(conditions)
+    except KeyError, error:
+        print "ERROR: " + str(error.args[0])
+        return 1
+    seconds = time.time() - start
+    if args.count:
+        print len(points)
+    elif args.cards is not None:
+        printed = set() # duplicates share the card kept for them
+        for name in index.cards(points, args.cards):
+            if name not in printed:
+                printed.add(name)
+                print name
+    else:
+        for label in index.labels(points):
+            print label
+    if args.time:
+        sys.stderr.write('%d of %d points in %.2f ms\n'
+            % (len(points), index.npoints, 1000*seconds))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
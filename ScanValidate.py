@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+# ScanValidate.py
+#
+# Pre-flight validation of NMSSMTools spectra, so that bad points are caught
+# before their cards go to MadGraph. The checks run on the parsed input
+# blocks (before convert_blocks), for a whole batch of points at once with
+# numpy:
+#   required     every block in Tools2Param.required_blocks and every
+#                source block of the transform plan is there
+#   inputs       every entry the transform plan copies or squares (the
+#                2x2 STOPMIX etc., the EXTPAR soft masses) is there; A and
+#                y are only given for the third generation in SLHA1, so
+#                the 'product' entries are not checked
+#   complete     the mixing matrices have all their entries
+#   orthogonal   the mixing matrices M satisfy M M^T = 1 (rows orthonormal)
+#                within the tolerance
+#   finite       all MASS entries are finite numbers
+#   positive     the MASS entries are > 0, except for the neutralinos,
+#                charginos and gluino, whose sign is a phase
+# The result for each point is a verdict: {'ok' : bool, 'failures' : list
+# of {'check', 'block', 'detail'}}.
+#
+# BatchScan.py --validate uses this to reject points instead of writing a
+# card for them. On its own it prints one JSON verdict per point.
+#
+# Requires: numpy, ScanArrays.py, Tools2Param.py, SLHAblock.py,
+#           CompressedIO.py.
+#
+# Example use: python ScanValidate.py 'scan/spectr*.dat' --tolerance 1e-4
+
+# -------------------------------------------------------------------------- #
+
+import sys
+import glob
+import json
+import argparse
+import numpy
+from Tools2Param import read_spectrum, required_blocks, transform_plan
+from ScanArrays import stack_entries, stack_matrices
+from CompressedIO import open_input
+
+# block, rows, columns
+mixing_matrices = [('NMHMIX',3,3), ('NMAMIX',2,3), ('NMNMIX',5,5),
+    ('UMIX',2,2), ('VMIX',2,2), ('STOPMIX',2,2), ('SBOTMIX',2,2),
+    ('STAUMIX',2,2)]
+
+# PDG ids whose MASS may be negative (Majorana phase convention)
+signed_masses = set([1000021, 1000022, 1000023, 1000025, 1000035, 1000045,
+    1000024, 1000037])
+
+default_tolerance = 1e-4 # NMSSMTools writes 8 significant digits
+
+def plan_inputs(plan=transform_plan, operations=('copy', 'square')):
+    # source block -> indices the plan reads for these operations
+    inputs = dict()
+    for target, entries in plan.blocks:
+        for target_index, operation, sources, source in entries:
+            if operation not in operations:
+                continue
+            for name in sources:
+                inputs.setdefault(name, [])
+                if source not in inputs[name]:
+                    inputs[name].append(source)
+    return inputs
+
+# -------------------------------------------------------------------------- #
+
+def validate_batch(dictionaries, tolerance=default_tolerance,
+        plan=transform_plan):
+    # returns the list of checks: (check, block, ok, detail), ok an (N,)
+    # bool array, detail a function n -> text for a failed point n
+    checks = []
+    if len(dictionaries) == 0:
+        return checks
+
+    inputs = plan_inputs(plan)
+    needed = list(required_blocks)
+    for name in sorted(plan.inputs):
+        if name not in needed:
+            needed.append(name)
+    for name in needed:
+        ok = numpy.array([name in block_dictionary
+            for block_dictionary in dictionaries], dtype=bool)
+        checks.append(('required', name, ok, lambda n: 'missing'))
+
+    for name in sorted(inputs):
+        indices = inputs[name]
+        values, present = stack_entries(dictionaries, name, indices)
+        def detail(n, indices=indices, present=present):
+            return 'missing ' + ', '.join([str(indices[k]) for k
+                in range(len(indices)) if not present[n, k]])
+        checks.append(('inputs', name, present.all(axis=1), detail))
+
+    for name, rows, columns in mixing_matrices:
+        values, present = stack_matrices(dictionaries, name, rows, columns)
+        complete = present.all(axis=(1, 2))
+        checks.append(('complete', name, complete,
+            lambda n, rows=rows, columns=columns: 'not all ' + str(rows)
+                + 'x' + str(columns) + ' entries'))
+        product = numpy.einsum('nij,nkj->nik', values, values)
+        deviation = numpy.abs(product - numpy.eye(rows)).max(axis=(1, 2))
+        # an incomplete matrix is only reported as incomplete
+        orthogonal = (deviation <= tolerance) | ~complete
+        checks.append(('orthogonal', name, orthogonal,
+            lambda n, deviation=deviation: 'max |M M^T - 1| = %.3g'
+                % deviation[n]))
+
+    mass_indices = set()
+    for block_dictionary in dictionaries:
+        if 'MASS' in block_dictionary:
+            mass_indices.update(block_dictionary['MASS'].index)
+    mass_indices = sorted(mass_indices)
+    values, present = stack_entries(dictionaries, 'MASS', mass_indices)
+    finite = numpy.isfinite(values) | ~present
+    signed = numpy.array([index[0] in signed_masses
+        for index in mass_indices], dtype=bool)
+    positive = (numpy.where(finite, values, 1.) > 0) | signed | ~present
+    def mass_detail(n, good, text):
+        return text + ' ' + ', '.join([str(mass_indices[k][0]) for k
+            in range(len(mass_indices)) if not good[n, k]])
+    checks.append(('finite', 'MASS', finite.all(axis=1),
+        lambda n: mass_detail(n, finite, 'not finite:')))
+    checks.append(('positive', 'MASS', positive.all(axis=1),
+        lambda n: mass_detail(n, positive, 'not positive:')))
+
+    return checks
+
+def verdicts(checks, npoints): # one verdict dictionary per point
+    results = [{'ok' : True, 'failures' : []} for n in range(npoints)]
+    for check, block, ok, detail in checks:
+        for n in numpy.flatnonzero(~ok).tolist():
+            results[n]['ok'] = False
+            results[n]['failures'].append({'check' : check,
+                'block' : block, 'detail' : detail(n)})
+    return results
+
+def validate(dictionaries, tolerance=default_tolerance, plan=transform_plan):
+    # list of verdicts for a list of block dictionaries
+    return verdicts(validate_batch(dictionaries, tolerance, plan),
+        len(dictionaries))
+
+def verdict_message(verdict): # one line, for BatchScan's summary
+    return '; '.join([failure['check'] + ' ' + failure['block'] + ': '
+        + failure['detail'] for failure in verdict['failures']])
+
+# -------------------------------------------------------------------------- #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check NMSSMTools spectra before converting them.')
+    parser.add_argument('spectra', nargs='+',
+        help="spectrum files or globs, e.g. 'scan/spectr*.dat'")
+    parser.add_argument('--tolerance', type=float, default=default_tolerance,
+        help='allowed deviation from orthogonality of the mixing matrices')
+    parser.add_argument('--chunk', type=int, default=1000,
+        help='points validated at a time')
+    args = parser.parse_args(argv)
+
+    names = []
+    for pattern in args.spectra:
+        names.extend(sorted(glob.glob(pattern)) or [pattern])
+    bad = 0
+    for first in range(0, len(names), args.chunk):
+        chunk = names[first:first+args.chunk]
+        dictionaries = []
+        for spectname in chunk:
+            spectfile = open_input(spectname)
+            dictionaries.append(read_spectrum(spectfile))
+            spectfile.close()
+        for spectname, verdict in zip(chunk,
+                validate(dictionaries, args.tolerance)):
+            verdict['point'] = spectname
+            print json.dumps(verdict, sort_keys=True)
+            if not verdict['ok']:
+                bad = bad + 1
+    if bad:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
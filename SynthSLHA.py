@@ -0,0 +1,249 @@
+#! /usr/bin/env python
+# SynthSLHA.py
+#
+# Synthetic NMSSMTools output for tests and benchmarks: writes spectrum
+# files (SLHA 1, all the blocks Tools2Param needs, EXTPAR, LOWEN, reduced
+# couplings and the GUT scale blocks) and decay files with a configurable
+# number of decaying particles and channels. The numbers are random but
+# sensible: scalar masses are positive, mixing matrices are orthogonal and
+# the branching ratios of each particle add up to one.
+#
+# Example use: python SynthSLHA.py scan/ 1000
+#              python SynthSLHA.py scan/ 100 --channels 200 --lowen 500
+#   writes scan/spectr0.dat, scan/decay0.dat, ... scan/spectr999.dat, ...
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import math
+import random
+import argparse
+
+higgses = [25, 35, 45, 36, 46, 37]
+sfermions = [1000001, 2000001, 1000002, 2000002, 1000003, 2000003,
+    1000004, 2000004, 1000005, 2000005, 1000006, 2000006,
+    1000011, 2000011, 1000012, 1000013, 2000013, 1000014,
+    1000015, 2000015, 1000016]
+fermions = [1000021, 1000022, 1000023, 1000025, 1000035, 1000045,
+    1000024, 1000037] # gluino, neutralinos, charginos: masses may be < 0
+decay_products = [1, 2, 3, 4, 5, 6, 11, 13, 15, 21, 22, 23, 24, 25, 35, 36,
+    1000022, 1000023, 1000024]
+
+def orthogonal(n, rand): # random n x n orthogonal matrix, Givens rotations
+    matrix = [[float(i == j) for j in range(n)] for i in range(n)]
+    for p in range(n):
+        for q in range(p+1, n):
+            angle = rand.uniform(0., 2.*math.pi)
+            c, s = math.cos(angle), math.sin(angle)
+            for row in matrix:
+                row[p], row[q] = c*row[p] - s*row[q], s*row[p] + c*row[q]
+    return matrix
+
+def entry(lines, index, value, comment): # vector block data line
+    lines.append(str(index).rjust(6) + '     %.8E' % value
+        + '   # ' + comment + '\n')
+
+def matrix_block(lines, name, matrix, comment):
+    lines.append('BLOCK ' + name + '\n')
+    for i in range(len(matrix)):
+        for j in range(len(matrix[i])):
+            lines.append(str(i+1).rjust(3) + str(j+1).rjust(3)
+                + '    % .8E' % matrix[i][j]
+                + '   # ' + comment + '_' + str(i+1) + str(j+1) + '\n')
+
+def scale_block(lines, name, scale, label): # BLOCK NAME Q= ... # (label)
+    lines.append('BLOCK ' + name + ' Q=  %.8E # (' % scale + label + ')\n')
+
+# -------------------------------------------------------------------------- #
+
+def spectrum(seed, lowen=10, gut=True): # text of one spectrum file
+    rand = random.Random(seed)
+    msusy = rand.uniform(500., 3000.)
+    lines = []
+    lines.append('# NMSSMTools OUTPUT IN SLHA FORMAT\n')
+    lines.append('# Info about spectrum calculator\n')
+    lines.append('BLOCK SPINFO   # Program information\n')
+    lines.append('     1   NMSSMTools # Spectrum calculator\n')
+    lines.append('     2   5.5.3      # Version number\n')
+    lines.append('     8   0          # Higgs mass precision\n')
+    lines.append('# Input parameters\n')
+    lines.append('BLOCK MODSEL\n')
+    lines.append('     3     1         # NMSSM PARTICLE CONTENT\n')
+    lines.append('     1     0         # IMOD (0=general NMSSM)\n')
+    lines.append('    10     0         # ISCAN (0=no scan)\n')
+    lines.append('BLOCK SMINPUTS\n')
+    for index, value, comment in [(1, 127.92, 'ALPHA_EM^-1(MZ)'),
+            (2, 1.16639E-5, 'GF'), (3, 0.1181, 'ALPHA_S(MZ)'),
+            (4, 91.187, 'MZ'), (5, 4.18, 'MB(MB)'),
+            (6, 173.4, 'MTOP (POLE MASS)'), (7, 1.777, 'MTAU')]:
+        entry(lines, index, value, comment)
+    tanb = rand.uniform(1.5, 10.)
+    lines.append('BLOCK MINPAR\n')
+    entry(lines, 3, tanb, 'TANBETA(MZ)')
+    lines.append('BLOCK EXTPAR\n')
+    entry(lines, 0, msusy, 'MSUSY')
+    for index, comment in [(1, 'M1'), (2, 'M2'), (3, 'M3')]:
+        entry(lines, index, rand.uniform(100., 2000.), comment)
+    for index, comment in [(11, 'ATOP'), (12, 'ABOTTOM'), (13, 'ATAU'),
+            (16, 'AMUON')]:
+        entry(lines, index, rand.uniform(-3000., 3000.), comment)
+    for first, comment in [(31, 'ML'), (34, 'ME'), (41, 'MQ'), (44, 'MU'),
+            (47, 'MD')]:
+        for i in range(3):
+            entry(lines, first+i, rand.uniform(300., 3000.),
+                comment + str(i+1))
+    for index, value, comment in [(61, rand.uniform(0.01, 0.7), 'LAMBDA'),
+            (62, rand.uniform(0.01, 0.7), 'KAPPA'),
+            (63, rand.uniform(-2000., 2000.), 'ALAMBDA'),
+            (64, rand.uniform(-2000., 100.), 'AKAPPA'),
+            (65, rand.uniform(100., 1000.), 'MUEFF')]:
+        entry(lines, index, value, comment)
+    lines.append('# \n')
+    lines.append('BLOCK MASS   # Mass spectrum \n')
+    lines.append('#  PDG Ids     Mass\n')
+    for pdg, value in [(5, 4.87), (6, 173.4), (15, 1.777), (23, 91.187),
+            (24, 80.42)]:
+        entry(lines, pdg, value, 'SM')
+    higgs_masses = [rand.uniform(122., 128.)] + sorted(
+        [rand.uniform(50., 3000.) for i in range(5)])
+    for pdg, value in zip(higgses, higgs_masses):
+        entry(lines, pdg, value, 'Higgs ' + str(pdg))
+    for pdg in sfermions:
+        entry(lines, pdg, rand.uniform(300., 4000.), 'sfermion ' + str(pdg))
+    for pdg in fermions:
+        entry(lines, pdg, rand.choice([-1., 1.])*rand.uniform(50., 3000.),
+            'gaugino ' + str(pdg))
+    lines.append('# \n')
+    lines.append('# Low energy observables\n')
+    lines.append('BLOCK LOWEN\n')
+    for i in range(lowen):
+        entry(lines, i+1, rand.uniform(0., 1.)*10**(-rand.randint(0, 9)),
+            'low energy observable ' + str(i+1))
+    lines.append('# \n')
+    scale_block(lines, 'HMIX', msusy, 'STOP/SBOTTOM MASSES')
+    for index, value, comment in [(1, rand.uniform(100., 1000.), 'MUEFF'),
+            (2, tanb, 'TAN(BETA)'), (3, 243.5, 'V(Q)'),
+            (4, rand.uniform(1e5, 1e7), 'MA^2'),
+            (5, rand.uniform(1e3, 1e6), 'MP^2')]:
+        entry(lines, index, value, comment)
+    scale_block(lines, 'GAUGE', msusy, 'SUSY SCALE')
+    for index, value, comment in [(1, 0.363, 'g1(Q,DR_bar)'),
+            (2, 0.639, 'g2(Q,DR_bar)'), (3, 1.03, 'g3(Q,DR_bar)')]:
+        entry(lines, index, value, comment)
+    for name, comment in [('YU', 'HTOP'), ('YD', 'HBOT'), ('YE', 'HTAU')]:
+        scale_block(lines, name, msusy, 'SUSY SCALE')
+        lines.append('  3  3     %.8E   # ' % rand.uniform(0.01, 1.)
+            + comment + '\n')
+    for name, comment in [('AU', 'ATOP'), ('AD', 'ABOT'), ('AE', 'ATAU')]:
+        scale_block(lines, name, msusy, 'SUSY SCALE')
+        lines.append('  3  3    % .8E   # ' % rand.uniform(-3000., 3000.)
+            + comment + '\n')
+    scale_block(lines, 'MSOFT', msusy, 'SUSY SCALE')
+    for index in [1, 2, 3, 21, 22] + range(31, 50):
+        entry(lines, index, rand.uniform(100., 3000.), 'soft ' + str(index))
+    scale_block(lines, 'NMSSMRUN', msusy, 'SUSY SCALE')
+    for index in range(1, 11):
+        entry(lines, index, rand.uniform(-1., 1.), 'run ' + str(index))
+    lines.append('# \n')
+    matrix_block(lines, 'NMHMIX', orthogonal(3, rand), 'S')
+    matrix_block(lines, 'NMAMIX', [row[0:3] for row in
+        orthogonal(3, rand)[0:2]], 'P')
+    matrix_block(lines, 'STOPMIX', orthogonal(2, rand), 'T')
+    matrix_block(lines, 'SBOTMIX', orthogonal(2, rand), 'B')
+    matrix_block(lines, 'STAUMIX', orthogonal(2, rand), 'L')
+    matrix_block(lines, 'NMNMIX', orthogonal(5, rand), 'N')
+    matrix_block(lines, 'UMIX', orthogonal(2, rand), 'U')
+    matrix_block(lines, 'VMIX', orthogonal(2, rand), 'V')
+    lines.append('# \n')
+    lines.append('# Reduced couplings of the Higgs states\n')
+    lines.append('BLOCK REDCOUP\n')
+    for higgs in range(1, 6):
+        for coupling in range(1, 8):
+            lines.append(str(higgs).rjust(3) + str(coupling).rjust(3)
+                + '     %.8E   # reduced coupling\n' % rand.uniform(0., 1.))
+    if gut:
+        gut_scale = rand.uniform(1e16, 3e16)
+        lines.append('# \n')
+        lines.append('# GUT scale parameters\n')
+        scale_block(lines, 'GAUGE', gut_scale, 'GUT SCALE')
+        for index in range(1, 4):
+            entry(lines, index, 0.7, 'g' + str(index) + '(MGUT)')
+        for name in ['YU', 'YD', 'YE', 'AU', 'AD', 'AE']:
+            scale_block(lines, name, gut_scale, 'GUT SCALE')
+            lines.append('  3  3    % .8E   # ' % rand.uniform(-1., 1.)
+                + name + '(MGUT)\n')
+        scale_block(lines, 'MSOFT', gut_scale, 'GUT SCALE')
+        for index in [1, 2, 3, 21, 22] + range(31, 50):
+            entry(lines, index, rand.uniform(100., 3000.),
+                'soft ' + str(index) + '(MGUT)')
+        scale_block(lines, 'NMSSMRUN', gut_scale, 'GUT SCALE')
+        for index in range(1, 11):
+            entry(lines, index, rand.uniform(-1., 1.),
+                'run ' + str(index) + '(MGUT)')
+    return ''.join(lines)
+
+def decays(seed, channels=20, parents=None): # text of one decay file
+    if parents is None:
+        parents = higgses + [6] + sfermions + fermions
+    rand = random.Random(seed + 1000003)
+    lines = []
+    lines.append('# HIGGS + TOP BRANCHING RATIOS IN SLHA FORMAT\n')
+    lines.append('# Info about decay package\n')
+    lines.append('BLOCK DCINFO   # Program information\n')
+    lines.append('     1   NMSSMTools # Decay package\n')
+    lines.append('     2   5.5.3      # Version number\n')
+    lines.append('#           PDG          Width\n')
+    for parent in parents:
+        weights = [rand.random()*10**(-rand.randint(0, 8))
+            for i in range(channels)]
+        total = sum(weights)
+        lines.append('DECAY' + str(parent).rjust(13)
+            + '   %.8E' % rand.uniform(1e-3, 10.)
+            + '   # particle ' + str(parent) + '\n')
+        lines.append('#          BR         NDA      ID1       ID2\n')
+        for weight in weights:
+            first = rand.choice(decay_products)
+            second = rand.choice(decay_products)
+            lines.append('     %.8E    2' % (weight / total)
+                + str(first).rjust(10) + str(-second).rjust(10)
+                + '   # BR(' + str(parent) + ' -> ' + str(first) + ' '
+                + str(-second) + ')\n')
+    return ''.join(lines)
+
+def write_scan(directory, points, channels=20, lowen=10, gut=True, first=0):
+    # writes spectrN.dat/decayN.dat, returns list of (spectrum, decay) names
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    names = []
+    for n in range(first, first + points):
+        spectname = os.path.join(directory, 'spectr' + str(n) + '.dat')
+        decayname = os.path.join(directory, 'decay' + str(n) + '.dat')
+        spectfile = open(spectname,'w')
+        spectfile.write(spectrum(n, lowen, gut))
+        spectfile.close()
+        decayfile = open(decayname,'w')
+        decayfile.write(decays(n, channels))
+        decayfile.close()
+        names.append((spectname, decayname))
+    return names
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write synthetic NMSSMTools spectrum and decay files.')
+    parser.add_argument('directory')
+    parser.add_argument('points', type=int)
+    parser.add_argument('--first', type=int, default=0,
+        help='number of the first point')
+    parser.add_argument('--channels', type=int, default=20,
+        help='decay channels per particle')
+    parser.add_argument('--lowen', type=int, default=10,
+        help='entries in BLOCK LOWEN')
+    parser.add_argument('--no-gut', action='store_true',
+        help='leave out the GUT scale blocks')
+    args = parser.parse_args(argv)
+    write_scan(args.directory, args.points, args.channels, args.lowen,
+        not args.no_gut, args.first)
+
+if __name__ == '__main__':
+    main()
@@ -9,15 +9,26 @@
 # in FeynRules (UFO model) which can then be used in Madgraph 5. 
 # LIMITATIONS: does not pass GUT scale info, does not pass metadata
 #
-# Requires: SLHAblock.py.
+# Requires: SLHAblock.py, SLHAreader.py, SLHAdecay.py, CompressedIO.py,
+#           TransformPlan.py.
 #
 # Example use: python Tools2Param.py spectr1.dat decay1.dat param_card.dat
 #                     (this file)    (spectrum)  (decays)   (output file)
 #
+# The conversion is split into functions (load_blocks, make_block_dictionary,
+# check_blocks, convert_blocks, write_card) so that BatchScan.py can run
+# many points in one process; tools2param() strings them together. Importing
+# this file has no side effects: scan drivers can use Converter (see the
+# bottom of the file) to convert in-process, the command line is main().
+# Options: -q (no banner/memos), --br-min, --decays-of, --strict, --stats.
+# Inputs may be compressed (gzip, bzip2, xz, zstd; see CompressedIO.py), and
+# the card is compressed if its name ends in .gz, .bz2, .xz or .zst.
+#
 # REMARK: Actually, I don't *strictly* adhere to SLHA2 since I don't order
 # my squarks by mass. This, however, makes it easier to work with models
 # in which the third generation is special (as assumed in SLHA1) since one
 # doesn't have to figure out which particle ID corresponds to which squark.
+# With --strict the sfermions are ordered by mass (see order_sfermions).
 #
 # Remark: MG uses gauge couplings derived from SM inputs, so BLOCK GAUGE
 # doesn't seem to used for anything.
@@ -25,53 +36,47 @@
 # -------------------------------------------------------------------------- #
 
 import sys # module for accessing arguments
+import json
+import argparse
+from StringIO import StringIO
 from SLHAblock import SLHAblock # the SLHAblock class
+from SLHAreader import read_blocks # streaming reader for the spectrum
+from SLHAdecay import DecayTable # parsed decay tables, for pruning
+from ConvertStats import Stats # optional timing and counters
+from TransformPlan import TransformPlan # the SLHA1 -> SLHA2 transforms
+from CompressedIO import open_input, open_output # plain or compressed
 
-spectfile = open(sys.argv[1],'r')	# Open spectrum file for reading
-decayfile = open(sys.argv[2],'r')	# Open spectrum file for reading
-writefile = open(sys.argv[3],'w')	# Create file for writing
-
-blocklist = [] # List of blocks
+version = '3.1' # change when the cards come out differently (see ConvertCache)
 
-# Print out a list of caveats
+def print_banner(): # Print out a list of caveats
 
-# print "Tools2Param version 3.0, alpha version"
-# print "by Flip Tanedo, 3 June 2012... use at your own risk"
+    # print "Tools2Param version 3.0, alpha version"
+    # print "by Flip Tanedo, 3 June 2012... use at your own risk"
 
-print "\n"
+    print "\n"
 
-print "########################################################"
-print "## Tools2Param: convert SLHA1 to SLHA2                ##"
-print "##  by Flip Tanedo, pt267@cornell.edu                 ##"
-print "##  Version 3; 3 June 2012... use at your own risk!   ##"
-print "########################################################\n"
+    print "########################################################"
+    print "## Tools2Param: convert SLHA1 to SLHA2                ##"
+    print "##  by Flip Tanedo, pt267@cornell.edu                 ##"
+    print "##  Version 3; 3 June 2012... use at your own risk!   ##"
+    print "########################################################\n"
 
-print "Memo: No QNUMBER blocks printed, please include these"
-print "      by hand if you will eventually pass to Pythia."
-print "Memo: Non-recognized blocks are dropped. Please modify"
-print "      if you want to include vestigial blocks."
+    print "Memo: No QNUMBER blocks printed, please include these"
+    print "      by hand if you will eventually pass to Pythia."
+    print "Memo: Non-recognized blocks are dropped. Please modify"
+    print "      if you want to include vestigial blocks."
 
-print "\n"
+    print "\n"
 
-for line in spectfile: # load data
-    if line.split() == []: # if the line is whitespace
-        continue # skip this line
-    if (len(blocklist) == 0) & (line.split()[0].upper() != 'BLOCK'):
-        # if no blocks yet defined and this line isn't a new block
-        continue # skip this line
-    if line.split()[0].upper()=='BLOCK': # start new block
-        if line.split()[1].upper()=='SPINFO': 
-            continue # skip metadata at beginning of file 
-            # If you want you can re-read spectfile and output
-            #   the metadata to put into the param card
-        else:
-            blocklist.append(SLHAblock(line))
-    elif (line.split()[0] == '#') | (line.split()[0] == ''):
-        continue # skip this line
-    else: # then this must be data
-        blocklist[len(blocklist)-1].add_line(line)
+# -------------------------------------------------------------------------- #
 
-spectfile.close()        
+def load_blocks(spectfile, wanted=None, stats=None): # load data
+    # returns list of blocks
+    # read_blocks skips SPINFO metadata at beginning of file, GUT blocks and
+    # (if given a set of names) every block that isn't wanted
+    # If you want you can re-read spectfile and output
+    #   the metadata to put into the param card
+    return list(read_blocks(spectfile, wanted, stats=stats))
 
 # for item in blocklist: # print data
 #     item.printblock()
@@ -82,12 +87,14 @@ spectfile.close()
 ## Processing
 # write a dictionary mapping block and blockname (handy for choosing to print)
 
-block_dictionary = dict() # Initialize dictionary
-for item in blocklist:
-    if 'GUT' in item.input_data.upper():
-        continue #  don't want no stinkin' GUT parameters in our param_card
-    else:
-        block_dictionary[item.name] = item
+def make_block_dictionary(blocklist):
+    block_dictionary = dict() # Initialize dictionary
+    for item in blocklist:
+        if 'GUT' in item.input_data.upper():
+            continue #  don't want no stinkin' GUT parameters in our param_card
+        else:
+            block_dictionary[item.name] = item
+    return block_dictionary
 
 # List of required blocks
 required_blocks = [
@@ -111,219 +118,152 @@ required_blocks = [
     'NMSSMRUN'
     ]
 
-# Check for required blocks
-block_check = True
-for item in required_blocks:
-    if not (item in block_dictionary):
-        print "ERROR: missing " + item + " from input file" 
-        block_check = False
+def check_blocks(block_dictionary, verbose=True): # Check for required blocks
+    block_check = True
+    for item in required_blocks:
+        if not (item in block_dictionary):
+            if verbose:
+                print "ERROR: missing " + item + " from input file" 
+            block_check = False
 
-if block_check:
-    print "All required blocks present. Good for you."
+    if block_check and verbose:
+        print "All required blocks present. Good for you."
+    return block_check
 
 # -------------------------------------------------------------------------- #
 
 ## Now modify the appropriate blocks
 
-## Trilinear scalar couplings: convert from A to T
-
-if 'TU' in block_dictionary:
-    print "WARNING: TU already defined, overwriting"
-    
-block_dictionary['TU'] = SLHAblock(
-    "BLOCK TU # generated by Tools2Param: Tii = Aii yii\n")
-for i in range(0,3):
-    if ( block_dictionary['YU'].exists(i+1,i+1) &
-         block_dictionary['AU'].exists(i+1,i+1) ):
-            block_dictionary['TU'].add_data(i+1,i+1, 
-                block_dictionary['AU'].get(i+1,i+1)*
-                block_dictionary['YU'].get(i+1,i+1))
-
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-if 'TD' in block_dictionary:
-    print "WARNING: TD already defined, overwriting"
-    
-block_dictionary['TD'] = SLHAblock(
-    "BLOCK TD # generated by Tools2Param: Tii = Aii yii\n")
-for i in range(0,3):
-    if ( block_dictionary['YD'].exists(i+1,i+1) &
-         block_dictionary['AD'].exists(i+1,i+1) ):
-            block_dictionary['TD'].add_data(i+1,i+1, 
-                block_dictionary['AD'].get(i+1,i+1)*
-                block_dictionary['YD'].get(i+1,i+1))
-
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-if 'TE' in block_dictionary:
-    print "WARNING: TE already defined, overwriting"
-    
-block_dictionary['TE'] = SLHAblock(
-    "BLOCK TE # generated by Tools2Param: Tii = Aii yii\n")
-for i in range(0,3):
-    if ( block_dictionary['YE'].exists(i+1,i+1) &
-         block_dictionary['AE'].exists(i+1,i+1) ):
-            block_dictionary['TE'].add_data(i+1,i+1, 
-                block_dictionary['AE'].get(i+1,i+1)*
-                block_dictionary['YE'].get(i+1,i+1))
-
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-## Sfermion mixing: only third generation
-
-if 'USQMIX' in block_dictionary:
-    print "WARNING: USQMIX already defined, overwriting"
-    
-block_dictionary['USQMIX'] = SLHAblock(
-    "BLOCK USQMIX # generated by Tools2Param from STOPMIX\n")
-for i in range(0,5): # initialize with unit matrix
-    block_dictionary['USQMIX'].add_data(i+1,i+1,1)
-
-block_dictionary['USQMIX'].add_data(3,3,
-    block_dictionary['STOPMIX'].get(1,1)
-    )
-    
-block_dictionary['USQMIX'].add_data(3,6,
-    block_dictionary['STOPMIX'].get(1,2)
-    )
-    
-block_dictionary['USQMIX'].add_data(6,3,
-    block_dictionary['STOPMIX'].get(2,1)
-    )
-    
-block_dictionary['USQMIX'].add_data(6,6,
-    block_dictionary['STOPMIX'].get(2,2)
-    )
-    
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-if 'DSQMIX' in block_dictionary:
-    print "WARNING: DSQMIX already defined, overwriting"
-    
-block_dictionary['DSQMIX'] = SLHAblock(
-    "BLOCK DSQMIX # generated by Tools2Param from SBOTMIX\n")
-for i in range(0,5): # initialize with unit matrix
-    block_dictionary['DSQMIX'].add_data(i+1,i+1,1)
-
-block_dictionary['DSQMIX'].add_data(3,3,
-    block_dictionary['SBOTMIX'].get(1,1)
-    )
-    
-block_dictionary['DSQMIX'].add_data(3,6,
-    block_dictionary['SBOTMIX'].get(1,2)
-    )
-    
-block_dictionary['DSQMIX'].add_data(6,3,
-    block_dictionary['SBOTMIX'].get(2,1)
-    )
-    
-block_dictionary['DSQMIX'].add_data(6,6,
-    block_dictionary['SBOTMIX'].get(2,2)
-    )
-    
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-if 'SELMIX' in block_dictionary:
-    print "WARNING: SELMIX already defined, overwriting"
-    
-block_dictionary['SELMIX'] = SLHAblock(
-    "BLOCK SELMIX # generated by Tools2Param from STAUMIX\n")
-for i in range(0,5): # initialize with unit matrix
-    block_dictionary['SELMIX'].add_data(i+1,i+1,1)
-
-block_dictionary['SELMIX'].add_data(3,3,
-    block_dictionary['STAUMIX'].get(1,1)
-    )
-    
-block_dictionary['SELMIX'].add_data(3,6,
-    block_dictionary['STAUMIX'].get(1,2)
-    )
-    
-block_dictionary['SELMIX'].add_data(6,3,
-    block_dictionary['STAUMIX'].get(2,1)
-    )
-    
-block_dictionary['SELMIX'].add_data(6,6,
-    block_dictionary['STAUMIX'].get(2,2)
-    )
-
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-## Soft masses in the chiral basis, extract from EXTPAR
-
-if 'MSQ2' in block_dictionary:
-    print "WARNING: MSQ2 already defined, overwriting"
-if 'MSU2' in block_dictionary:
-    print "WARNING: MSU2 already defined, overwriting"
-if 'MSD2' in block_dictionary:
-    print "WARNING: MSD2 already defined, overwriting"
-if 'MSL2' in block_dictionary:
-    print "WARNING: MSL2 already defined, overwriting"
-if 'MSE2' in block_dictionary:
-    print "WARNING: MSE2 already defined, overwriting"
-
-block_dictionary['MSQ2'] = SLHAblock(
-    "BLOCK MSQ2 # generated by Tools2Param from EXTPAR\n")
-block_dictionary['MSU2'] = SLHAblock(
-    "BLOCK MSU2 # generated by Tools2Param from EXTPAR\n")
-block_dictionary['MSD2'] = SLHAblock(
-    "BLOCK MSD2 # generated by Tools2Param from EXTPAR\n")
-block_dictionary['MSL2'] = SLHAblock(
-    "BLOCK MSL2 # generated by Tools2Param from EXTPAR\n")
-block_dictionary['MSE2'] = SLHAblock(
-    "BLOCK MSE2 # generated by Tools2Param from EXTPAR\n")
-    
-for i in range (0,3):
-    if block_dictionary['EXTPAR'].exists(31+i):
-        block_dictionary['MSL2'].add_data(i+1, i+1, 
-            pow(block_dictionary['EXTPAR'].get(31+i),2))
-    if block_dictionary['EXTPAR'].exists(34+i):
-        block_dictionary['MSE2'].add_data(i+1, i+1, 
-            pow(block_dictionary['EXTPAR'].get(34+i),2))
-    if block_dictionary['EXTPAR'].exists(41+i):
-        block_dictionary['MSQ2'].add_data(i+1, i+1, 
-            pow(block_dictionary['EXTPAR'].get(41+i),2))
-    if block_dictionary['EXTPAR'].exists(44+i):
-        block_dictionary['MSU2'].add_data(i+1, i+1, 
-            pow(block_dictionary['EXTPAR'].get(44+i),2))
-    if block_dictionary['EXTPAR'].exists(47+i):
-        block_dictionary['MSD2'].add_data(i+1, i+1, 
-            pow(block_dictionary['EXTPAR'].get(47+i),2))
+# BLOCK lines of the blocks generated by Tools2Param
+generated_headers = {
+    'TU' :
+        "BLOCK TU # generated by Tools2Param: Tii = Aii yii\n",
+    'TD' :
+        "BLOCK TD # generated by Tools2Param: Tii = Aii yii\n",
+    'TE' :
+        "BLOCK TE # generated by Tools2Param: Tii = Aii yii\n",
+    'USQMIX' :
+        "BLOCK USQMIX # generated by Tools2Param from STOPMIX\n",
+    'DSQMIX' :
+        "BLOCK DSQMIX # generated by Tools2Param from SBOTMIX\n",
+    'SELMIX' :
+        "BLOCK SELMIX # generated by Tools2Param from STAUMIX\n",
+    'MSQ2' :
+        "BLOCK MSQ2 # generated by Tools2Param from EXTPAR\n",
+    'MSU2' :
+        "BLOCK MSU2 # generated by Tools2Param from EXTPAR\n",
+    'MSD2' :
+        "BLOCK MSD2 # generated by Tools2Param from EXTPAR\n",
+    'MSL2' :
+        "BLOCK MSL2 # generated by Tools2Param from EXTPAR\n",
+    'MSE2' :
+        "BLOCK MSE2 # generated by Tools2Param from EXTPAR\n",
+    'VCKM' :
+        "BLOCK VCKM # generated by Tools2Param: unit matrix\n",
+    'UPMNS' :
+        "BLOCK UPMNS # generated by Tools2Param: unit matrix\n",
+    'SNUMIX' :
+        "BLOCK SNUMIX # generated by Tools2Param: unit matrix\n",
+    }
+
+# Rules for TransformPlan (see TransformPlan.py): target block, operation,
+# source blocks, list of (target index, source index or constant value)
+
+diagonal = [(i,i) for i in range(1,4)]
+third_generation = [((3,3),(1,1)), ((3,6),(1,2)), ((6,3),(2,1)), ((6,6),(2,2))]
+
+transform_rules = [
+    ## Trilinear scalar couplings: convert from A to T, Tii = Aii yii
+    ('TU', 'product', ['AU','YU'], [(ii, ii) for ii in diagonal]),
+    ('TD', 'product', ['AD','YD'], [(ii, ii) for ii in diagonal]),
+    ('TE', 'product', ['AE','YE'], [(ii, ii) for ii in diagonal]),
+    ## Sfermion mixing: only third generation, unit matrix otherwise
+    ('USQMIX', 'constant', [], [((i,i), 1) for i in range(1,6)]),
+    ('USQMIX', 'copy', ['STOPMIX'], third_generation),
+    ('DSQMIX', 'constant', [], [((i,i), 1) for i in range(1,6)]),
+    ('DSQMIX', 'copy', ['SBOTMIX'], third_generation),
+    ('SELMIX', 'constant', [], [((i,i), 1) for i in range(1,6)]),
+    ('SELMIX', 'copy', ['STAUMIX'], third_generation),
+    ## Soft masses in the chiral basis, squares of EXTPAR entries
+    ('MSQ2', 'square', ['EXTPAR'], [((i,i), (40+i,)) for i in range(1,4)]),
+    ('MSU2', 'square', ['EXTPAR'], [((i,i), (43+i,)) for i in range(1,4)]),
+    ('MSD2', 'square', ['EXTPAR'], [((i,i), (46+i,)) for i in range(1,4)]),
+    ('MSL2', 'square', ['EXTPAR'], [((i,i), (30+i,)) for i in range(1,4)]),
+    ('MSE2', 'square', ['EXTPAR'], [((i,i), (33+i,)) for i in range(1,4)]),
+    ## Unit matrix for CKM and PMNS, unit sneutrino mixing matrix
+    ('VCKM', 'constant', [], [(ii, 1) for ii in diagonal]),
+    ('UPMNS', 'constant', [], [(ii, 1) for ii in diagonal]),
+    ('SNUMIX', 'constant', [], [(ii, 1) for ii in diagonal]),
+    ]
 
 ## Fix MSOFT to only include gauginos and higgsino masses (strip others)
 ## ... acutually, so what if there's extra info? Worry about this later.
 
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-## Unit matrix for CKM and PMNS
-
-if 'VCKM' in block_dictionary:
-    print "WARNING: VCKM already defined, overwriting"
-if 'UPMNS' in block_dictionary:
-    print "WARNING: UPMNS already defined, overwriting"
-
-block_dictionary['VCKM'] = SLHAblock(
-    "BLOCK VCKM # generated by Tools2Param: unit matrix\n")
-block_dictionary['UPMNS'] = SLHAblock(
-    "BLOCK UPMNS # generated by Tools2Param: unit matrix\n")
-
-for i in range (0,3):
-    block_dictionary['VCKM'].add_data(i+1,i+1,1)
-    block_dictionary['UPMNS'].add_data(i+1,i+1,1)
-    
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-
-## unit sneutrino mixing matrix
-
-if 'SNUMIX' in block_dictionary:
-    print "WARNING: SNUMIX already defined, overwriting"
-
-block_dictionary['SNUMIX'] = SLHAblock(
-    "BLOCK SNUMIX # generated by Tools2Param: unit matrix\n")
-
-for i in range (0,3):
-    block_dictionary['SNUMIX'].add_data(i+1,i+1,1)
+transform_plan = TransformPlan(transform_rules, generated_headers)
+
+def new_block(block_dictionary, name, verbose=True):
+    # add a block generated by Tools2Param, warn if it replaces an input block
+    return transform_plan.new_block(block_dictionary, name, verbose)
+
+def convert_blocks(block_dictionary, verbose=True):
+    # all the transforms above; missing A, y or EXTPAR entries are skipped,
+    # a missing STOPMIX, SBOTMIX or STAUMIX entry is a KeyError
+    return transform_plan.apply(block_dictionary, verbose)
+
+## Strict SLHA2 (optional, --strict): sfermions ordered by mass
+# The rows of each mixing block are the mass eigenstates with these PDG ids,
+# in this order. Sorted by mass, state i gets the i-th id: the MASS entries
+# (with their comments) and the rows of the mixing block move with it, and
+# the decay table is relabelled to match (see write_card). Points that are
+# already in order come out unchanged. ScanArrays.order_batch does the same
+# for a batch of points with numpy.
+
+sfermion_states = [
+    ('USQMIX', [1000002, 1000004, 1000006, 2000002, 2000004, 2000006]),
+    ('DSQMIX', [1000001, 1000003, 1000005, 2000001, 2000003, 2000005]),
+    ('SELMIX', [1000011, 1000013, 1000015, 2000011, 2000013, 2000015]),
+    ('SNUMIX', [1000012, 1000014, 1000016]),
+    ]
 
+def state_masses(block_dictionary, states): # MASS of the states, in order
+    mass = block_dictionary['MASS']
+    masses = []
+    for pdg in states:
+        if (pdg,) not in mass.index:
+            raise KeyError('MASS' + str((pdg,)))
+        masses.append(mass.index[(pdg,)].value)
+    return masses
+
+def reorder_states(block_dictionary, name, states, order):
+    # state i becomes the old state order[i]; returns {old pdg : new pdg}
+    # of the states that moved. Only the MASS values move: the comment of a
+    # line names its PDG id, which stays
+    mass = block_dictionary['MASS']
+    data = [mass.index[(pdg,)] for pdg in states]
+    moved = [datum.value for datum in data]
+    for i in range(len(states)):
+        data[i].value = moved[order[i]]
+    new_row = dict([(order[i] + 1, i + 1) for i in range(len(states))])
+    block = block_dictionary[name]
+    entries = sorted([((new_row.get(datum.index[0], datum.index[0]),
+        datum.index[1]), datum.value) for datum in block.data])
+    block_dictionary[name] = SLHAblock(block.input_data)
+    block_dictionary[name].add_entries([entry[0] for entry in entries],
+        [entry[1] for entry in entries])
+    return dict([(states[order[i]], states[i])
+        for i in range(len(states)) if order[i] != i])
+
+def order_sfermions(block_dictionary): # after convert_blocks
+    # strict SLHA2 mass ordering of one point, returns {old pdg : new pdg}
+    # (empty if already in order); a missing MASS entry is a KeyError
+    relabel = dict()
+    for name, states in sfermion_states:
+        masses = state_masses(block_dictionary, states)
+        order = sorted(range(len(states)), key=lambda k: masses[k])
+        if order != range(len(states)):
+            relabel.update(reorder_states(block_dictionary, name, states,
+                order))
+    return relabel
 
 # -------------------------------------------------------------------------- #
 
@@ -372,17 +312,6 @@ for i in range (0,3):
 # QUANTUM NUMBERS (AUTO GEN BY FEYNRULES)
 
 
-
-# Now write to file
-# Place a header
-writefile.write("########################################################\n")
-writefile.write("## PARAM_CARD generated by MCSSMTools and Tools2Param ##\n")
-writefile.write("##  by Flip Tanedo, pt267@cornell.edu                 ##\n")
-writefile.write("##  Version 3; 3 June 2012... use at your own risk!   ##\n")
-writefile.write("########################################################\n")
-writefile.write("\n")
-
-
 # # Now fill it up: old version, fill from blocklist
 # for item in blocklist:
 #     item.write(writefile)
@@ -432,30 +361,276 @@ write_blocks = [
     'LOWEN'
     ]
 
-for item in write_blocks:
-    block_dictionary[item].write(writefile)
+# blocks read from the spectrum file, everything else is skipped unparsed
+wanted_blocks = set(required_blocks + write_blocks)
+
+copy_buffer = 1 << 20 # bytes per read/write when copying the decays
+
+def copy_decays(decayfile, writefile): # decay table copied verbatim
+    # returns number of lines copied. A file is copied in big chunks, not
+    # line by line (python 2 has no os.sendfile); a list of lines as is
+    if not hasattr(decayfile, 'read'):
+        decayfile = list(decayfile)
+        writefile.writelines(decayfile)
+        return len(decayfile)
+    lines_copied = 0
+    chunk = decayfile.read(copy_buffer)
+    last = '\n'
+    while chunk:
+        writefile.write(chunk)
+        lines_copied += chunk.count('\n')
+        last = chunk[-1]
+        chunk = decayfile.read(copy_buffer)
+    if last != '\n': # last line without a newline
+        lines_copied += 1
+    return lines_copied
+
+card_header = (
+    "########################################################\n"
+    "## PARAM_CARD generated by MCSSMTools and Tools2Param ##\n"
+    "##  by Flip Tanedo, pt267@cornell.edu                 ##\n"
+    "##  Version 3; 3 June 2012... use at your own risk!   ##\n"
+    "########################################################\n"
+    "\n")
+
+def write_card(block_dictionary, decayfile, writefile,
+        br_min=None, decay_parents=None, stats=None, relabel=None):
+    # Now write to file
+    # stats: optional ConvertStats.Stats, times 'write' and 'decays'
+    # relabel: {old pdg : new pdg} from order_sfermions, applied to the
+    #   decay table
+    if stats is not None:
+        stats.start('write')
+    # Place a header
+    writefile.write(card_header)
+
+    for item in write_blocks:
+        block_dictionary[item].write(writefile)
+        writefile.write('\n')
+
+    if stats is not None:
+        stats.stop()
+        for item in write_blocks:
+            stats.count('entries_written', len(block_dictionary[item].data))
+
+    write_decay_section(decayfile, writefile, br_min, decay_parents, stats,
+        relabel)
+
+def write_decay_section(decayfile, writefile, br_min=None, decay_parents=None,
+        stats=None, relabel=None): # the second half of write_card
+    if stats is not None:
+        stats.start('decays')
+
+    # . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
+    # DECAY DATA
+    # copied line by line unless channels (BR < br_min) or particles (not
+    # in decay_parents) are to be dropped or particles relabelled, then
+    # rewritten from a DecayTable
+
+    prune_decays = (br_min is not None) or (decay_parents is not None)
+    rewrite_decays = prune_decays or bool(relabel)
+
     writefile.write('\n')
+    writefile.write("########################################################\n")
+    if prune_decays:
+        writefile.write("## DECAY TABLE, pruned from source by Tools2Param     ##\n")
+    elif rewrite_decays:
+        writefile.write("## DECAY TABLE, relabelled by Tools2Param (by mass)   ##\n")
+    else:
+        writefile.write("## DECAY TABLE, copied directly from source           ##\n")
+    writefile.write("########################################################\n")
 
-# . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . . .#
-# DECAY DATA
+    writefile.write('\n')
+    if rewrite_decays:
+        decays = DecayTable(decayfile)
+        if relabel:
+            decays.relabel(relabel)
+        decays.write(writefile, br_min, decay_parents)
+    else:
+        lines_copied = copy_decays(decayfile, writefile)
 
-writefile.write('\n')
-writefile.write("########################################################\n")
-writefile.write("## DECAY TABLE, copied directly from source           ##\n")
-writefile.write("########################################################\n")
+    if stats is not None:
+        stats.stop()
+        if not rewrite_decays:
+            stats.count('decay_lines_copied', lines_copied)
 
+    # QUANTUM NUMBERS (AUTO GEN BY FEYNRULES)
 
-writefile.write('\n')
-for line in decayfile:
-    writefile.write(line)
+# -------------------------------------------------------------------------- #
 
-decayfile.close()
+def read_spectrum(spectfile, stats=None): # block dictionary of a spectrum
+    # stats: optional ConvertStats.Stats; then the file is read in one go
+    # first so that 'read' (I/O) and 'parse' are timed separately
+    if stats is None:
+        return make_block_dictionary(load_blocks(spectfile, wanted_blocks))
+    stats.start('read')
+    lines = spectfile.readlines()
+    stats.stop()
+    stats.start('parse')
+    block_dictionary = make_block_dictionary(
+        load_blocks(lines, wanted_blocks, stats))
+    stats.stop()
+    return block_dictionary
+
+def tools2param(spectname, decayname, writename, verbose=True,
+        br_min=None, decay_parents=None, stats=None, strict=False):
+    # convert one spectrum/decay pair into a param card, returns block_check
+    # br_min, decay_parents: prune the decay table, see write_card
+    # strict: order the sfermions by mass, see order_sfermions
+    # stats: optional ConvertStats.Stats to time the stages and count
+    spectfile = open_input(spectname)	# Open spectrum file for reading
+    decayfile = open_input(decayname)	# Open spectrum file for reading
+    writefile = open_output(writename)	# Create file for writing
+    try:
+        block_dictionary = read_spectrum(spectfile, stats)
+        spectfile.close()
+        block_check = check_blocks(block_dictionary, verbose)
+        if stats is not None:
+            stats.start('transform')
+        convert_blocks(block_dictionary, verbose)
+        relabel = None
+        if strict:
+            relabel = order_sfermions(block_dictionary)
+        if stats is not None:
+            stats.stop()
+        write_card(block_dictionary, decayfile, writefile,
+            br_min, decay_parents, stats, relabel)
+    finally:
+        spectfile.close()
+        decayfile.close()
+        writefile.close()
+    return block_check
 
+# -------------------------------------------------------------------------- #
 
-# QUANTUM NUMBERS (AUTO GEN BY FEYNRULES)
+## Library use: Converter and ParamCard, no printing unless asked for
+#
+#   from Tools2Param import Converter
+#   converter = Converter()                    # keep it for the whole scan
+#   card = converter.convert('spectr1.dat', 'decay1.dat')
+#   card.block_dictionary['MASS'].get(25)      # converted blocks
+#   card.write(open('param_card.dat','w'))     # or card.tostring()
+#
+# Inputs may be file names, open files (anything iterating over lines) or
+# the SLHA text itself; a string with a newline in it is taken as text.
+
+def source_lines(source): # file name, file object or SLHA text -> lines
+    if isinstance(source, basestring):
+        if '\n' in source:
+            return source.splitlines(True)
+        infile = open_input(source)
+        try:
+            return infile.readlines()
+        finally:
+            infile.close()
+    return list(source)
+
+class ParamCard:
+    """A converted param card: SLHA2 blocks and the decay table.
+
+    Attributes: block_dictionary, decay_lines, block_check, br_min,
+        decay_parents, relabel
+    Methods: write, tostring
+    """
+
+    def __init__(self, block_dictionary, decay_lines, block_check=True,
+            br_min=None, decay_parents=None, relabel=None):
+        self.block_dictionary = block_dictionary # after convert_blocks
+        self.decay_lines = decay_lines # decay file, as a list of lines
+        self.block_check = block_check # all required blocks were there
+        self.br_min = br_min # decay pruning, see write_card
+        self.decay_parents = decay_parents
+        self.relabel = relabel # strict SLHA2 relabelling of the decays
+
+    def write(self, outstream, stats=None): # output card to file
+        write_card(self.block_dictionary, self.decay_lines, outstream,
+            self.br_min, self.decay_parents, stats, self.relabel)
+
+    def tostring(self): # the card as a string
+        outstream = StringIO()
+        self.write(outstream)
+        return outstream.getvalue()
+
+class Converter:
+    """Converts NMSSMTools spectrum/decay pairs into ParamCards.
+
+    Attributes: verbose, br_min, decay_parents, strict
+    Methods: convert, convert_file
+    """
+
+    def __init__(self, verbose=False, br_min=None, decay_parents=None,
+            strict=False):
+        self.verbose = verbose # print block check and overwrite warnings
+        self.br_min = br_min # decay pruning, see write_card
+        self.decay_parents = decay_parents
+        self.strict = strict # order the sfermions by mass
+
+    def convert(self, spectrum, decays, stats=None): # returns a ParamCard
+        # stats: optional ConvertStats.Stats ('write'/'decays' are only
+        # timed when the card is written)
+        if stats is not None:
+            stats.start('read')
+        spectrum_lines = source_lines(spectrum)
+        if stats is not None:
+            stats.stop()
+        block_dictionary = read_spectrum(spectrum_lines, stats)
+        block_check = check_blocks(block_dictionary, self.verbose)
+        if stats is not None:
+            stats.start('transform')
+        convert_blocks(block_dictionary, self.verbose)
+        relabel = None
+        if self.strict:
+            relabel = order_sfermions(block_dictionary)
+        if stats is not None:
+            stats.stop()
+        return ParamCard(block_dictionary, source_lines(decays), block_check,
+            self.br_min, self.decay_parents, relabel)
+
+    def convert_file(self, spectrum, decays, writename, stats=None):
+        # convert and write the card to file writename, returns the card
+        card = self.convert(spectrum, decays, stats)
+        writefile = open_output(writename)
+        try:
+            card.write(writefile, stats)
+        finally:
+            writefile.close()
+        return card
 
+# -------------------------------------------------------------------------- #
 
-writefile.close()
+def main(argv=None): # command line, see the top of this file
+    parser = argparse.ArgumentParser(
+        description='Convert NMSSMTools (SLHA1) output to an SLHA2 param card.')
+    parser.add_argument('spectrum', help='NMSSMTools spectrum, e.g. spectr1.dat')
+    parser.add_argument('decays', help='NMSSMTools decays, e.g. decay1.dat')
+    parser.add_argument('output', help='param card to write')
+    parser.add_argument('-q', '--quiet', action='store_true',
+        help="don't print the banner, memos, block check and warnings")
+    parser.add_argument('--br-min', type=float, default=None,
+        help='drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays-of', default=None,
+        help='comma separated PDG ids: only write these DECAY tables')
+    parser.add_argument('--strict', action='store_true',
+        help='strict SLHA2: order the sfermion mass eigenstates by mass')
+    parser.add_argument('--stats', action='store_true',
+        help='print timing and counters of the conversion as JSON')
+    args = parser.parse_args(argv)
+
+    decay_parents = None
+    if args.decays_of is not None:
+        decay_parents = set([int(item) for item in args.decays_of.split(',')])
+    stats = None
+    if args.stats:
+        stats = Stats()
+    if not args.quiet:
+        print_banner()
+    tools2param(args.spectrum, args.decays, args.output, not args.quiet,
+        args.br_min, decay_parents, stats, args.strict)
+    if stats is not None:
+        print json.dumps(stats.record(point=args.spectrum))
+
+if __name__ == '__main__':
+    main()
 
 # Things to do here: look at writefile and check for data
 # to do: skip GUT blocks use "in" command
@@ -0,0 +1,123 @@
+# TransformPlan: table-driven SLHA1 -> SLHA2 block transforms -------------- #
+#
+# A transform is given as a table of rules
+#   (target block, operation, source blocks, entries)
+# where entries is a list of (target index, source index) pairs; the same
+# source index is looked up in every source block. Operations:
+#   'product'   product of the source entries, e.g. Tii = Aii yii
+#   'square'    the source entry squared, pow(x,2)
+#   'copy'      the source entry as it is; it has to be there
+#   'constant'  no source blocks, the "source index" is the value itself
+# Several rules may fill the same target block. The plan is checked and
+# compiled once: every target block gets one list of entries in the order
+# they are first mentioned, a later rule for the same entry replaces the
+# earlier one in place (like add_data on an existing element).
+#
+# apply() then runs the plan on a block dictionary: every target block is
+# made new (see new_block), entries whose source block or element is
+# missing are left out, except for 'copy' which raises a KeyError.
+# ScanArrays.convert_batch runs the same plan on many points with numpy.
+#
+# Requires: SLHAblock.py.
+#
+# Example use: plan = TransformPlan([('TU', 'product', ['AU', 'YU'],
+#                  [((3,3), (3,3))])], {'TU' : 'BLOCK TU\n'})
+#              plan.apply(block_dictionary)
+
+from SLHAblock import SLHAblock
+
+# operation -> number of source blocks (None: one or more)
+operations = {'product' : None, 'square' : 1, 'copy' : 1, 'constant' : 0}
+
+class TransformPlan:
+    """Compiled table of block transforms.
+
+    Attributes: rules, headers, blocks, inputs
+    Methods: new_block, apply
+    """
+
+    def __init__(self, rules, headers):
+        # rules: list of (target, operation, sources, entries) as above
+        # headers: target block name -> BLOCK line of the new block
+        self.rules = rules
+        self.headers = headers
+        self.blocks = [] # (target, [(target index, operation, sources,
+                         #   source index or constant)]) in order
+        self.inputs = set() # names of all source blocks
+        positions = dict() # target -> target index -> position in entries
+        target_entries = dict() # target -> its list in self.blocks
+        dimensions = dict() # target -> length of its index tuples
+        for target, operation, sources, entries in rules:
+            rule = target + ' (' + operation + ')'
+            if operation not in operations:
+                raise ValueError("unknown operation in rule " + rule)
+            if (operations[operation] is not None and
+                    len(sources) != operations[operation]) or \
+                    (operations[operation] is None and len(sources) == 0):
+                raise ValueError("wrong number of sources in rule " + rule)
+            if target not in headers:
+                raise ValueError("no BLOCK line for " + target)
+            if target not in positions:
+                positions[target] = dict()
+                target_entries[target] = []
+                self.blocks.append((target, target_entries[target]))
+            for target_index, source in entries:
+                if len(target_index) not in (1, 2) or \
+                        dimensions.setdefault(target,
+                            len(target_index)) != len(target_index):
+                    raise ValueError("bad index " + str(target_index)
+                        + " in rule " + rule)
+                if operation != 'constant' and \
+                        not (isinstance(source, tuple) and
+                            len(source) in (1, 2)):
+                    raise ValueError("bad source index " + str(source)
+                        + " in rule " + rule)
+                step = (target_index, operation, tuple(sources), source)
+                if target_index in positions[target]: # replace in place
+                    target_entries[target][positions[target][target_index]] \
+                        = step
+                else:
+                    positions[target][target_index] = \
+                        len(target_entries[target])
+                    target_entries[target].append(step)
+            self.inputs.update(sources)
+
+    def new_block(self, block_dictionary, name, verbose=True):
+        # add a generated block, warn if it replaces an input block
+        if verbose and (name in block_dictionary):
+            print "WARNING: " + name + " already defined, overwriting"
+        block_dictionary[name] = SLHAblock(self.headers[name])
+        return block_dictionary[name]
+
+    def apply(self, block_dictionary, verbose=True): # run on one point
+        for target, entries in self.blocks:
+            block = self.new_block(block_dictionary, target, verbose)
+            indices = []
+            values = []
+            for target_index, operation, sources, source in entries:
+                if operation == 'constant':
+                    indices.append(target_index)
+                    values.append(source)
+                    continue
+                data = []
+                for name in sources:
+                    datum = None
+                    if name in block_dictionary:
+                        datum = block_dictionary[name].index.get(source)
+                    if datum is None:
+                        break
+                    data.append(datum.value)
+                if len(data) < len(sources): # an input is missing
+                    if operation == 'copy':
+                        raise KeyError(name + str(source))
+                    continue
+                if operation == 'square':
+                    value = pow(data[0],2)
+                else: # copy, product
+                    value = data[0]
+                    for factor in data[1:]:
+                        value = value*factor
+                indices.append(target_index)
+                values.append(value)
+            block.add_entries(indices, values)
+        return block_dictionary
@@ -0,0 +1,210 @@
+#! /usr/bin/env python
+# WatchScan.py
+#
+# Watch mode for Tools2Param: converts NMSSMTools output as it lands, so the
+# spectrum generation, the conversion and MadGraph can run side by side
+# instead of one after the other.
+#
+# Requires: BatchScan.py, Tools2Param.py, SLHAblock.py.
+#
+# Example use: python WatchScan.py scan/ cards/ -j 4
+#              python WatchScan.py scan/ cards/ --once
+#
+# The input directory is polled every --interval seconds. A spectrN.dat is
+# converted once its decayN.dat exists too and neither file has changed
+# size or modification time for --settle seconds (NMSSMTools writes them in
+# pieces). Compressed pairs (spectrN.dat.gz with decayN.dat.gz etc.) are
+# picked up too. The card is written to param_cardN.dat in the output directory,
+# via a temporary file, so whatever picks up cards there never sees a half
+# written one.
+#
+# Finished points are kept in a checkpoint (watch_checkpoint.json in the
+# output directory, or --checkpoint) together with the size and time of
+# their inputs: after a restart only new or changed points are converted.
+# Failed points are recorded too and only retried when their inputs change.
+#
+# Stops on Ctrl-C, with --once after converting what is there, or after
+# --idle-exit seconds without anything new. --once looks only once, so there
+# a pair is settled if neither file was modified in the last --settle
+# seconds; pairs still being written are left out, and listed.
+
+# -------------------------------------------------------------------------- #
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from functools import partial
+from BatchScan import convert_point, print_summary
+from CompressedIO import strip_extension
+
+def signature(filename): # changes whenever the file is written to
+    info = os.stat(filename)
+    return [info.st_size, info.st_mtime]
+
+def scan_directory(indir, outdir): # jobs for every spectrN/decayN pair
+    # returns dict label -> (job, signature of both files)
+    pairs = dict()
+    for base in sorted(os.listdir(indir)):
+        plain = strip_extension(base) # without .gz etc.
+        if not (plain.startswith('spectr') and plain.endswith('.dat')):
+            continue
+        label = plain[len('spectr'):-len('.dat')]
+        spectname = os.path.join(indir, base)
+        decayname = os.path.join(indir, 'decay' + base[len('spectr'):])
+        try:
+            files = signature(spectname) + signature(decayname)
+        except OSError: # decay file not there yet
+            continue
+        writename = os.path.join(outdir, 'param_card' + label + '.dat')
+        pairs[label] = ((label, spectname, decayname, writename), files)
+    return pairs
+
+# -------------------------------------------------------------------------- #
+
+class Checkpoint:
+    """Finished and failed points of a watched directory, kept on disk.
+
+    Attributes: filename, done, failed
+    Methods: finished, record, save
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = dict() # label -> signature of the inputs
+        self.failed = dict() # label -> (signature, error message)
+        if os.path.exists(filename):
+            info = json.load(open(filename,'r'))
+            self.done = info['done']
+            self.failed = dict([(label, tuple(item)) for label, item
+                in info['failed'].iteritems()])
+
+    def finished(self, label, files): # converted (or failed) as they are now
+        if self.done.get(label) == files:
+            return True
+        return (label in self.failed) and (self.failed[label][0] == files)
+
+    def record(self, label, files, result): # result of BatchScan.convert_point
+        if result[1]:
+            self.done[label] = files
+            self.failed.pop(label, None)
+        else:
+            self.failed[label] = (files, result[2])
+            self.done.pop(label, None)
+
+    def save(self): # written in one go, a crash keeps the old checkpoint
+        tmpname = self.filename + '.tmp'
+        checkfile = open(tmpname,'w')
+        json.dump({'done' : self.done, 'failed' : self.failed}, checkfile,
+            indent=1, sort_keys=True)
+        checkfile.close()
+        os.rename(tmpname, self.filename)
+
+# -------------------------------------------------------------------------- #
+
+def watch(indir, outdir, checkpoint, processes=None, interval=5.,
+        settle=2., once=False, idle_exit=None, options={}, verbose=True):
+    # convert points in indir as they are completed, returns failed results
+    worker = partial(convert_point, options=options)
+    seen = dict() # label -> (signature, time it was first seen like this)
+    failed = []
+    idle_since = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        while True:
+            now = time.time()
+            ready = []
+            unsettled = [] # --once: pairs changed within settle seconds
+            for label, (job, files) in scan_directory(indir, outdir).items():
+                if checkpoint.finished(label, files):
+                    continue
+                if (label not in seen) or (seen[label][0] != files):
+                    seen[label] = (files, now) # new or still being written
+                if once: # no earlier poll: go by the modification times
+                    if now - max(files[1], files[3]) >= settle:
+                        ready.append((job, files))
+                    else:
+                        unsettled.append(label)
+                elif now - seen[label][1] >= settle:
+                    ready.append((job, files))
+            if ready:
+                results = pool.map(worker, [job for job, files in ready])
+                for (job, files), result in zip(ready, results):
+                    checkpoint.record(job[0], files, result)
+                    seen.pop(job[0], None)
+                    if not result[1]:
+                        failed.append(result)
+                        if verbose:
+                            print "point " + result[0] + " FAILED: " \
+                                + result[2]
+                checkpoint.save()
+                if verbose:
+                    print str(len(ready)) + " new points, " \
+                        + str(len(checkpoint.done)) + " converted in total"
+                idle_since = time.time()
+            if once:
+                if unsettled and verbose:
+                    print "WARNING " + str(len(unsettled)) + " points still " \
+                        "being written, not converted: " \
+                        + ' '.join(sorted(unsettled))
+                break
+            if (idle_exit is not None) and \
+                    (time.time() - idle_since > idle_exit):
+                break
+            time.sleep(interval)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+    finally:
+        pool.join()
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert NMSSMTools output as it appears in a directory.')
+    parser.add_argument('indir', help='directory NMSSMTools writes to')
+    parser.add_argument('outdir', help='directory for the param cards')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--interval', type=float, default=5.,
+        help='seconds between polls of the directory')
+    parser.add_argument('--settle', type=float, default=2.,
+        help='seconds a pair has to stay unchanged before it is converted')
+    parser.add_argument('--checkpoint', default=None,
+        help='checkpoint file (default: OUTDIR/watch_checkpoint.json)')
+    parser.add_argument('--once', action='store_true',
+        help='convert what is there now and stop')
+    parser.add_argument('--idle-exit', type=float, default=None,
+        help='stop after this many seconds without new points')
+    parser.add_argument('--br-min', type=float, default=None,
+        help='drop decay channels with a smaller branching ratio')
+    parser.add_argument('--decays', default=None,
+        help='comma separated PDG ids: only write these DECAY tables')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    if args.checkpoint is None:
+        args.checkpoint = os.path.join(args.outdir, 'watch_checkpoint.json')
+    options = dict()
+    if args.br_min is not None:
+        options['br_min'] = args.br_min
+    if args.decays is not None:
+        options['decay_parents'] = set(
+            [int(item) for item in args.decays.split(',')])
+
+    checkpoint = Checkpoint(args.checkpoint)
+    failed = watch(args.indir, args.outdir, checkpoint, args.jobs,
+        args.interval, args.settle, args.once, args.idle_exit, options)
+    if args.once:
+        print_summary(checkpoint.done.keys() + checkpoint.failed.keys(),
+            [(label, False, item[1]) for label, item
+                in checkpoint.failed.iteritems()])
+    if failed or (args.once and checkpoint.failed):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
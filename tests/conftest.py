@@ -0,0 +1,28 @@
+# Regression tests of tools2param, run from the top of the repository with
+#   python -m pytest tests/
+# tests/data holds one synthetic point (SynthSLHA.py, seed 1): spectr1.dat,
+# decay1.dat, and param_card1.dat and tools2param1.log as written by the
+# original Tools2Param.py for it.
+
+import os
+import sys
+import pytest
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if top not in sys.path:
+    sys.path.insert(0, top)
+
+data = os.path.join(top, 'tests', 'data')
+
+def read(filename):
+    infile = open(filename, 'rb')
+    try:
+        return infile.read()
+    finally:
+        infile.close()
+
+@pytest.fixture
+def point():
+    # (spectrum, decays, card, log) file names of the fixture point
+    return tuple([os.path.join(data, name) for name in ('spectr1.dat',
+        'decay1.dat', 'param_card1.dat', 'tools2param1.log')])
@@ -0,0 +1,48 @@
+# BatchScan.py: manifests with repeated labels, and re-running failed points
+
+import os
+import gzip
+import shutil
+from conftest import read
+import BatchScan
+
+def test_repeated_labels(point, tmpdir):
+    manifest = tmpdir.join('manifest.txt')
+    lines = []
+    for directory in ('a', 'b', 'c'):
+        tmpdir.mkdir(directory)
+        for name, source in (('spectr1.dat', point[0]),
+                ('decay1.dat', point[1])):
+            shutil.copyfile(source, str(tmpdir.join(directory, name)))
+        lines.append(str(tmpdir.join(directory, 'spectr1.dat')) + ' '
+            + str(tmpdir.join(directory, 'decay1.dat')))
+    manifest.write('\n'.join(lines + [lines[0].replace('/a/', '/b/')])
+        + '\n')
+    jobs = BatchScan.jobs_from_manifest(str(manifest), 'cards')
+    assert [job[0] for job in jobs] == ['1', '1_2', '1_3', '1_4']
+    assert len(set([job[3] for job in jobs])) == len(jobs)
+    cards = str(tmpdir.join('cards'))
+    assert BatchScan.main(['-m', str(manifest), cards, '-j', '2',
+        '--columns', str(tmpdir.join('store'))]) == 0
+    assert sorted(os.listdir(cards)) == ['param_card1.dat',
+        'param_card1_2.dat', 'param_card1_3.dat', 'param_card1_4.dat']
+    assert sorted(tmpdir.join('store', 'points.txt').read().split()) == \
+        ['1', '1_2', '1_3', '1_4'] # in the order the points were done
+
+def test_failed_compressed(point, tmpdir):
+    scan = tmpdir.mkdir('scan')
+    for k in range(3):
+        shutil.copyfile(point[0], str(scan.join('spectr%d.dat' % k)))
+        shutil.copyfile(point[1], str(scan.join('decay%d.dat' % k)))
+    scan.join('spectr1.dat').write('BLOCK MASS\n   25   125.0\n')
+    cards = str(tmpdir.join('cards'))
+    failed = str(tmpdir.join('failed.txt'))
+    assert BatchScan.main([str(scan.join('spectr*.dat')), cards,
+        '--compress', 'gz', '--failed', failed]) == 1
+    assert open(failed).read().split()[2] == 'param_card1.dat'
+    shutil.copyfile(point[0], str(scan.join('spectr1.dat'))) # repaired
+    assert BatchScan.main(['-m', failed, cards, '--compress', 'gz']) == 0
+    assert sorted(os.listdir(cards)) == ['param_card0.dat.gz',
+        'param_card1.dat.gz', 'param_card2.dat.gz']
+    assert gzip.open(os.path.join(cards, 'param_card1.dat.gz')).read() \
+        == read(point[2])
@@ -0,0 +1,75 @@
+# CardTemplate.py: cards from templates are byte for byte write_card's
+
+import copy
+from cStringIO import StringIO
+from conftest import read
+from Tools2Param import read_spectrum, check_blocks, convert_blocks, \
+    write_card, write_blocks
+from CardTemplate import CardTemplate, CardWriter, render_blocks, \
+    constant_blocks
+
+def converted(point): # block dictionary of the fixture point, as written
+    block_dictionary = read_spectrum(open(point[0]))
+    check_blocks(block_dictionary, verbose=False)
+    convert_blocks(block_dictionary, verbose=False)
+    return block_dictionary
+
+def card_of(writer, block_dictionary, point):
+    out = StringIO()
+    writer(block_dictionary, open(point[1]), out)
+    return out.getvalue()
+
+# values SLHAblock.datastring writes other than '%19.8E' does
+odd_values = [float('nan'), float('inf'), -float('inf'), -0.0, 1.5e100,
+    -1.5e100, 9.99999999e99, 1e-120, -1e-120]
+
+def test_fixture_card(point):
+    block_dictionary = converted(point)
+    writer = CardWriter()
+    assert card_of(writer.write, block_dictionary, point) == read(point[2])
+    assert card_of(write_card, block_dictionary, point) == read(point[2])
+    assert (writer.rendered, writer.fallbacks) == (1, 0)
+
+def test_fallback_values(point):
+    writer = CardWriter()
+    for name in write_blocks:
+        if name in constant_blocks:
+            continue
+        for value in odd_values:
+            block_dictionary = converted(point)
+            block_dictionary[name].data[-1].value = value
+            assert CardTemplate(block_dictionary).render(
+                block_dictionary) is None, (name, value)
+            assert card_of(writer.write, block_dictionary, point) == \
+                card_of(write_card, block_dictionary, point), (name, value)
+    # values that are plain after all: zero, the edges of two digits
+    for value in (0.0, 1e-99, -1e-99, 9.99e99, -9.99e99, 1e99):
+        block_dictionary = converted(point)
+        block_dictionary['MASS'].data[0].value = value
+        text = CardTemplate(block_dictionary).render(block_dictionary)
+        assert text == render_blocks(block_dictionary), value
+
+def test_template_cache(point):
+    # more layouts than the cache holds, each written twice, out of order
+    writer = CardWriter()
+    dictionaries = []
+    for k in range(writer.max_templates + 4):
+        block_dictionary = converted(point)
+        block_dictionary['MASS'].data[0].comment = ' layout %d' % k
+        block_dictionary['MASS'].data[1].value = 100.0 + k
+        dictionaries.append(block_dictionary)
+    order = range(len(dictionaries)) + [0, 19, 3, 3, 18, 1] + \
+        range(len(dictionaries))
+    for k in order:
+        assert card_of(writer.write, dictionaries[k], point) == \
+            card_of(write_card, dictionaries[k], point), k
+        assert len(writer.templates) <= writer.max_templates
+        assert writer.templates[0].matches(dictionaries[k])
+    assert (writer.rendered, writer.fallbacks) == (len(order), 0)
+    # a template doesn't match a layout it wasn't made from
+    changed = copy.deepcopy(dictionaries[0])
+    assert writer.templates[-1].matches(dictionaries[4])
+    changed['NMNMIX'].data[0].comment = ' another comment'
+    assert not CardTemplate(dictionaries[0]).matches(changed)
+    assert card_of(writer.write, changed, point) == \
+        card_of(write_card, changed, point)
@@ -0,0 +1,57 @@
+# The command lines write what the original Tools2Param.py wrote
+
+import os
+import sys
+import gzip
+import shutil
+import subprocess
+from conftest import read, top
+
+def run(script, *args): # (exit status, stdout) of a script of the repository
+    process = subprocess.Popen([sys.executable, os.path.join(top, script)]
+        + list(args), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    return process.returncode, output
+
+def test_tools2param(point, tmpdir):
+    card = str(tmpdir.join('param_card.dat'))
+    status, output = run('Tools2Param.py', point[0], point[1], card)
+    assert status == 0
+    assert read(card) == read(point[2])
+    assert output == read(point[3])
+
+def test_tools2param_quiet_gz(point, tmpdir):
+    card = str(tmpdir.join('param_card.dat.gz'))
+    status, output = run('Tools2Param.py', '-q', point[0], point[1], card)
+    assert (status, output) == (0, '')
+    assert gzip.open(card).read() == read(point[2])
+
+def test_batch_scan(point, tmpdir):
+    scan = tmpdir.mkdir('scan')
+    for k in range(3):
+        shutil.copyfile(point[0], str(scan.join('spectr%d.dat' % k)))
+        shutil.copyfile(point[1], str(scan.join('decay%d.dat' % k)))
+    cards = str(tmpdir.join('cards'))
+    status, output = run('BatchScan.py', str(scan.join('spectr*.dat')),
+        cards, '-j', '2')
+    assert status == 0
+    assert sorted(os.listdir(cards)) == ['param_card0.dat', 'param_card1.dat',
+        'param_card2.dat']
+    for name in os.listdir(cards):
+        assert read(os.path.join(cards, name)) == read(point[2])
+
+def test_missing_block(point, tmpdir):
+    spectrum = str(tmpdir.join('spectr.dat'))
+    text = read(point[0])
+    start = text.index('BLOCK NMHMIX')
+    open(spectrum, 'wb').write(text[:start]
+        + text[text.index('BLOCK', start + 1):])
+    status, output = run('Tools2Param.py', spectrum, point[1],
+        str(tmpdir.join('param_card.dat')))
+    # as the original: the banner and memos, the block check, then it fails
+    # writing the card
+    assert status != 0
+    printed = output.split('Traceback')[0]
+    banner = read(point[3]).split('\n\n\n')[0]
+    assert printed == banner + '\n\n\nERROR: missing NMHMIX from input file\n'
+    assert output.rstrip().endswith("KeyError: 'NMHMIX'")
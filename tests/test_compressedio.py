@@ -0,0 +1,93 @@
+# CompressedIO.py: what open_output writes, open_input reads back, by content
+
+import gzip
+import bz2
+import pytest
+from conftest import read
+from CompressedIO import open_input, open_output, formats, lzma_module, \
+    zstd_module, buffer_size
+
+def available(compression): # False if the optional module is missing
+    try:
+        {'xz' : lzma_module, 'zst' : zstd_module}.get(compression,
+            lambda: None)()
+    except IOError:
+        return False
+    return True
+
+def text_of(point): # the fixture card, long enough for several buffers
+    text = read(point[2])
+    return text*(2*buffer_size//len(text) + 1)
+
+def written(filename, text, compression=None):
+    outfile = open_output(filename, compression)
+    outfile.write(text)
+    outfile.close()
+
+def read_back(filename):
+    infile = open_input(filename)
+    try:
+        return infile.readlines()
+    finally:
+        infile.close()
+
+@pytest.mark.parametrize('compression', sorted(formats))
+def test_round_trip(point, tmpdir, compression):
+    if not available(compression):
+        pytest.skip('no module for ' + compression)
+    text = text_of(point)
+    filename = str(tmpdir.join('card.dat' + formats[compression][0]))
+    written(filename, text)
+    assert read(filename).startswith(formats[compression][1])
+    assert len(read(filename)) < len(text)
+    assert read_back(filename) == text.splitlines(True)
+
+@pytest.mark.parametrize('compression', sorted(formats))
+def test_by_magic_number(point, tmpdir, compression):
+    # no extension, or the extension of another format: the bytes decide
+    if not available(compression):
+        pytest.skip('no module for ' + compression)
+    text = text_of(point)
+    other = [name for name in sorted(formats) if name != compression][0]
+    for name in ('card', 'card.dat', 'card.dat' + formats[other][0]):
+        filename = str(tmpdir.join(name))
+        written(filename, text, compression)
+        assert read(filename).startswith(formats[compression][1]), name
+        assert read_back(filename) == text.splitlines(True), name
+
+def test_unavailable_format(tmpdir):
+    for compression in ('xz', 'zst'):
+        if not available(compression):
+            with pytest.raises(IOError):
+                open_output(str(tmpdir.join('card.dat')), compression)
+    with pytest.raises(IOError):
+        open_output(str(tmpdir.join('card.dat')), 'rar')
+
+def test_plain_and_foreign(point, tmpdir):
+    # plain text under a compressed name; files of the standard modules
+    text = read(point[2])
+    plain = str(tmpdir.join('card.dat.gz'))
+    open(plain, 'wb').write(text)
+    assert read_back(plain) == text.splitlines(True)
+    written(str(tmpdir.join('card.dat')), text) # no extension: plain
+    assert read(str(tmpdir.join('card.dat'))) == text
+    gzfile = gzip.GzipFile(str(tmpdir.join('a.gz')), 'wb')
+    gzfile.write(text)
+    gzfile.close()
+    assert read_back(str(tmpdir.join('a.gz'))) == text.splitlines(True)
+    open(str(tmpdir.join('b.bz2')), 'wb').write(bz2.compress(text))
+    assert read_back(str(tmpdir.join('b.bz2'))) == text.splitlines(True)
+
+def test_concatenated_streams(point, tmpdir):
+    # cat a.gz b.gz reads as the two texts one after the other
+    text = read(point[2])
+    for compression in ('gz', 'bz2'):
+        parts = []
+        for k in range(2):
+            filename = str(tmpdir.join('part%d.%s' % (k, compression)))
+            written(filename, text + '# part %d\n' % k, compression)
+            parts.append(read(filename))
+        joined = str(tmpdir.join('joined'))
+        open(joined, 'wb').write(''.join(parts))
+        assert ''.join(read_back(joined)) == \
+            text + '# part 0\n' + text + '# part 1\n', compression
@@ -0,0 +1,60 @@
+# ConvertCache.py: a re-run scan is served from the cache, counted once
+
+import os
+import shutil
+from conftest import read
+from ConvertCache import ConversionCache
+from BatchScan import run_batch
+
+def make_jobs(point, tmpdir, n=3):
+    jobs = []
+    for k in range(n):
+        spectname = str(tmpdir.join('spectr%d.dat' % k))
+        decayname = str(tmpdir.join('decay%d.dat' % k))
+        shutil.copyfile(point[0], spectname)
+        shutil.copyfile(point[1], decayname)
+        open(decayname, 'ab').write('# copy %d\n' % k) # a different point
+        jobs.append((str(k), spectname, decayname,
+            str(tmpdir.join('param_card%d.dat' % k))))
+    return jobs
+
+def test_fetch_miss(point, tmpdir):
+    cache = ConversionCache(str(tmpdir.join('cache')))
+    writename = str(tmpdir.join('card.dat'))
+    assert not cache.fetch(cache.key(point[0], point[1]), writename)
+    assert os.listdir(str(tmpdir)) == ['cache']
+    assert (cache.hits, cache.misses) == (0, 0) # counted by the caller
+
+def test_fetch_hit(point, tmpdir):
+    cache = ConversionCache(str(tmpdir.join('cache')))
+    key = cache.key(point[0], point[1])
+    cache.store(key, point[2])
+    writename = str(tmpdir.join('card.dat'))
+    assert cache.fetch(key, writename)
+    assert read(writename) == read(point[2])
+    assert sorted(os.listdir(str(tmpdir))) == ['cache', 'card.dat']
+
+def test_run_batch(point, tmpdir):
+    jobs = make_jobs(point, tmpdir)
+    cache = ConversionCache(str(tmpdir.join('cache')))
+    assert run_batch(jobs, processes=2, verbose=False, cache=cache) == []
+    assert (cache.hits, cache.misses) == (0, len(jobs))
+    cards = []
+    for job in jobs:
+        cards.append(read(job[3]))
+        os.remove(job[3])
+    assert run_batch(jobs, processes=2, verbose=False, cache=cache) == []
+    assert (cache.hits, cache.misses) == (len(jobs), len(jobs))
+    assert [read(job[3]) for job in jobs] == cards
+    # other options, other cards
+    assert run_batch(jobs, processes=2, verbose=False, cache=cache,
+        strict=True) == []
+    assert (cache.hits, cache.misses) == (len(jobs), 2*len(jobs))
+
+def test_changed_input(point, tmpdir):
+    jobs = make_jobs(point, tmpdir)
+    cache = ConversionCache(str(tmpdir.join('cache')))
+    run_batch(jobs, processes=1, verbose=False, cache=cache)
+    open(jobs[0][2], 'ab').write('# one more comment\n')
+    run_batch(jobs, processes=1, verbose=False, cache=cache)
+    assert (cache.hits, cache.misses) == (len(jobs) - 1, len(jobs) + 1)
@@ -0,0 +1,28 @@
+# ConvertServer.py: requests answered as Tools2Param.py would
+
+from conftest import read
+from Tools2Param import Converter
+from ConvertServer import convert_request, decay_parents_of
+
+def test_decays_of(point):
+    expected = Converter(decay_parents=set([25, 1000022])).convert(
+        point[0], point[1]).tostring()
+    for decays_of in ([25, 1000022], '25,1000022', u'25, 1000022',
+            ['25', 1000022]):
+        response = convert_request({'id' : 1, 'spectrum' : point[0],
+            'decays' : point[1], 'decays_of' : decays_of})
+        assert response['ok'], response
+        assert response['card'] == expected
+    # defaults from the command line, overridden by the request
+    response = convert_request({'spectrum' : point[0], 'decays' : point[1],
+        'decays_of' : None}, {'decays_of' : [25]})
+    assert response['card'] == read(point[2])
+
+def test_bad_decays_of(point):
+    for decays_of in (25, [25.5], [True], 'h1', {'25' : 1}, ['2x5']):
+        response = convert_request({'id' : 7, 'spectrum' : point[0],
+            'decays' : point[1], 'decays_of' : decays_of})
+        assert response['id'] == 7 and not response['ok']
+        assert response['error'].startswith('ValueError')
+    assert decay_parents_of('25') == set([25])
+    assert decay_parents_of([-5, 5]) == set([-5, 5])
@@ -0,0 +1,45 @@
+# GetDecays.py --batch: which files of a directory, and re-running it
+
+import gzip
+import shutil
+from conftest import read
+import GetDecays
+from ScanColumns import read_labels, read_columns
+
+def make_scan(point, scan):
+    for name in ('decay1.dat', 'decay2.dat'):
+        shutil.copyfile(point[1], str(scan.join(name)))
+    gzip.open(str(scan.join('decay10.dat.gz')), 'wb').write(read(point[1]))
+    for name in ('decay_old.dat', 'decays.dat', 'decay3.dat.tmp',
+            'decay4.dat.idx', 'decay5.txt', 'spectr1.dat', 'decay.dat'):
+        scan.join(name).write('garbage\n') # decoys
+
+def test_directory_mode(point, tmpdir):
+    scan = tmpdir.mkdir('scan')
+    make_scan(point, scan)
+    names = [name.split('/')[-1] for name in GetDecays.decay_files(str(scan))]
+    assert names == ['decay1.dat', 'decay10.dat.gz', 'decay2.dat']
+
+def test_rerun(point, tmpdir):
+    scan = tmpdir.mkdir('scan')
+    make_scan(point, scan)
+    store = str(tmpdir.join('store'))
+    assert GetDecays.main(['--batch', str(scan), store, '-j', '2']) == 0
+    assert sorted(read_labels(store)) == ['1', '10', '2']
+    widths = read_columns(store, ['WIDTH[25]'])['WIDTH[25]'].tolist()
+    assert GetDecays.main(['--batch', str(scan), store, '-j', '2']) == 0
+    assert sorted(read_labels(store)) == ['1', '10', '2']
+    shutil.copyfile(point[1], str(scan.join('decay3.dat')))
+    assert GetDecays.main(['--batch', str(scan), store]) == 0
+    assert sorted(read_labels(store)) == ['1', '10', '2', '3']
+    assert read_columns(store, ['WIDTH[25]'])['WIDTH[25]'].tolist() \
+        == widths + widths[0:1]
+
+def test_same_label_twice(point, tmpdir):
+    decaynames = [str(tmpdir.join(name)) for name in ('decay1.dat',
+        'decay1.dat.bz2')]
+    shutil.copyfile(point[1], decaynames[0])
+    failed, skipped = GetDecays.extract_batch(decaynames,
+        str(tmpdir.join('store')), 1)
+    assert (failed, skipped) == ([], decaynames[1:])
+    assert read_labels(str(tmpdir.join('store'))) == ['1']
@@ -0,0 +1,40 @@
+# Pipeline.py: failed points don't hold up the pipeline, cards as BatchScan's
+
+import os
+import shutil
+from conftest import read
+from Pipeline import Pipeline, transform_point, transform_chunk
+
+def make_jobs(point, tmpdir, n=6):
+    jobs = []
+    for k in range(n):
+        spectname = str(tmpdir.join('spectr%d.dat' % k))
+        decayname = str(tmpdir.join('decay%d.dat' % k))
+        shutil.copyfile(point[0], spectname)
+        shutil.copyfile(point[1], decayname)
+        jobs.append((str(k), spectname, decayname,
+            str(tmpdir.join('param_card%d.dat' % k))))
+    return jobs
+
+def test_malformed_item(point):
+    job = ('1', point[0], point[1], 'param_card1.dat')
+    result, text, busy = transform_point((job, 'BLOCK MASS\n'))
+    assert (result[0], result[1], text) == ('1', False, None)
+    answers = transform_chunk([(job,), (job, read(point[0]), read(point[1]))])
+    assert [answer[0][1] for answer in answers] == [False, True]
+
+def test_failures(point, tmpdir):
+    jobs = make_jobs(point, tmpdir)
+    open(jobs[1][1], 'w').write('BLOCK MASS\n   25   x\n') # can't be read
+    os.remove(jobs[2][2]) # no decay file
+    open(jobs[3][1], 'w').write('BLOCK MASS\n   25   125.0\n') # no blocks
+    pipeline = Pipeline(readers=2, writers=2, processes=2, queue_size=2,
+        chunksize=2)
+    failed = pipeline.run(jobs)
+    assert sorted([result[0] for result in failed]) == ['1', '2', '3']
+    for job in jobs:
+        if job[0] in ('0', '4', '5'):
+            assert read(job[3]) == read(point[2])
+        else:
+            assert not os.path.exists(job[3])
+    assert len(pipeline.results) == len(jobs)
@@ -0,0 +1,67 @@
+# ScanColumns.py: a store reopened and extended reads as if written at once
+
+import sys
+import json
+import math
+from array import array
+import ScanColumns
+from ScanColumns import ColumnWriter, read_columns, read_labels
+
+points = [('p0', [('MASS[25]', 125.0), ('MASS[35]', 300.0)]),
+    ('p1', [('MASS[25]', 124.5)]),
+    ('p2', [('MASS[35]', 310.0), ('NMHMIX[1,3]', -0.25)]),
+    ('p3', [('MASS[25]', 126.0), ('NMHMIX[1,3]', 0.5), ('MASS[35]', 1.0)]),
+    ('p4', [])]
+
+def expected(): # column name -> list of values, None for NaN
+    names = []
+    for label, columns in points:
+        names.extend([name for name, value in columns if name not in names])
+    table = dict([(name, []) for name in names])
+    for label, columns in points:
+        values = dict(columns)
+        for name in names:
+            table[name].append(values.get(name))
+    return table
+
+def check(directory):
+    assert read_labels(directory) == [label for label, columns in points]
+    columns = read_columns(directory)
+    table = expected()
+    assert sorted(columns.keys()) == sorted(table.keys())
+    for name in table:
+        values = [(value, None)[math.isnan(value)] for value in columns[name]]
+        assert values == table[name]
+
+def write(directory, start, stop, chunk_points):
+    writer = ColumnWriter(directory, chunk_points)
+    for label, columns in points[start:stop]:
+        writer.add_columns(label, columns)
+    writer.close()
+
+def test_at_once(tmpdir):
+    write(str(tmpdir), 0, len(points), 2)
+    check(str(tmpdir))
+
+def test_reopen_extend(tmpdir):
+    for start in range(len(points)):
+        write(str(tmpdir), start, start + 1, 1000)
+    check(str(tmpdir))
+    info = json.load(open(str(tmpdir.join('columns.json'))))
+    assert info['npoints'] == len(points)
+
+def test_other_byte_order(tmpdir):
+    # a store written on a machine of the other byte order, extended here
+    write(str(tmpdir), 0, 2, 1000)
+    manifest = str(tmpdir.join('columns.json'))
+    info = json.load(open(manifest))
+    for name in info['columns']:
+        filename = str(tmpdir.join(ScanColumns.column_file(name)))
+        values = array('d', open(filename, 'rb').read())
+        values.byteswap()
+        open(filename, 'wb').write(values.tostring())
+    info['byteorder'] = {'little' : 'big', 'big' : 'little'}[sys.byteorder]
+    json.dump(info, open(manifest, 'w'))
+    write(str(tmpdir), 2, len(points), 1)
+    assert json.load(open(manifest))['byteorder'] == info['byteorder']
+    check(str(tmpdir))
@@ -0,0 +1,57 @@
+# ScanDelta.py: cards come back byte for byte from a delta store
+
+import os
+from conftest import read
+import ScanDelta
+
+def variants(card): # cards that differ from card in the ways a scan does
+    lines = card.split('\n')
+    changed = []
+    for line in lines: # a sign in place of the leading space
+        if line.startswith('   25 '):
+            line = line.replace(' 1.', '-1.', 1)
+        changed.append(line)
+    odd = ['# before any block', 'BLOCK', 'DECAY 25', 'DECAY', 'BLOCK X Q=',
+        '   1   a|b   # a "|" in a value', 'garbage \r inside\f a line',
+        '    ', '']
+    return ['\n'.join(changed),
+        card.replace('E+02', 'E+03'),
+        '\n'.join(lines[:40] + odd + lines[40:]),
+        '\n'.join(odd + lines),
+        card.rstrip('\n'), # no newline at the end
+        '\n'.join(reversed(lines)),
+        '\n'.join(odd)]
+
+def test_round_trip(point, tmpdir):
+    card = read(point[2])
+    store = ScanDelta.DeltaStore(str(tmpdir.join('store')))
+    cards = [card] + variants(card)
+    for k in range(len(cards)):
+        store.add(str(k), cards[k])
+    store.close()
+    reopened = ScanDelta.DeltaStore(str(tmpdir.join('store')))
+    for k in range(len(cards)):
+        assert reopened.card(str(k)) == cards[k]
+    assert os.path.getsize(str(tmpdir.join('store', 'deltas.dat'))) \
+        < sum([len(text) for text in cards[1:]])
+
+def test_odd_base_card(point):
+    # the base itself may have the lines line_key can't make sense of
+    for text in variants(read(point[2])):
+        base = ScanDelta.BaseCard(text)
+        assert base.decode(base.encode(text)) == text
+        assert base.decode(base.encode(read(point[2]))) == read(point[2])
+
+def test_pack_unpack(point, tmpdir):
+    cards = tmpdir.mkdir('cards')
+    texts = [read(point[2])] + variants(read(point[2]))
+    for k in range(len(texts)):
+        cards.join('param_card%d.dat' % k).write(texts[k], 'wb')
+    store = str(tmpdir.join('store'))
+    assert ScanDelta.main(['pack', str(cards.join('param_card*.dat')),
+        store, '--verify']) == 0
+    out = str(tmpdir.join('out'))
+    assert ScanDelta.main(['unpack', store, out]) == 0
+    for k in range(len(texts)):
+        assert read(os.path.join(out, 'param_card%d.dat' % k)) == texts[k]
+    assert ScanDelta.main(['unpack', store, out, '999']) == 1
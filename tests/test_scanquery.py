@@ -0,0 +1,113 @@
+# ScanQuery.py: indexed queries give what a filter over all points gives
+
+import random
+import operator
+from ScanColumns import ColumnWriter
+from ScanQuery import ScanIndex, parse_conditions
+
+nan = float('nan')
+ops = {'<' : operator.lt, '<=' : operator.le, '>' : operator.gt,
+    '>=' : operator.ge, '==' : operator.eq}
+
+def make_points(n, seed, first=0): # values with ties, negatives and NaN
+    generator = random.Random(seed)
+    points = []
+    for k in range(first, first + n):
+        columns = [('MASS[25]', 120 + 0.5*generator.randint(0, 20)),
+            ('NMNMIX[1,5]', generator.choice([-1, 1])*generator.random())]
+        if generator.random() < 0.8: # NaN for the other points
+            columns.append(('MASS[35]', generator.uniform(100, 1000)))
+        points.append((str(k), columns))
+    return points
+
+def write(directory, points):
+    writer = ColumnWriter(directory, chunk_points=7)
+    for label, columns in points:
+        writer.add_columns(label, columns)
+    writer.close()
+
+def brute_force(points, terms): # terms: list of (column, square, op, value)
+    labels = []
+    for label, columns in points:
+        values = dict(columns)
+        keep = True
+        for name, square, op, value in terms:
+            x = values.get(name, nan)
+            if square:
+                x = x**2
+            keep = keep and ops[op](x, value)
+        if keep:
+            labels.append(label)
+    return labels
+
+queries = [[('MASS[25]', False, '>=', 124.0), ('MASS[25]', False, '<=', 126.0)],
+    [('MASS[25]', False, '==', 125.0)],
+    [('MASS[25]', False, '<', 125.0), ('MASS[35]', False, '>', 500.0)],
+    [('NMNMIX[1,5]', True, '>', 0.25)],
+    [('NMNMIX[1,5]', True, '<=', 0.04), ('MASS[25]', False, '>', 121.0)],
+    [('NMNMIX[1,5]', False, '<', -0.5), ('NMNMIX[1,5]', True, '>=', 0.5)],
+    [('MASS[35]', False, '>', 2000.0)],
+    [('MASS[35]', False, '>=', -1.0)],
+    [('NMNMIX[1,5]', True, '<', -1.0)]]
+
+def text(terms):
+    return ' and '.join([name + ('^2' if square else '') + ' ' + op + ' '
+        + repr(value) for name, square, op, value in terms])
+
+def check(directory, points):
+    index = ScanIndex(directory)
+    for terms in queries:
+        found = index.labels(index.query(parse_conditions(text(terms))))
+        assert found == brute_force(points, terms), text(terms)
+
+def test_against_brute_force(tmpdir):
+    points = make_points(500, 1)
+    write(str(tmpdir), points)
+    check(str(tmpdir), points)
+
+def test_grown_store(tmpdir):
+    # indexes built on part of the store, merged when the store grows
+    points = make_points(300, 2)
+    write(str(tmpdir), points)
+    check(str(tmpdir), points)
+    more = make_points(200, 3, first=300)
+    write(str(tmpdir), more)
+    check(str(tmpdir), points + more)
+
+def test_range_forms(tmpdir):
+    points = make_points(200, 4)
+    write(str(tmpdir), points)
+    index = ScanIndex(str(tmpdir))
+    terms = [('MASS[25]', False, '>=', 124.0), ('MASS[25]', False, '<', 126.0)]
+    for form in ('124 <= MASS[25] < 126', '126 > MASS[25] >= 124',
+            'MASS[25] >= 124 and MASS[25] < 126'):
+        found = index.labels(index.query(parse_conditions(form)))
+        assert found == brute_force(points, terms), form
+
+def test_deduplicated_cards(tmpdir):
+    points = make_points(6, 5)
+    write(str(tmpdir.join('store')), points)
+    carddir = tmpdir.mkdir('cards')
+    carddir.join('dedup_map.txt').write('# card  representative  fingerprint\n'
+        'param_card0.dat param_card0.dat f0\n'
+        'param_card3.dat param_card0.dat f0\n'
+        'param_card1.dat param_card1.dat f1\n'
+        'param_card2.dat param_card2.dat f2\n'
+        'param_card4.dat param_card2.dat f2\n')
+    index = ScanIndex(str(tmpdir.join('store')))
+    cards = index.cards(range(6), str(carddir))
+    assert [name.split('/')[-1] for name in cards] == ['param_card0.dat',
+        'param_card1.dat', 'param_card2.dat', 'param_card0.dat',
+        'param_card2.dat', 'param_card5.dat'] # 5: not converted, no entry
+
+def test_compressed_cards(tmpdir):
+    points = make_points(3, 6)
+    write(str(tmpdir.join('store')), points)
+    carddir = tmpdir.mkdir('cards')
+    carddir.join('param_card0.dat.gz').write('')
+    carddir.join('param_card1.dat').write('')
+    carddir.join('param_card2.dat.bz2').write('')
+    index = ScanIndex(str(tmpdir.join('store')))
+    cards = index.cards(range(3), str(carddir))
+    assert [name.split('/')[-1] for name in cards] == ['param_card0.dat.gz',
+        'param_card1.dat', 'param_card2.dat.bz2']
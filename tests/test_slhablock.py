@@ -0,0 +1,38 @@
+# SLHAblock.py: repeated indices, as the old list storage handled them
+
+from cStringIO import StringIO
+from SLHAblock import SLHAblock
+
+def block_of(lines):
+    block = SLHAblock('BLOCK MASS\n')
+    for line in lines:
+        block.add_line(line)
+    return block
+
+def written(block):
+    out = StringIO()
+    block.write(out)
+    return out.getvalue()
+
+def test_repeated_index():
+    block = block_of(['   25   1.25E+02   # h1\n', '   35   3.0E+02   # h2\n',
+        '   25   1.26E+02   # h1 again\n'])
+    assert block.get(25) == 125.0 # the first line
+    block.add_data(25, 130.0, 'new')
+    assert [datum.value for datum in block.data] == [130.0, 300.0, 130.0]
+    assert [datum.comment for datum in block.data] == [' new', ' h2', ' new']
+    block.add_entries([(25,), (45,)], [131.0, 500.0])
+    assert [datum.value for datum in block.data] == [131.0, 300.0, 131.0,
+        500.0]
+    assert written(block).count('1.31000000E+02') == 2
+
+def test_matrix():
+    block = SLHAblock('BLOCK NMHMIX\n')
+    for i in range(1, 4):
+        for j in range(1, 4):
+            block.add_data(i, j, 0.1*i - 0.01*j)
+    block.add_data(2, 3, -1.0)
+    assert len(block.data) == 9
+    assert block.get(2, 3) == -1.0
+    assert block.exists(3, 3) and not block.exists(3, 4)
+    assert block.repeats is None
@@ -0,0 +1,57 @@
+# SLHAdecay.py: written decay tables keep the lines, order and comments read
+
+from cStringIO import StringIO
+from conftest import read
+from SLHAdecay import DecayTable, replace_fields
+
+interleaved = '''# decay file
+BLOCK DCINFO  # program
+     1   NMSSMTools
+DECAY   1000022   0.00000000E+00   # neutralino1
+DECAY        25   4.07E-03   # H1
+#          BR         NDA      ID1       ID2
+     6.00E-01    2           5        -5   # BR(H1 -> b bbar)
+# a comment inside the table
+     1.00E-03    2     1000022   1000022   # BR(H1 -> chi1 chi1)
+     3.99E-01    2          15       -15
+BLOCK SOMETHING   # between the tables
+     1     2.0
+DECAY   1000002   1.0   # ~u_L
+     1.00E+00    2     1000022         2   # BR(~u_L -> chi1 u)
+
+DECAY   35   2.0'''
+
+def written(decays, *args):
+    out = StringIO()
+    decays.write(out, *args)
+    return out.getvalue()
+
+def test_as_read(point):
+    assert written(DecayTable(interleaved.splitlines(True))) == interleaved
+    text = read(point[1])
+    assert written(DecayTable(text.splitlines(True))) == text
+
+def test_pruned_only_drops_lines():
+    lines = interleaved.splitlines(True)
+    pruned = written(DecayTable(lines), 0.01).splitlines(True)
+    assert pruned == [line for line in lines if 'chi1 chi1' not in line]
+    kept = written(DecayTable(lines), None, set([25])).splitlines(True)
+    assert kept == lines[0:3] + lines[4:12] # BLOCK SOMETHING stays put
+
+def test_relabel_in_place():
+    decays = DecayTable(interleaved.splitlines(True))
+    decays.relabel({1000002 : 2000002, 1000022 : 1000023})
+    lines = written(decays).splitlines(True)
+    assert lines[3] == 'DECAY   1000023   0.00000000E+00   # neutralino1\n'
+    assert lines[8] == '     1.00E-03    2     1000023   1000023   ' \
+        '# BR(H1 -> chi1 chi1)\n'
+    assert lines[12] == 'DECAY   2000002   1.0   # ~u_L\n'
+    assert lines[13] == '     1.00E+00    2     1000023         2   ' \
+        '# BR(~u_L -> chi1 u)\n'
+    assert len(lines) == len(interleaved.splitlines())
+    assert decays.channels(2000002) == [(1.0, (1000023, 2))]
+
+def test_replace_fields():
+    assert replace_fields('  1   22  # c\n', {1 : '-22'}) == '  1  -22  # c\n'
+    assert replace_fields('1 22\n', {1 : '1000022'}) == '1 1000022\n'
+    assert replace_fields('DECAY 5 1.0\n', {1 : '-5'}) == 'DECAY -5 1.0\n'
@@ -0,0 +1,98 @@
+# Tools2Param.py --strict: sfermions ordered by mass, the rest as without it
+
+import shutil
+from conftest import read
+from Tools2Param import Converter, sfermion_states, order_sfermions
+from SLHAdecay import DecayTable
+from BatchScan import run_batch
+
+def cards(point):
+    plain = Converter().convert(point[0], point[1])
+    strict = Converter(strict=True).convert(point[0], point[1])
+    return plain, strict
+
+def mass(card, pdg):
+    return card.block_dictionary['MASS'].get(pdg)
+
+def test_plain_is_baseline(point):
+    plain, strict = cards(point)
+    assert plain.tostring() == read(point[2])
+    assert not plain.relabel
+    assert strict.relabel # this point's sfermions are out of order
+
+def test_ordered(point):
+    plain, strict = cards(point)
+    for name, states in sfermion_states:
+        masses = [mass(strict, pdg) for pdg in states]
+        assert masses == sorted(masses)
+        assert sorted(masses) == sorted([mass(plain, pdg) for pdg in states])
+        for pdg in states: # mixing row of pdg moves with its mass
+            new = strict.relabel.get(pdg, pdg)
+            assert mass(strict, new) == mass(plain, pdg)
+            row, new_row = states.index(pdg) + 1, states.index(new) + 1
+            for column in range(1, len(states) + 1):
+                assert strict.block_dictionary[name].get(new_row, column) \
+                    == plain.block_dictionary[name].get(row, column)
+
+def test_only_sfermions_change(point):
+    plain, strict = cards(point)
+    sfermions = set()
+    for name, states in sfermion_states:
+        sfermions.update([name] + states)
+    for name in plain.block_dictionary:
+        if name in sfermions or name == 'MASS':
+            continue
+        assert [(datum.index, datum.value) for datum in
+            plain.block_dictionary[name].data] == [(datum.index, datum.value)
+            for datum in strict.block_dictionary[name].data]
+    for datum in plain.block_dictionary['MASS'].data:
+        if datum.index[0] not in sfermions:
+            assert mass(strict, datum.index[0]) == datum.value
+    # every MASS line keeps the comment of its PDG id, sfermions too
+    assert [(datum.index, datum.comment) for datum in
+        plain.block_dictionary['MASS'].data] == [(datum.index, datum.comment)
+        for datum in strict.block_dictionary['MASS'].data]
+
+def test_decays_relabelled(point):
+    plain, strict = cards(point)
+    before = DecayTable(plain.decay_lines)
+    after = DecayTable(strict.tostring().split('DECAY TABLE')[1]
+        .splitlines(True)[2:])
+    relabel = strict.relabel
+    assert [relabel.get(pdg, pdg) for pdg in before.pdg] == list(after.pdg)
+    for pdg in before.pdg:
+        assert after.get_width(relabel.get(pdg, pdg)) == before.get_width(pdg)
+        assert after.channels(relabel.get(pdg, pdg)) == [(br, tuple(
+            [(1 if d > 0 else -1)*relabel.get(abs(d), abs(d)) for d in ds]))
+            for br, ds in before.channels(pdg)]
+    # the same decay lines, in the same order, with the same comments
+    plain_lines = plain.tostring().split('DECAY TABLE')[1].splitlines()
+    strict_lines = strict.tostring().split('DECAY TABLE')[1].splitlines()
+    assert len(plain_lines) == len(strict_lines)
+    for a, b in zip(plain_lines[1:], strict_lines[1:]):
+        assert a.partition('#')[2] == b.partition('#')[2]
+
+def test_already_ordered(point):
+    plain, strict = cards(point)
+    assert order_sfermions(strict.block_dictionary) == {}
+
+def test_batch_scan(point, tmpdir):
+    # BatchScan --strict, point by point and vectorized, writes the same
+    jobs = []
+    for k in range(4):
+        spectname = str(tmpdir.join('spectr%d.dat' % k))
+        decayname = str(tmpdir.join('decay%d.dat' % k))
+        shutil.copyfile(point[0], spectname)
+        shutil.copyfile(point[1], decayname)
+        jobs.append((str(k), spectname, decayname,
+            str(tmpdir.join('param_card%d.dat' % k))))
+    expected = cards(point)[1].tostring()
+    assert run_batch(jobs, processes=2, verbose=False, strict=True) == []
+    assert [read(job[3]) for job in jobs] == [expected]*len(jobs)
+    try:
+        import numpy
+    except ImportError:
+        return
+    assert run_batch(jobs, processes=2, verbose=False, strict=True,
+        vectorized=True) == []
+    assert [read(job[3]) for job in jobs] == [expected]*len(jobs)
@@ -0,0 +1,33 @@
+# WatchScan.py: --once converts only the pairs that have settled
+
+import os
+import time
+import shutil
+from conftest import read
+from WatchScan import watch, Checkpoint
+
+def test_once_settle(point, tmpdir, capsys):
+    indir = tmpdir.mkdir('scan')
+    outdir = tmpdir.mkdir('cards')
+    old = time.time() - 60
+    for k in range(3):
+        shutil.copyfile(point[0], str(indir.join('spectr%d.dat' % k)))
+        shutil.copyfile(point[1], str(indir.join('decay%d.dat' % k)))
+        if k != 1: # 1 is still being written
+            os.utime(str(indir.join('spectr%d.dat' % k)), (old, old))
+            os.utime(str(indir.join('decay%d.dat' % k)), (old, old))
+    checkpoint = Checkpoint(str(outdir.join('watch_checkpoint.json')))
+    assert watch(str(indir), str(outdir), checkpoint, processes=1,
+        settle=10., once=True) == []
+    assert sorted(os.listdir(str(outdir))) == ['param_card0.dat',
+        'param_card2.dat', 'watch_checkpoint.json']
+    assert read(str(outdir.join('param_card0.dat'))) == read(point[2])
+    assert 'WARNING 1 points still being written, not converted: 1' \
+        in capsys.readouterr()[0]
+    # once it has settled, the next --once picks it up
+    os.utime(str(indir.join('spectr1.dat')), (old, old))
+    os.utime(str(indir.join('decay1.dat')), (old, old))
+    assert watch(str(indir), str(outdir), checkpoint, processes=1,
+        settle=10., once=True) == []
+    assert sorted(checkpoint.done.keys()) == ['0', '1', '2']
+    assert 'WARNING' not in capsys.readouterr()[0]